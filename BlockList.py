@@ -0,0 +1,159 @@
+class BlockList:
+    """
+        A list stored as a sequence of small blocks, with a Fenwick tree over the block lengths.
+
+        Finding the block of a position takes O(log n), and inserting or removing inside a block moves at
+        most a block worth of items, so append, insert and pop anywhere cost O(log n + BLOCK_SIZE)
+        instead of shifting the whole list.
+    """
+    BLOCK_SIZE = 256
+
+    def __init__(self, items=()):
+        items = list(items)
+        self.__blocks = [items[i:i + self.BLOCK_SIZE] for i in range(0, len(items), self.BLOCK_SIZE)]
+        self.__size = len(items)
+        self.__rebuildTree()
+
+    def __rebuildTree(self):
+        """Builds the Fenwick tree of block lengths in O(number of blocks)."""
+        tree = [0] + [len(block) for block in self.__blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.__tree = tree
+
+    def __addToTree(self, blockIndex: int, delta: int):
+        i = blockIndex + 1
+        while i < len(self.__tree):
+            self.__tree[i] += delta
+            i += i & -i
+
+    def __prefix(self, count: int) -> int:
+        """returns the number of items in the first count blocks"""
+        total = 0
+        while count > 0:
+            total += self.__tree[count]
+            count -= count & -count
+        return total
+
+    def __appendBlock(self, block: list):
+        """Adds a block at the end, extending the Fenwick tree in O(log n)."""
+        self.__blocks.append(block)
+        i = len(self.__blocks)
+        self.__tree.append(len(block) + self.__prefix(i - 1) - self.__prefix(i - (i & -i)))
+
+    def __locate(self, index: int):
+        """
+            returns (block index, offset inside the block) of a valid non negative position,
+            walking down the Fenwick tree
+        """
+        position = 0
+        remaining = index
+        step = 1 << (len(self.__tree).bit_length())
+        while step:
+            candidate = position + step
+            if candidate < len(self.__tree) and self.__tree[candidate] <= remaining:
+                position = candidate
+                remaining -= self.__tree[candidate]
+            step >>= 1
+        return position, remaining
+
+    def __normalizeIndex(self, index: int) -> int:
+        if index < 0:
+            index += self.__size
+        if not 0 <= index < self.__size:
+            raise IndexError("BlockList index out of range")
+        return index
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        for block in self.__blocks:
+            yield from block
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.__size)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return list(self.iterFrom(start, stop - start))
+        blockIndex, offset = self.__locate(self.__normalizeIndex(index))
+        return self.__blocks[blockIndex][offset]
+
+    def __setitem__(self, index: int, item):
+        blockIndex, offset = self.__locate(self.__normalizeIndex(index))
+        self.__blocks[blockIndex][offset] = item
+
+    def iterFrom(self, start: int, count: int):
+        """Yields up to count items starting at position start."""
+        if count <= 0 or start >= self.__size:
+            return
+        blockIndex, offset = self.__locate(max(0, start))
+        while count > 0 and blockIndex < len(self.__blocks):
+            items = self.__blocks[blockIndex][offset:offset + count]
+            yield from items
+            count -= len(items)
+            blockIndex += 1
+            offset = 0
+
+    def append(self, item):
+        if self.__blocks and len(self.__blocks[-1]) < self.BLOCK_SIZE:
+            self.__blocks[-1].append(item)
+            self.__addToTree(len(self.__blocks) - 1, 1)
+        else:
+            self.__appendBlock([item])
+        self.__size += 1
+
+    def extend(self, items):
+        """Appends the items, filling the last block and then adding whole blocks."""
+        items = list(items)
+        start = 0
+        if self.__blocks and len(self.__blocks[-1]) < self.BLOCK_SIZE:
+            start = self.BLOCK_SIZE - len(self.__blocks[-1])
+            self.__blocks[-1].extend(items[:start])
+            self.__addToTree(len(self.__blocks) - 1, len(items[:start]))
+        for i in range(start, len(items), self.BLOCK_SIZE):
+            self.__appendBlock(items[i:i + self.BLOCK_SIZE])
+        self.__size += len(items)
+
+    def insert(self, index: int, item):
+        """Inserts item before position index, like list.insert."""
+        if index < 0:
+            index = max(0, index + self.__size)
+        if index >= self.__size:
+            self.append(item)
+            return
+
+        blockIndex, offset = self.__locate(index)
+        block = self.__blocks[blockIndex]
+        block.insert(offset, item)
+        self.__size += 1
+        if len(block) > 2 * self.BLOCK_SIZE:
+            # split oversized blocks so that inserting into one stays cheap
+            self.__blocks[blockIndex:blockIndex + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self.__rebuildTree()
+        else:
+            self.__addToTree(blockIndex, 1)
+
+    def pop(self, index: int = -1):
+        """Removes and returns the item at position index, like list.pop."""
+        blockIndex, offset = self.__locate(self.__normalizeIndex(index))
+        block = self.__blocks[blockIndex]
+        item = block.pop(offset)
+        self.__size -= 1
+        if not block:
+            del self.__blocks[blockIndex]
+            self.__rebuildTree()
+        else:
+            self.__addToTree(blockIndex, -1)
+        return item
+
+    def clear(self):
+        self.__blocks = []
+        self.__size = 0
+        self.__tree = [0]
+
+    def copy(self) -> 'BlockList':
+        return BlockList(self)
@@ -0,0 +1,155 @@
+import Stats
+import json
+import os
+
+class Journal:
+    """
+        Append-only log of JSON records, one compact record per line.
+        Appending never rewrites existing data, so the cost of a write does not depend on the size of the log.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.__file = None
+        self.__count = None
+
+    def append(self, record: dict):
+        """
+            Appends one record to the end of the journal and flushes it to disk.
+        """
+        if self.__file is None:
+            self.__open()
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self.__file.write(line)
+        self.__file.flush()
+        Stats.add_bytes_written(len(line))
+        if self.__count is not None:
+            self.__count += 1
+
+    def extend(self, records):
+        """
+            Appends several records with a single write.
+        """
+        lines = [json.dumps(record, separators=(",", ":")) + "\n" for record in records]
+        if not lines:
+            return
+        if self.__file is None:
+            self.__open()
+        text = "".join(lines)
+        self.__file.write(text)
+        self.__file.flush()
+        Stats.add_bytes_written(len(text))
+        if self.__count is not None:
+            self.__count += len(lines)
+
+    def __open(self):
+        """
+            Opens the journal for appending. A last line left half written by a crash is cut off first,
+            otherwise the next record would be glued to it and skipped together with it by replay.
+        """
+        Journal.trimTornLine(self.filename)
+        self.__file = open(self.filename, "a", encoding="utf-8")
+
+    @staticmethod
+    def trimTornLine(filename, chunk_size=1 << 16):
+        """Truncates a file after its last newline, if it does not end with one."""
+        try:
+            f = open(filename, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            position = end
+            while position > 0:
+                start = max(0, position - chunk_size)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    return
+                position = start
+            f.truncate(0)
+
+    def replay(self, offset=0):
+        """
+            Yields every record stored in the journal in the order it was written, starting at
+            a byte offset that is the start of a line (e.g. an earlier size of the journal).
+            A half written last line (e.g. after a crash) is ignored.
+        """
+        count = 0
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    Stats.add_bytes_read(len(line))
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    count += 1
+                    yield record
+        except FileNotFoundError:
+            pass
+        if offset == 0:
+            self.__count = count
+
+    def getSize(self) -> int:
+        """
+            returns the number of records in the journal
+        """
+        if self.__count is None:
+            for _ in self.replay():
+                pass
+        return self.__count
+
+    def rotate(self, filename):
+        """
+            Moves the current journal to the given filename (appending if it already exists) and starts a new empty one.
+            Used while compacting so that new records are not lost while the snapshot is written.
+        """
+        self.close()
+        if os.path.exists(self.filename):
+            if os.path.exists(filename):
+                # an earlier rotation was never finished, keep its records in front of ours
+                Journal.trimTornLine(filename)
+                with open(filename, "a", encoding="utf-8") as target, open(self.filename, "r", encoding="utf-8") as source:
+                    target.write(source.read())
+                os.remove(self.filename)
+            else:
+                os.replace(self.filename, filename)
+        self.__count = 0
+
+    def clear(self):
+        """
+            Empties the journal, e.g. once its records are part of a new snapshot.
+        """
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.__count = 0
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+def writeAtomically(filename, text):
+    """
+        Writes text (str, bytes for binary files, or an iterable of str chunks) to a temporary file next to filename
+        and renames it over filename. Readers see either the old or the new content, never a partially written file.
+    """
+    tmp = filename + ".tmp"
+    chunks = (text,) if isinstance(text, (str, bytes)) else text
+    with open(tmp, "wb") if isinstance(text, bytes) else open(tmp, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            Stats.add_bytes_written(len(chunk))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
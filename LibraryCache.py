@@ -0,0 +1,137 @@
+from Tracks import Tracks
+from array import array
+import itertools
+import operator
+import pickle
+import sys
+import io
+
+# bump when the layout below changes, older cache files are then ignored and rewritten
+VERSION = 1
+SEPARATOR = "\x00"
+
+def packStrings(strings: list[str]):
+    """
+        returns the strings joined into one text, which pickles and unpickles much faster than a list of
+        small strings, or the list itself if a string contains the separator
+    """
+    text = SEPARATOR.join(strings)
+    if text.count(SEPARATOR) == max(0, len(strings) - 1):
+        return text
+    return list(strings)
+
+def unpackStrings(packed, count: int) -> list[str]:
+    if isinstance(packed, list):
+        return packed
+    return packed.split(SEPARATOR) if count else []
+
+def packTable(values) -> tuple:
+    """
+        returns (distinct values, their codes as bytes) for a column with few distinct values, e.g. artists
+    """
+    codes = {}
+    column = array("I", [codes.setdefault(value, len(codes)) for value in values])
+    return list(codes), column.tobytes()
+
+def unpackTable(packed) -> tuple:
+    """returns (distinct values interned, list of codes)"""
+    table, codes = packed
+    column = array("I")
+    column.frombytes(codes)
+    return [sys.intern(value) for value in table], column.tolist()
+
+def packTracks(tracks: list[Tracks]) -> dict:
+    """
+        Turns the sorted library into columns of plain values: titles as one text, artists, albums
+        and durations as tables of distinct values with a code per track, additional artists sparsely.
+    """
+    return {
+        "count": len(tracks),
+        "titles": packStrings([track.getTitle() for track in tracks]),
+        "titleKeys": packStrings([track.getSortKey()[0] for track in tracks]),
+        "artists": packTable(track.getPrimaryArtist() for track in tracks),
+        "albums": packTable(track.getAlbumName() for track in tracks),
+        "durations": packTable(track.getDuration() for track in tracks),
+        "additional": {
+            position: tuple(track.getAdditionalArtists())
+            for position, track in enumerate(tracks) if track.getAdditionalArtists()
+        },
+    }
+
+def groupByKey(keys: list[str], codes: list[int], tracks: list[Tracks]) -> dict:
+    """
+        returns normalized key -> list of tracks, for the key of every code of a table column.
+        Distinct values with the same normalized key share one list.
+    """
+    index = {}
+    groups = [index.setdefault(key, []) for key in keys]
+    for code, track in zip(codes, tracks):
+        groups[code].append(track)
+    return index
+
+def unpackLibrary(data: dict) -> tuple:
+    """
+        Rebuilds the tracks of packTracks in the same (sorted) order together with the title, artist
+        and album indexes of MusicLibrary. Normalizing and parsing happen once per distinct artist,
+        album and duration instead of once per track, and the indexes are grouped by code instead of
+        by hashing every key.
+
+        Returns:
+            tuple: (tracks, title index, artist index, album index), each index maps a normalized key to a list of tracks
+    """
+    count = data["count"]
+    titles = unpackStrings(data["titles"], count)
+    titleKeys = unpackStrings(data["titleKeys"], count)
+
+    artistTable, artistCodes = unpackTable(data["artists"])
+    albumTable, albumCodes = unpackTable(data["albums"])
+    durationTable, durationCodes = unpackTable(data["durations"])
+    artistKeyTable = [sys.intern(Tracks.normalize(artist)) for artist in artistTable]
+    albumKeyTable = [sys.intern(Tracks.normalize(album)) for album in albumTable]
+    secondsTable = [Tracks.storedDurationSeconds(duration) for duration in durationTable]
+
+    artists = list(map(artistTable.__getitem__, artistCodes))
+    albums = list(map(albumTable.__getitem__, albumCodes))
+    durations = list(map(durationTable.__getitem__, durationCodes))
+    seconds = list(map(secondsTable.__getitem__, durationCodes))
+    sortKeys = list(zip(titleKeys, map(artistKeyTable.__getitem__, artistCodes),
+                        map(albumKeyTable.__getitem__, albumCodes), seconds))
+
+    additional = [()] * count
+    for position, featured in data["additional"].items():
+        featured = tuple(sys.intern(artist) for artist in featured)
+        additional[position] = featured
+        # the artists part of the sort key covers every artist of the track
+        key = sortKeys[position]
+        artistsKey = sys.intern(Tracks.normalize(", ".join((artists[position],) + featured)))
+        sortKeys[position] = (key[0], artistsKey, key[2], key[3])
+
+    tracks = list(map(Tracks.fromCache, titles, artists, albums, durations, additional, seconds, sortKeys))
+
+    # the tracks are sorted by title key first, so equal titles are next to each other and a run
+    # of them shares the list of its first track, which is the one left in the dict
+    groups = [[track] for track in tracks]
+    for position in itertools.compress(range(1, count), map(operator.eq, titleKeys[1:], titleKeys)):
+        groups[position - 1].append(tracks[position])
+        groups[position] = groups[position - 1]
+    titleIndex = dict(zip(titleKeys, groups))
+    albumIndex = groupByKey(albumKeyTable, albumCodes, tracks)
+    artistIndex = groupByKey(artistKeyTable, artistCodes, tracks)
+    # features are indexed under every additional artist too, as MusicLibrary does
+    for position, featured in data["additional"].items():
+        primary = artistKeyTable[artistCodes[position]]
+        for artist in {Tracks.normalize(artist) for artist in featured} - {primary}:
+            artistIndex.setdefault(sys.intern(artist), []).append(tracks[position])
+
+    return tracks, titleIndex, artistIndex, albumIndex
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Only rebuilds plain values (str, bytes, numbers, lists, tuples, dicts), never imports or calls anything."""
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a library cache")
+
+def dumps(data) -> bytes:
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+def loads(blob: bytes):
+    return _PlainUnpickler(io.BytesIO(blob)).load()
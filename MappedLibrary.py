@@ -0,0 +1,782 @@
+"""
+    Music library backend for very large catalogs that keeps its tracks in a memory-mapped file
+    instead of holding every track as a Python object.
+
+    The track file (MusicLibrary.tracks) holds the tracks sorted like MusicLibrary, one JSON record each,
+    followed by sorted key sections for titles, artists, albums and ids. Every part has an offset table,
+    so row i is found without reading the rows before it and lookups are binary searches directly over
+    the mapped bytes. Tracks objects are only decoded for the rows that are returned, memory is bounded by
+    the page cache instead of by the size of the library, and the pages are shared by every process that
+    has the file open.
+
+    The storage stays where the library is kept, the track file is a view of it: inserts are written through
+    to the storage like MusicLibrary does and kept in a small in-memory list until they are folded into a new
+    track file, on a background thread, once there are COMPACT_THRESHOLD of them or the storage needs its journal
+    folded. The track file is stamped with the state of the storage it was written from (Storage.get_library_stamp).
+    On opening, the tracks stored after the stamp, e.g. inserted with the default backend, join the in-memory list,
+    and a track file the storage no longer matches is built again in the background, sorting the stored tracks in
+    runs of RUN_SIZE. Select it in the CLI with MUSIC_LIBRARY=mapped.
+"""
+from Tracks import Tracks
+from Storage import Storage, default_storage
+from SearchIndex import TrigramIndex, FullTextIndex
+from MusicLibrary import PendingInserts, readTrackRecords, resolveTrackReferences, requiresLibrary
+from collections.abc import Sequence
+import Stats
+import threading
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b"MUSICTRK"
+VERSION = 1
+SECTIONS = ("records", "titles", "artists", "albums", "ids")
+
+# magic, version, (offset table position, number of entries) of every section, then position and length of the stamp
+HEADER = struct.Struct("<8sI4x" + "QQ" * len(SECTIONS) + "QQ")
+OFFSET = struct.Struct("<Q")
+ROW = struct.Struct("<I")
+
+def artistKeys(track: Tracks) -> set[str]:
+    """returns the normalized primary and additional artists a track is found under"""
+    return {Tracks.normalize(artist) for artist in [track.getPrimaryArtist(), *track.getAdditionalArtists()]}
+
+class KeySection(Sequence):
+    """
+        Sorted (key, row) entries of a track file, each stored as the row number followed by the UTF-8 key.
+        Indexing returns the key bytes straight from the map, so bisect searches it without decoding anything.
+    """
+    def __init__(self, data, table: int, count: int):
+        self.__data = data
+        self.__table = table
+        self.__count = count
+
+    def __len__(self):
+        return self.__count
+
+    def __bounds(self, index: int):
+        start = OFFSET.unpack_from(self.__data, self.__table + 8 * index)[0]
+        return start, OFFSET.unpack_from(self.__data, self.__table + 8 * index + 8)[0]
+
+    def __getitem__(self, index: int) -> bytes:
+        if not 0 <= index < self.__count:
+            raise IndexError(index)
+        start, end = self.__bounds(index)
+        return self.__data[start + ROW.size:end]
+
+    def getRow(self, index: int) -> int:
+        return ROW.unpack_from(self.__data, self.__bounds(index)[0])[0]
+
+    def find(self, key: str) -> list[int]:
+        """returns the rows stored under exactly this normalized key"""
+        target = key.encode("utf-8")
+        start = bisect.bisect_left(self, target)
+        end = bisect.bisect_right(self, target, start)
+        return [self.getRow(index) for index in range(start, end)]
+
+    def prefix(self, prefix: str):
+        """yields (key, row) of the entries whose key starts with prefix, in key order"""
+        target = prefix.encode("utf-8")
+        index = bisect.bisect_left(self, target)
+        while index < self.__count:
+            key = self[index]
+            if not key.startswith(target):
+                break
+            yield key.decode("utf-8"), self.getRow(index)
+            index += 1
+
+class TrackFile:
+    """
+        Read-only view of a track file. The file is mapped, not read, so opening it takes the same time
+        whatever its size.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self.__map, 0)
+        if fields[0] != MAGIC or fields[1] != VERSION:
+            self.__map.close()
+            raise ValueError(f"{filename} is not a version {VERSION} track file")
+        self.__sections = {name: fields[2 + 2 * i:4 + 2 * i] for i, name in enumerate(SECTIONS)}
+        self.__stamp = fields[-2:]
+
+    def getCount(self) -> int:
+        return self.__sections["records"][1]
+
+    def getStamp(self):
+        """returns the stamp of the storage the file was written from (see Storage.get_library_stamp)"""
+        start, length = self.__stamp
+        return json.loads(self.__map[start:start + length])
+
+    def getSection(self, name) -> KeySection:
+        return KeySection(self.__map, *self.__sections[name])
+
+    def getRecord(self, row: int) -> dict:
+        """returns the track dict stored in a row"""
+        start = OFFSET.unpack_from(self.__map, self.__sections["records"][0] + 8 * row)[0]
+        end = OFFSET.unpack_from(self.__map, self.__sections["records"][0] + 8 * row + 8)[0]
+        return json.loads(self.__map[start:end])
+
+    def close(self):
+        self.__map.close()
+
+    @staticmethod
+    def write(filename, tracks, stamp=None):
+        """
+            Writes a track file of tracks, an iterable sorted by Tracks.getSortKey. The rows are written
+            one at a time; only the keys of the sorted sections are held in memory until the end.
+        """
+        sections = {name: [] for name in SECTIONS[1:]}
+        tables = []
+        with open(filename, "wb") as f:
+            f.write(bytes(HEADER.size))
+
+            offsets = []
+            count = 0
+            for row, track in enumerate(tracks):
+                offsets.append(f.tell())
+                f.write(json.dumps(track.newTrack, separators=(",", ":")).encode("utf-8"))
+                titleKey, _, albumKey, _ = track.getSortKey()
+                sections["titles"].append((titleKey, row))
+                sections["artists"].extend((artist, row) for artist in artistKeys(track))
+                sections["albums"].append((albumKey, row))
+                sections["ids"].append((track.getId(), row))
+                count += 1
+            offsets.append(f.tell())
+            tables.append((TrackFile.__writeTable(f, offsets), count))
+
+            for name in SECTIONS[1:]:
+                entries = sections.pop(name)
+                entries.sort()
+                offsets = []
+                for key, row in entries:
+                    offsets.append(f.tell())
+                    f.write(ROW.pack(row) + key.encode("utf-8"))
+                offsets.append(f.tell())
+                tables.append((TrackFile.__writeTable(f, offsets), len(entries)))
+
+            stampData = json.dumps(stamp).encode("utf-8")
+            tables.append((f.tell(), len(stampData)))
+            f.write(stampData)
+
+            Stats.add_bytes_written(f.tell())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, *(value for table in tables for value in table)))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def __writeTable(f, offsets) -> int:
+        """writes an offset table and returns its position"""
+        position = f.tell()
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        return position
+
+class SortKeys(Sequence):
+    """Sort keys of the rows of a track file for bisect, each decoded only when bisect asks for it."""
+    def __init__(self, sortKeyAt, count: int):
+        self.__sortKeyAt = sortKeyAt
+        self.__count = count
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, row):
+        return self.__sortKeyAt(row)
+
+class MappedTracks(Sequence):
+    """
+        The library in sort order: the rows of the track file merged with the tracks inserted since it was
+        written. Tracks are decoded when they are accessed.
+    """
+    def __init__(self, library: 'MappedLibrary'):
+        self.__library = library
+
+    def __len__(self):
+        return self.__library.getSize()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.__library._trackAt(index)
+
+    def __iter__(self):
+        return self.__library._iterTracks()
+
+class _Cancelled(Exception):
+    """Stops writing a track file when the library is closed."""
+
+def _runKey(item):
+    """sorts the (storage order, track) pairs of a build by sort key, the first stored first"""
+    return item[1].getSortKey(), item[0]
+
+@Stats.instrumented
+class MappedLibrary:
+    # number of inserts kept in memory before they are written into a new track file
+    COMPACT_THRESHOLD = 10000
+    # number of tracks sorted in memory at a time while a track file is built, more are sorted in runs on disk
+    RUN_SIZE = 50000
+
+    def __init__(self, filename="MusicLibrary.tracks", storage: Storage = None):
+        """
+            Args:
+                filename (str): the track file, built from the library in the storage if it does not exist
+                    or the storage no longer matches it. Building runs in the background, methods that need
+                    the tracks block until it has finished.
+                storage (Storage): where the library, the playlists and the queue are stored. Defaults to the
+                    shared default storage.
+        """
+        self.filename = filename
+        self.__storage = storage if storage is not None else default_storage()
+        self.__file = None
+        self.__stamp = None  # the storage stamp the track file was written at
+
+        # tracks inserted since the track file was written, sorted, with the number of rows before each of them
+        self.__added = []
+        self.__addedKeys = []
+        self.__addedRows = []  # the index of added track i in the merged library is __addedRows[i] + i
+        self.__addedIndex = {}   # (section, normalized title, artist, album or id) -> added tracks
+        self.__trigramIndex = None
+        self.__textIndex = None
+
+        # a new track file is written on __thread, the first call after it is done maps it in.
+        # The lock is held while the added tracks and the storage change together.
+        self.__lock = threading.RLock()
+        self.__loaded = threading.Event()
+        self.__loadError = None
+        self.__loadedCount = 0
+        self.__pending = PendingInserts(self.__storage)  # tracks inserted during a build
+        self.__thread = None
+        self.__written = None  # (stamp, ids of the inserted tracks it contains) of a finished track file
+        self.__writeError = None
+        self.__closing = False
+
+        try:
+            self.__file = TrackFile(filename)
+            tail = self.__storage.load_tracks_since(self.__file.getStamp())
+        except (FileNotFoundError, ValueError, struct.error):
+            tail = None
+        if tail is not None:
+            self.__stamp = self.__file.getStamp()
+            self.__addStored(tail)
+            self.__loaded.set()
+            self.__compactIfNeeded()
+        else:
+            self.__rebuild()
+
+    def __rebuild(self):
+        """Starts building a new track file in the background, until it is mapped the library is not loaded."""
+        self.__loaded.clear()
+        self.__loadedCount = 0
+        self.__startThread(self.__build)
+
+    def __startThread(self, target, *args):
+        """Runs a build or a compaction on __thread, its bytes count in Stats for the calls that started it."""
+        operations = Stats.current_operations()
+
+        def run():
+            with Stats.credited_to(operations):
+                target(*args)
+        self.__thread = threading.Thread(target=run, daemon=True)
+        self.__thread.start()
+
+    def __addStored(self, records):
+        for track_data in records:
+            track = Tracks.fromStored(track_data)
+            if not self.__containsTrack(track):
+                self.__addTrack(track)
+
+    def __untilClosed(self, tracks):
+        for track in tracks:
+            if self.__closing:
+                raise _Cancelled()
+            yield track
+
+    @staticmethod
+    def __merged(file: TrackFile, added: list):
+        """returns the rows of a track file merged with a sorted list of tracks, in sort order"""
+        rows = (Tracks.fromStored(file.getRecord(row)) for row in range(file.getCount()))
+        return heapq.merge(rows, added, key=Tracks.getSortKey)
+
+    def __sortedStored(self, records, runs: list):
+        """
+            Yields the stored tracks in sort order, the first stored of tracks with the same identity.
+            Records are sorted RUN_SIZE at a time and every full run is written to a temporary file (its name
+            is added to runs), then the runs are merged, so only one run of Tracks is in memory at a time.
+        """
+        run = []
+        sources = []
+        for order, track_data in enumerate(records):
+            run.append((order, Tracks.fromStored(track_data)))
+            self.__loadedCount += 1
+            if len(run) >= self.RUN_SIZE:
+                sources.append(self.__writeRun(run, runs))
+                run = []
+        run.sort(key=_runKey)
+        sources.append(run)
+
+        # tracks with the same identity have the same title, so they are next to each other in a group of titles
+        for _, group in itertools.groupby(heapq.merge(*sources, key=_runKey), key=lambda item: item[1].getSortKey()[0]):
+            group = list(group)
+            first = {}
+            for order, track in group:
+                identity = track.getIdentityKey()
+                first[identity] = min(order, first.get(identity, order))
+            for order, track in group:
+                if first[track.getIdentityKey()] == order:
+                    yield track
+
+    def __writeRun(self, run: list, runs: list):
+        """Writes a sorted run to a temporary file and returns an iterator reading it back."""
+        run.sort(key=_runKey)
+        name = f"{self.filename}.run{len(runs)}.tmp"
+        runs.append(name)
+        with open(name, "w", encoding="utf-8") as f:
+            for order, track in run:
+                f.write(json.dumps([order, track.newTrack], separators=(",", ":")) + "\n")
+        return self.__readRun(name)
+
+    @staticmethod
+    def __readRun(name):
+        with open(name, "r", encoding="utf-8") as f:
+            for line in f:
+                order, track_data = json.loads(line)
+                yield order, Tracks.fromStored(track_data)
+
+    def __build(self):
+        """Writes a track file from the library in the storage and maps it, on the background thread."""
+        runs = []
+        try:
+            # taken first, tracks stored while reading are in the file and after the stamp, and skipped once
+            stamp = self.__storage.get_library_stamp()
+            tracks = self.__sortedStored(self.__storage.load_tracks(), runs)
+            TrackFile.write(self.filename + ".tmp", self.__untilClosed(tracks), stamp)
+            with self.__lock:
+                self.__written = (stamp, None)
+                self.__mapWritten()
+                self.__pending.addTo(self.__containsTrack, self.__addTrack)
+                # set under the lock, an insert either is in the storage before the replay or sees the library
+                self.__loaded.set()
+        except _Cancelled:
+            os.remove(self.filename + ".tmp")
+        except Exception as e:
+            self.__loadError = e
+        finally:
+            for name in runs:
+                if os.path.exists(name):
+                    os.remove(name)
+            self.__loaded.set()
+
+    def __compact(self):
+        """
+            Writes the track file of a compaction, on the background thread. When the storage needs it, its
+            journal is folded into a new snapshot of the same tracks first (see Storage.compact_tracks).
+        """
+        try:
+            tracks = self.__untilClosed
+            if self.__storage.needs_compaction():
+                # once the storage is rewritten the old track file no longer matches it, closing does not stop
+                # the new one then, it is written from the file much faster than a build after reopening
+                tracks = iter
+                with self.__lock:
+                    file, added = self.__file, list(self.__added)
+                    # every stored track is a row or an added track, the snapshot is written on the storage's
+                    # thread and reads the rows of this file, which stays mapped until the new one is done
+                    self.__storage.compact_tracks(
+                        lambda: (track.newTrack for track in self.__merged(file, added)), background=True
+                    )
+                # waits for the compaction outside the lock, so that inserts go on meanwhile
+                self.__storage.get_library_stamp()
+            with self.__lock:
+                # the storage holds exactly the rows and the added tracks at this stamp
+                stamp = self.__storage.get_library_stamp()
+                file, added = self.__file, list(self.__added)
+            TrackFile.write(self.filename + ".tmp", tracks(self.__merged(file, added)), stamp)
+            self.__written = (stamp, {track.getId() for track in added})
+        except _Cancelled:
+            os.remove(self.filename + ".tmp")
+        except Exception as e:
+            self.__writeError = e
+
+    def __compactIfNeeded(self):
+        if len(self.__added) >= self.COMPACT_THRESHOLD or self.__storage.needs_compaction():
+            self.compactLibrary(background=True)
+
+    def __mapWritten(self):
+        """
+            Maps the track file written by __build or __compact in place of the old one. The inserted tracks it
+            does not contain stay in memory: after a build they are read from the storage after its stamp,
+            after a compaction they are the ones inserted while it was written.
+        """
+        stamp, ids = self.__written
+        self.__written = None
+        remaining = [track for track in self.__added if track.getId() not in ids] if ids is not None else []
+        # the old file stays mapped until the new one is complete, some systems cannot replace a mapped file
+        if self.__file is not None:
+            self.__file.close()
+        os.replace(self.filename + ".tmp", self.filename)
+        self.__file = TrackFile(self.filename)
+        self.__stamp = stamp
+
+        self.__added, self.__addedKeys, self.__addedRows, self.__addedIndex = [], [], [], {}
+        self.__trigramIndex = None
+        self.__textIndex = None
+        if ids is None:
+            self.__addStored(self.__storage.load_tracks_since(stamp) or ())
+        for track in remaining:
+            self.__addTrack(track)
+
+    # the same loading interface as MusicLibrary, opening a mapped file that matches the storage is immediate
+    def isLoaded(self) -> bool:
+        return self.__loaded.is_set()
+
+    def waitUntilLoaded(self, timeout=None) -> bool:
+        """
+            Blocks until the track file has been built, and maps in the file of a finished background compaction.
+            Re-raises an error raised while building or compacting.
+
+            Returns:
+                bool: False if the timeout expired before the track file was built.
+        """
+        if not self.__loaded.wait(timeout):
+            return False
+        if self.__loadError is not None:
+            raise RuntimeError("Building the track file failed") from self.__loadError
+        if self.__written is not None or self.__writeError is not None:
+            with self.__lock:
+                if self.__written is not None:
+                    self.__mapWritten()
+                error, self.__writeError = self.__writeError, None
+            if error is not None:
+                raise RuntimeError("Compacting the track file failed") from error
+        return True
+
+    def getLoadedCount(self) -> int:
+        """
+            returns the number of tracks in the library, or while the track file is built the number read so far
+        """
+        return self.getSize() if self.isLoaded() else self.__loadedCount
+
+    def getStorage(self) -> Storage:
+        return self.__storage
+
+    def __decode(self, row: int) -> Tracks:
+        return Tracks.fromStored(self.__file.getRecord(row))
+
+    def __rows(self, section, key) -> list[Tracks]:
+        return [self.__decode(row) for row in self.__file.getSection(section).find(key)]
+
+    def _trackAt(self, index: int) -> Tracks:
+        """returns the track at an index of the merged library"""
+        rows = self.__addedRows
+        place = bisect.bisect_left(SortKeys(lambda place: rows[place] + place, len(rows)), index)
+        if place < len(rows) and rows[place] + place == index:
+            return self.__added[place]
+        return self.__decode(index - place)
+
+    def _iterTracks(self):
+        return self.__merged(self.__file, list(self.__added))
+
+    @requiresLibrary
+    def getMusicLibrary(self) -> MappedTracks:
+        return MappedTracks(self)
+
+    @requiresLibrary
+    def isEmpty(self) -> bool:
+        return self.getSize() == 0
+
+    @requiresLibrary
+    def getSize(self):
+        return self.__file.getCount() + len(self.__added)
+
+    @requiresLibrary
+    def getFirst(self):
+        return self.getMusicLibrary()[0] if not self.isEmpty() else None
+
+    @requiresLibrary
+    def getLast(self):
+        return self.getMusicLibrary()[-1] if not self.isEmpty() else None
+
+    @requiresLibrary
+    def containsTrack(self, track: Tracks) -> bool:
+        """
+            Checks whether a track with the same title, primary artist and album is already in the library.
+        """
+        return self.__containsTrack(track)
+
+    def __containsTrack(self, track: Tracks) -> bool:
+        identity = track.getIdentityKey()
+        return any(existing.getIdentityKey() == identity for existing in self.__find("titles", identity[0]))
+
+    def __addTrack(self, track: Tracks):
+        key = track.getSortKey()
+        place = bisect.bisect_right(self.__addedKeys, key)
+        # rows of the file with a key <= the new one come before it, found with O(log n) decoded rows.
+        # The count does not change when other tracks are added, so nothing after the new track is updated
+        rows = SortKeys(lambda row: self.__decode(row).getSortKey(), self.__file.getCount())
+
+        self.__added.insert(place, track)
+        self.__addedKeys.insert(place, key)
+        self.__addedRows.insert(place, bisect.bisect_right(rows, key))
+
+        titleKey, _, albumKey, _ = key
+        for indexKey in (("titles", titleKey), ("albums", albumKey), ("ids", track.getId()),
+                         *(("artists", artist) for artist in artistKeys(track))):
+            self.__addedIndex.setdefault(indexKey, []).append(track)
+        if self.__trigramIndex is not None:
+            self.__trigramIndex.add(titleKey)
+        if self.__textIndex is not None:
+            self.__textIndex.add(track, (track.getTitle(), track.getArtist(), track.getAlbumName()))
+
+    def __find(self, section, key) -> list[Tracks]:
+        return self.__rows(section, key) + list(self.__addedIndex.get((section, key), ()))
+
+    @Stats.measured
+    def insertTrackToLibrary(self, track: Tracks):
+        """
+            Inserts a track into the library and stores it. While the track file is being built the track
+            joins the library when the build has finished. It is stored at once if the storage can tell that
+            it is not stored yet (Storage.has_track), otherwise after the build, unless it turns out to be a
+            duplicate of a stored track then.
+
+            Returns:
+                str: "Tracks Already Exist" if the track is known to be in the library already, otherwise None.
+        """
+        with self.__lock:
+            if not self.__loaded.is_set():
+                return self.__pending.insert(track)
+        self.waitUntilLoaded()
+        with self.__lock:
+            if self.__containsTrack(track):
+                return f"Tracks Already Exist"
+            self.__addTrack(track)
+            self.__storage.append_track(track.newTrack)
+        self.__compactIfNeeded()
+
+    @Stats.measured
+    @requiresLibrary
+    def bulk_insert(self, tracks) -> dict:
+        """
+            Inserts many tracks at once, the storage is written once at the end.
+
+            Returns:
+                dict: number of tracks "inserted", "duplicates" skipped and invalid tracks "rejected".
+        """
+        report = {"inserted": 0, "duplicates": 0, "rejected": 0}
+        batch = []
+        with self.__lock:
+            for item in tracks:
+                if not isinstance(item, Tracks):
+                    try:
+                        item = Tracks.fromData(item)
+                    except (KeyError, ValueError, TypeError, AttributeError):
+                        report["rejected"] += 1
+                        continue
+                if self.__containsTrack(item):
+                    report["duplicates"] += 1
+                    continue
+                self.__addTrack(item)
+                batch.append(item)
+            self.__storage.append_tracks([track.newTrack for track in batch])
+        self.__compactIfNeeded()
+        report["inserted"] = len(batch)
+        return report
+
+    @Stats.measured
+    def import_file(self, path) -> dict:
+        """
+            Imports tracks from a .json, .jsonl or .csv file (see MusicLibrary.readTrackRecords).
+
+            Returns:
+                dict: the bulk_insert report.
+        """
+        records, rejected = readTrackRecords(path)
+        report = self.bulk_insert(records)
+        report["rejected"] += rejected
+        return report
+
+    @Stats.measured
+    @requiresLibrary
+    def compactLibrary(self, background=False):
+        """
+            Writes a new track file with the inserted tracks merged into the rows, and folds the journal of the
+            storage into its snapshot when it needs it. With background the files are written on background
+            threads while the library stays usable, and the first call after they are done maps the new track
+            file in; tracks inserted in the meantime stay in memory until the next compaction.
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            if background:
+                return
+            self.__thread.join()
+            self.waitUntilLoaded()
+
+        # tracks stored by another writer since the track file was written join the compaction too
+        tail = self.__storage.load_tracks_since(self.__stamp) if self.__stamp is not None else ()
+        if tail is None:
+            # the stored library was rewritten, e.g. compacted by MusicLibrary, the track file is built again
+            self.__rebuild()
+            if not background:
+                self.waitUntilLoaded()
+            return
+        with self.__lock:
+            self.__addStored(tail)
+        self.__startThread(self.__compact)
+        if not background:
+            self.__thread.join()
+            self.waitUntilLoaded()
+
+    def close(self):
+        """
+            Stops a background build or compaction, closes the track file and the storage.
+            A compaction that has finished is mapped in first, one that has not is written again later unless
+            it has already compacted the storage, then it is finished.
+            A build with inserts waiting for it is finished, so that they are stored.
+        """
+        with self.__lock:
+            self.__closing = not self.__pending
+        if self.__thread is not None:
+            self.__thread.join()
+        with self.__lock:
+            if self.__written is not None:
+                self.__mapWritten()
+            if self.__file is not None:
+                self.__file.close()
+        self.__storage.close()
+
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithId(self, trackId):
+        """
+            Finding the track with the given stable id (see Tracks.getId).
+
+            Returns:
+                Tracks: the track, or None if no track in the library has that id.
+        """
+        tracks = self.__find("ids", trackId)
+        return tracks[0] if tracks else None
+
+    @Stats.measured
+    @requiresLibrary
+    def resolveTracks(self, trackIds=(), tracksData=()) -> list['Tracks']:
+        """
+            Turns stored references into library tracks, in order, see MusicLibrary.resolveTrackReferences.
+
+            Returns:
+                list[Tracks]: the resolved tracks, unknown ids and invalid track dicts are skipped.
+        """
+        return resolveTrackReferences(self, trackIds, tracksData)
+
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithTitle(self, trackTitle) -> list['Tracks']:
+        """
+            Finding all tracks with title that matches with the given track title.
+
+            Returns:
+                list[Tracks]: A list of tracks with the matching title.
+        """
+        return self.__find("titles", Tracks.normalize(trackTitle))
+
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithArtist(self, artistName) -> list['Tracks']:
+        """
+            Finding all tracks where the given artist is the primary or an additional artist.
+
+            Returns:
+                list[Tracks]: A list of tracks featuring the artist.
+        """
+        return self.__find("artists", Tracks.normalize(artistName))
+
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithAlbum(self, albumName) -> list['Tracks']:
+        """
+            Finding all tracks that belong to the given album.
+
+            Returns:
+                list[Tracks]: A list of tracks with the matching album name.
+        """
+        return self.__find("albums", Tracks.normalize(albumName))
+
+    @Stats.measured
+    @requiresLibrary
+    def search_prefix(self, text, limit=10, fields=("title", "artist", "album")) -> list['Tracks']:
+        """
+            Finding tracks whose title, artist or album starts with the given text, a range scan over
+            each sorted key section. Title matches come first, then artists, then albums.
+
+            Returns:
+                list[Tracks]: up to limit matching tracks.
+        """
+        prefix = Tracks.normalize(text)
+        if not prefix or limit <= 0:
+            return []
+
+        result = []
+        seen = set()
+        for field, section in (("title", "titles"), ("artist", "artists"), ("album", "albums")):
+            if field not in fields:
+                continue
+            added = sorted(((key, track) for (name, key), tracks in self.__addedIndex.items()
+                            if name == section and key.startswith(prefix) for track in tracks), key=lambda item: item[0])
+            # the scan stops as soon as limit tracks are found, rows are decoded one at a time
+            for _, match in heapq.merge(self.__file.getSection(section).prefix(prefix), added, key=lambda item: item[0]):
+                track = self.__decode(match) if isinstance(match, int) else match
+                if track.getIdentityKey() not in seen:
+                    seen.add(track.getIdentityKey())
+                    result.append(track)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+    @Stats.measured
+    @requiresLibrary
+    def search_fuzzy(self, text, limit=10) -> list['Tracks']:
+        """
+            Finding tracks whose title is similar to the given text. The trigram index is built from the
+            title section on the first call and holds the distinct titles, but not the tracks, in memory.
+
+            Returns:
+                list[Tracks]: tracks of up to limit different titles, most similar title first.
+        """
+        if self.__trigramIndex is None:
+            titles = self.__file.getSection("titles")
+            self.__trigramIndex = TrigramIndex(key.decode("utf-8") for key in titles)
+            for (name, key) in self.__addedIndex:
+                if name == "titles":
+                    self.__trigramIndex.add(key)
+
+        result = []
+        for title in self.__trigramIndex.search(Tracks.normalize(text), limit):
+            result.extend(self.__find("titles", title))
+        return result
+
+    @Stats.measured
+    @requiresLibrary
+    def search_text(self, query, page=1, per_page=10):
+        """
+            Ranked search for words anywhere in the title, artists and album (BM25). The index is built
+            on the first call and refers to rows by number, only the tracks of the page are decoded.
+
+            Returns:
+                tuple: (list of tracks on the requested page, total number of matching tracks)
+        """
+        if self.__textIndex is None:
+            self.__textIndex = FullTextIndex()
+            for row in range(self.__file.getCount()):
+                track = self.__decode(row)
+                self.__textIndex.add(row, (track.getTitle(), track.getArtist(), track.getAlbumName()))
+            for track in self.__added:
+                self.__textIndex.add(track, (track.getTitle(), track.getArtist(), track.getAlbumName()))
+        documents, total = self.__textIndex.search(query, page, per_page)
+        return [self.__decode(document) if isinstance(document, int) else document for document in documents], total
@@ -1,205 +1,645 @@
 from Tracks import Tracks
+from Storage import Storage, default_storage
+from SearchIndex import TrigramIndex, FullTextIndex
+import LibraryCache
+import Stats
+import functools
+import gc
+import threading
+import bisect
 import json
-
+import csv
+import os
+
+def requiresLibrary(method):
+    """
+        Makes a MusicLibrary method wait until a lazy load has finished before it runs.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.waitUntilLoaded()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+def readTrackRecords(path):
+    """
+        Reads the track dicts of a .json (list of tracks), .jsonl (one track per line) or .csv file
+        with the same field names as MusicLibrary.json. In CSV files additional artists are separated by ";".
+
+        Returns:
+            tuple: (list of track dicts, number of unreadable .jsonl lines)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".json", ".jsonl", ".csv"):
+        raise ValueError(f"Unsupported file type '{extension}', expected .json, .jsonl or .csv")
+
+    rejected = 0
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if extension == ".json":
+            records = json.load(f)
+        elif extension == ".csv":
+            records = []
+            for row in csv.DictReader(f):
+                additional = row.get("Additional Artists") or ""
+                row["Additional Artists"] = [a.strip() for a in additional.split(";") if a.strip()]
+                records.append(row)
+        else:
+            records = []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    rejected += 1
+
+    return records, rejected
+
+def resolveTrackReferences(library, trackIds=(), tracksData=()) -> list[Tracks]:
+    """
+        Turns stored references into tracks of a library (MusicLibrary or MappedLibrary), in order.
+        Full track dicts written by older versions are matched to the library by their id too; the ones
+        the library does not have are inserted into it, so that they still resolve once the playlist or
+        the queue is saved again with ids only.
+
+        Returns:
+            list[Tracks]: the resolved tracks, unknown ids and invalid track dicts are skipped.
+    """
+    tracksData = list(tracksData)
+    legacyIds = [Tracks.makeId(track_data["Title"], track_data["Artist"], track_data["Album"]) for track_data in tracksData]
+    missing = [track_data for track_data, trackId in zip(tracksData, legacyIds) if library.getTrackWithId(trackId) is None]
+    if missing:
+        library.bulk_insert(missing)
+
+    tracks = []
+    for trackId in list(trackIds) + legacyIds:
+        track = library.getTrackWithId(trackId)
+        if track is not None:
+            tracks.append(track)
+    return tracks
+
+class PendingInserts:
+    """
+        The tracks inserted into a library while it is loading, added to it when loading finishes.
+        A track is stored at once if the storage can tell that it is not stored yet (Storage.has_track),
+        otherwise it is stored when loading finishes, unless it turns out to be a duplicate of a stored track.
+        The library serializes the calls with its own lock.
+    """
+    def __init__(self, storage: Storage):
+        self.__storage = storage
+        self.__tracks = []  # (track, stored)
+
+    def __len__(self):
+        return len(self.__tracks)
+
+    def insert(self, track: Tracks):
+        """
+            Returns:
+                str: "Tracks Already Exist" if the track is known to be in the library already, otherwise None.
+        """
+        if any(pending.getIdentityKey() == track.getIdentityKey() for pending, _ in self.__tracks):
+            return f"Tracks Already Exist"
+        stored = self.__storage.has_track(track.getId())
+        if stored:
+            return f"Tracks Already Exist"
+        if stored is not None:
+            self.__storage.append_track(track.newTrack)
+        self.__tracks.append((track, stored is not None))
+
+    def addTo(self, containsTrack, addTrack):
+        """
+            Adds the pending tracks that containsTrack(track) does not find with addTrack(track),
+            and stores the ones that were not stored yet.
+        """
+        unstored = []
+        for track, stored in self.__tracks:
+            if not containsTrack(track):
+                addTrack(track)
+                if not stored:
+                    unstored.append(track.newTrack)
+        self.__storage.append_tracks(unstored)
+        self.__tracks.clear()
+
+@Stats.instrumented
 class MusicLibrary:
-    def __init__(self):
+    def __init__(self, storage: Storage = None, lazy=False):
+        """
+            Args:
+                storage (Storage): where the library is stored. Defaults to the shared default storage.
+                lazy (bool): load on a background thread and return at once. Methods that need the
+                    tracks block until loading has finished. Defaults to False.
+        """
         self.__library = []
-        self.loadLibrary()
-
+        self.__keys = []  # sort key of every track in the library, used for bisect
+        self.__storage = storage if storage is not None else default_storage()
+
+        # normalized key -> list of tracks, kept in sync with the library
+        self.__titleIndex = {}
+        self.__artistIndex = {}
+        self.__albumIndex = {}
+
+        # sorted distinct artist and album keys for prefix range scans, titles use self.__keys
+        self.__artistKeys = []
+        self.__albumKeys = []
+
+        # stable track id -> track, built on the first id lookup and then kept up to date
+        self.__idIndex = None
+
+        # typo tolerant title index, built on the first fuzzy search and then kept up to date
+        self.__trigramIndex = None
+        # ranked search over every text field, built on the first full-text search
+        self.__textIndex = None
+
+        self.__loaded = threading.Event()
+        self.__loadError = None
+        self.__loadedCount = 0
+        # tracks inserted while a lazy load is running
+        self.__pending = PendingInserts(self.__storage)
+        self.__pendingLock = threading.Lock()
+        self.__sorted = False  # set once loading has sorted the library
+        self.__frozen = False
+        self.__loader = None
+
+        if lazy:
+            self.__loader = threading.Thread(target=self.loadLibrary, daemon=True)
+            self.__loader.start()
+        else:
+            self.loadLibrary()
+
+    @Stats.measured
     def loadLibrary(self):
-        with open("MusicLibrary.json", "r") as f:
-            data = json.loads(f.read())
-
-        for track_data in data:
-            self.getMusicLibrary().append(
-                Tracks(
-                    track_data["Title"],
-                    track_data["Artist"],
-                    track_data["Album"],
-                    track_data["Duration"],
-                    track_data.get("Additional Artists", [])  # Default to empty list
-                )
-            )
+        """
+            Loads every track from the storage into the sorted library and builds the indexes.
+            Tracks the storage returns more than once (e.g. replayed from a journal) are skipped.
+            When the storage has an up to date binary cache (see LibraryCache) the sorted tracks are
+            taken from it and only the inserts made after it was written are read as records.
+        """
+        # millions of new objects with no cycles would set off many useless garbage collections,
+        # collection is turned back on when loading is done (see __frozen)
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            lib = self.__library
+            cached = self.__storage.load_library_cache()
+            if cached is not None:
+                payload, records = cached
+                tracks, self.__titleIndex, self.__artistIndex, self.__albumIndex = LibraryCache.unpackLibrary(payload)
+                lib.extend(tracks)
+                self.__loadedCount = len(lib)
+            else:
+                records = self.__storage.load_tracks()
+            # the cached tracks come sorted, only what is added after them needs sorting
+            sortedCount = len(lib)
+
+            # records are streamed from the storage and turned into Tracks one at a time
+            for track_data in records:
+                track = Tracks.fromStored(track_data)
+                if not self.__containsTrack(track):
+                    self.__appendTrack(track)
+                self.__loadedCount += 1
+
+            # the inserts made while loading join before the sort, the few made while sorting after it
+            with self.__pendingLock:
+                self.__pending.addTo(self.__containsTrack, self.__appendTrack)
+
+            # one sort at the end instead of one insertion per track, nearly sorted input is close to O(n)
+            if len(lib) > sortedCount:
+                lib.sort(key=Tracks.getSortKey)
+            self.__keys = list(map(Tracks.getSortKey, lib))
+            self.__artistKeys = sorted(self.__artistIndex)
+            self.__albumKeys = sorted(self.__albumIndex)
+            self.__sorted = True
+
+            with self.__pendingLock:
+                self.__pending.addTo(self.__containsTrack, self.__insertSorted)
+                self.__freeze()
+                # from here on inserts go straight into the library
+                self.__loaded.set()
+
+            # the library is usable meanwhile: finish a compaction that was interrupted or is overdue,
+            # and cache the library, copied after the storage noted how far its journal goes
+            if self.__storage.needs_compaction():
+                self.__compact()
+            if cached is None or not self.__storage.library_cache_is_current():
+                self.__storage.save_library_cache(lambda: LibraryCache.packTracks(list(lib)))
+        except Exception as e:
+            self.__loadError = e
+            if threading.current_thread() is threading.main_thread():
+                raise
+        finally:
+            if collecting:
+                gc.enable()
+            self.__loaded.set()
+
+    def __freeze(self):
+        """
+            Moves the loaded tracks out of the reach of the garbage collector, every full collection would
+            otherwise walk all of them again. close() undoes it.
+        """
+        gc.freeze()
+        self.__frozen = True
+
+    def isLoaded(self) -> bool:
+        return self.__loaded.is_set()
+
+    def getLoadedCount(self) -> int:
+        """
+            returns the number of records read from the storage so far
+        """
+        return self.__loadedCount
 
+    def waitUntilLoaded(self, timeout=None) -> bool:
+        """
+            Blocks until the library has finished loading. Re-raises an error raised by a background load.
+
+            Returns:
+                bool: False if the timeout expired before loading finished.
+        """
+        if not self.__loaded.wait(timeout):
+            return False
+        if self.__loadError is not None:
+            raise RuntimeError("Loading the music library failed") from self.__loadError
+        return True
+
+    def __appendTrack(self, track: Tracks):
+        """Adds a track at the end of the library while loading, it is sorted when loading finishes."""
+        self.__library.append(track)
+        self.__indexTrack(track)
+
+    def __indexTrack(self, track: Tracks):
+        """
+            Adds a track to the title, artist and album indexes.
+            Every additional artist is indexed too so that features can be browsed by artist.
+        """
+        titleKey, _, albumKey, _ = track.getSortKey()
+        self.__titleIndex.setdefault(titleKey, []).append(track)
+        if self.__idIndex is not None:
+            self.__idIndex[track.getId()] = track
+        if self.__trigramIndex is not None:
+            self.__trigramIndex.add(titleKey)
+        if self.__textIndex is not None:
+            self.__addToTextIndex(track)
+        self.__addToIndex(self.__albumIndex, self.__albumKeys, albumKey, track)
+
+        primary = Tracks.normalize(track.getPrimaryArtist())
+        self.__addToIndex(self.__artistIndex, self.__artistKeys, primary, track)
+        for artist in {Tracks.normalize(artist) for artist in track.getAdditionalArtists()} - {primary}:
+            self.__addToIndex(self.__artistIndex, self.__artistKeys, artist, track)
+
+    def __addToIndex(self, index: dict, sortedKeys: list, key: str, track: Tracks):
+        if key in index:
+            index[key].append(track)
+        else:
+            index[key] = [track]
+            # while loading the sorted key lists are built once, when the tracks are sorted
+            if self.__sorted:
+                bisect.insort(sortedKeys, key)
+
+    @requiresLibrary
     def getMusicLibrary(self) -> list:
         return self.__library
 
+    @requiresLibrary
     def isEmpty(self) -> bool:
         return len(self.getMusicLibrary()) == 0
 
+    @requiresLibrary
     def getSize(self):
         return len(self.getMusicLibrary())
     
+    @requiresLibrary
     def getFirst(self):
         return self.getMusicLibrary()[0] if not self.isEmpty() else None
     
+    @requiresLibrary
     def getLast(self):
         return self.getMusicLibrary()[-1] if not self.isEmpty() else None
     
+    @requiresLibrary
+    def containsTrack(self, track: Tracks) -> bool:
+        """
+            Checks whether a track with the same title, primary artist and album is already in the library.
+        """
+        return self.__containsTrack(track)
+
+    def __containsTrack(self, track: Tracks) -> bool:
+        identity = track.getIdentityKey()
+        for existing in self.__titleIndex.get(identity[0], ()):
+            if existing.getIdentityKey() == identity:
+                return True
+        return False
+
+    @Stats.measured
     def insertTrackToLibrary(self, track: Tracks):
-        index = self.findIndexInsertion(track)
-        lib = self.getMusicLibrary()
-        title = track.getTitle()
-        albumName = track.getAlbumName()
-
-        if len(self.getTrackWithTitle(title)) >= 1:
-            if len(self.getTrackWithAlbum(albumName)) >= 1:
-                return f"Tracks Already Exist"
-        lib.insert(index, track)
-
-        data = []
-        for track in self.getMusicLibrary():
-            if track.newTrack not in data:
-                data.append(track.newTrack)
-        with open("MusicLibrary.json", "w") as f:
-            newjson = json.dumps(data, indent=4)
-            f.write(newjson)
+        """
+            Inserts a track into the sorted library and persists it. While a lazy load is running the track
+            joins the library when loading finishes. It is persisted at once if the storage can tell that it
+            is not stored yet (Storage.has_track), otherwise when loading finishes, unless it turns out to be
+            a duplicate of a stored track then.
 
-    def findIndexInsertion(self, track: Tracks):
-        left = 0
-        right = self.getSize() - 1
-        
-        while left <= right:
-            mid = (left + right) // 2
-            existing_contact = self.getMusicLibrary()[mid]
-
-            #comparing the titles of the tracks to be stored and the existing contact
-            compare_result = Tracks.CompareTrack(track,existing_contact,0)
-
-            #if new tracks title is less than the existing tracks title
-            if compare_result < 0:
-                right = mid - 1
-            
-            #if new tracks title is greater than the existing tracks title
-            elif compare_result > 0:
-                left = mid + 1
+            Returns:
+                str: "Tracks Already Exist" if the track is known to be in the library already, otherwise None.
+        """
+        if not self.__loaded.is_set():
+            with self.__pendingLock:
+                if not self.__loaded.is_set():
+                    return self.__pending.insert(track)
+        self.waitUntilLoaded()
+        if self.containsTrack(track):
+            return f"Tracks Already Exist"
+
+        self.__insertSorted(track)
+        self.__storage.append_track(track.newTrack)
+
+        if self.__storage.needs_compaction():
+            self.compactLibrary(background=True)
+
+    @Stats.measured
+    @requiresLibrary
+    def bulk_insert(self, tracks) -> dict:
+        """
+            Inserts many tracks at once. The batch is sorted once and merged into the library,
+            and the storage is written once at the end instead of once per track.
 
-            else:
-                #if titles are equal, then we will compare the artist Names
-                compare_result = Tracks.CompareTrack(track,existing_contact,1)
-
-                if compare_result < 0:
-                    right = mid - 1
-            
-                
-                elif compare_result > 0:
-                    left = mid + 1
-
-                else:
-                    compare_result = Tracks.CompareTrack(track,existing_contact,2)
-                    
-                    if compare_result < 0:
-                        right = mid - 1
-                    
-                    elif compare_result > 0:
-                        left = mid + 1
-
-                    else:
-                        compare_result = Tracks.CompareTrack(track,existing_contact,3)
-                        if compare_result < 0:
-                            right = mid - 1
-
-                        else: 
-                            left = mid + 1
-
-        return left
-    
-    def getTrackWithTitle(self, trackTitle) -> list['Tracks']:
+            Args:
+                tracks (iterable): Tracks objects or track dicts in the MusicLibrary.json format.
+
+            Returns:
+                dict: number of tracks "inserted", "duplicates" skipped and invalid tracks "rejected".
         """
-            Finding all tracks with title that matches with the given track title.
-            Using binary search to narrow the search range and then performs a linear scan to collect all matching tracks.
+        report = {"inserted": 0, "duplicates": 0, "rejected": 0}
+        batch = []
+        seen = set()
+
+        for item in tracks:
+            if not isinstance(item, Tracks):
+                try:
+                    item = Tracks.fromData(item)
+                except (KeyError, ValueError, TypeError, AttributeError):
+                    report["rejected"] += 1
+                    continue
+
+            identity = item.getIdentityKey()
+            if identity in seen or self.containsTrack(item):
+                report["duplicates"] += 1
+                continue
+            seen.add(identity)
+            batch.append(item)
+
+        if not batch:
+            return report
+
+        # the library and the sorted batch are two runs, so Timsort merges them in O(n + m).
+        # The library is replaced in one step, a list being sorted in place looks empty to other threads
+        batch.sort(key=Tracks.getSortKey)
+        lib = self.getMusicLibrary()
+        merged = lib + batch
+        merged.sort(key=Tracks.getSortKey)
+        lib[:] = merged
+        self.__keys = [track.getSortKey() for track in lib]
+        for track in batch:
+            self.__indexTrack(track)
+
+        self.__storage.append_tracks([track.newTrack for track in batch])
+        if self.__storage.needs_compaction():
+            self.compactLibrary()
+
+        report["inserted"] = len(batch)
+        return report
+
+    @Stats.measured
+    @requiresLibrary
+    def import_file(self, path) -> dict:
+        """
+            Imports tracks from a .json (list of tracks), .jsonl (one track per line) or .csv file
+            with the same field names as MusicLibrary.json. In CSV files additional artists are separated by ";".
 
             Returns:
-                list[Tracks]: A list of tracks with the matching title.
-                to be able to handle cases where there are multiple tracks that have same track title
+                dict: the bulk_insert report.
         """
-        if self.isEmpty():
-            return result
-        
-        left = 0
-        right = self.getSize() - 1
-        lib = self.getMusicLibrary() 
-        result = []
+        records, rejected = readTrackRecords(path)
+        report = self.bulk_insert(records)
+        report["rejected"] += rejected
+        return report
+
+    def __insertSorted(self, track: Tracks):
+        # also called by loadLibrary for the last inserts, before the library is marked loaded
+        index = bisect.bisect_right(self.__keys, track.getSortKey())
+        self.__library.insert(index, track)
+        self.__keys.insert(index, track.getSortKey())
+        self.__indexTrack(track)
+
+    def getStorage(self) -> Storage:
+        return self.__storage
+
+    @Stats.measured
+    @requiresLibrary
+    def compactLibrary(self, background=False):
+        """
+            Asks the storage to rewrite the library from the tracks in memory,
+            e.g. folding the journal of MusicLibrary.json into a new snapshot.
+
+            Args:
+                background (bool): write on a background thread. Defaults to False.
+        """
+        self.__compact(background)
 
-        while left <= right:
-            mid = (left + right) // 2
-            midTitle = lib[mid].getTitle().strip().lower()
-            targetTitle = trackTitle.strip().lower()
+    def __compact(self, background=False):
+        # the storage calls this while it sets its journal aside, only the list is copied then,
+        # the dicts are built while the new snapshot is written (on its thread with background)
+        self.__storage.compact_tracks(
+            lambda: (track.newTrack for track in list(self.__library)),
+            background=background
+        )
 
-            if midTitle > targetTitle:
-                right = mid - 1
-            elif midTitle < targetTitle:
-                left = mid + 1
-            else:
-                # Match found, now reduce the search range
-                break
+    def close(self):
+        """
+            Waits for loading and pending writes to finish, hands the tracks back to the garbage collector
+            and closes the storage.
+        """
+        self.__loaded.wait()
+        # loading goes on with the compaction and the cache after the library is usable
+        if self.__loader is not None:
+            self.__loader.join()
+        # a compaction rewrote the stored library, refresh the cache so that the next start can use it
+        if self.__loadError is None and not self.__storage.library_cache_is_current():
+            self.__storage.save_library_cache(LibraryCache.packTracks(self.__library))
+        if self.__frozen:
+            gc.unfreeze()
+            self.__frozen = False
+        self.__storage.close()
+
+    @Stats.measured
+    @requiresLibrary
+    def findIndexInsertion(self, track: Tracks):
+        """
+            Binary search for the position of a track, comparing title, artist, album and duration
+            in that order through the precomputed sort keys.
+        """
+        return bisect.bisect_right(self.__keys, track.getSortKey())
 
-        # If no match is found during binary search
-        if left > right:
-            return result
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithId(self, trackId):
+        """
+            Finding the track with the given stable id (see Tracks.getId).
 
-        # Linear scan backward to find all matching titles before mid
-        start = mid
-        while start >= 0 and lib[start].getTitle().strip().lower() == trackTitle.strip().lower():
-            start -= 1
+            Returns:
+                Tracks: the track, or None if no track in the library has that id.
+        """
+        if self.__idIndex is None:
+            self.__idIndex = {track.getId(): track for track in self.__library}
+        return self.__idIndex.get(trackId)
 
-        # Linear scan forward to find all matching titles after mid
-        end = mid
-        while end < len(lib) and lib[end].getTitle().strip().lower() == trackTitle.strip().lower():
-            end += 1
+    @Stats.measured
+    def resolveTracks(self, trackIds=(), tracksData=()) -> list['Tracks']:
+        """
+            Turns stored references into library tracks, in order, see resolveTrackReferences.
 
-        # Collect all matching tracks
-        result.extend(lib[start + 1:end])
+            Returns:
+                list[Tracks]: the resolved tracks, unknown ids and invalid track dicts are skipped.
+        """
+        return resolveTrackReferences(self, trackIds, tracksData)
 
-        return result
-    
-    def getTrackWithAlbum(self, albumName) -> list['Tracks']:
+    @Stats.measured
+    def getTrackWithTitle(self, trackTitle) -> list['Tracks']:
         """
             Finding all tracks with title that matches with the given track title.
-            Using binary search to narrow the search range and then performs a linear scan to collect all matching tracks.
+            Uses the title index so the lookup does not depend on the size of the library.
+            While a lazy load is running the storage's own index is used if it has one (Storage.find_tracks).
 
             Returns:
                 list[Tracks]: A list of tracks with the matching title.
                 to be able to handle cases where there are multiple tracks that have same track title
         """
-        if self.isEmpty():
-            return result
-        
-        left = 0
-        right = self.getSize() - 1
-        lib = self.getMusicLibrary() 
-        result = []
+        found = self.__findStored(title=trackTitle)
+        if found is not None:
+            return found
+        self.waitUntilLoaded()
+        return list(self.__titleIndex.get(Tracks.normalize(trackTitle), []))
 
-        while left <= right:
-            mid = (left + right) // 2
-            midTitle = lib[mid].getAlbumName().strip().lower()
-            targetTitle = albumName.strip().lower()
+    def __findStored(self, title=None, album=None):
+        """
+            returns the tracks found in the storage's index while a lazy load is running, or None once the
+            library is loaded or if the storage has no index. Such a storage also has every insert already.
+        """
+        if self.__loaded.is_set():
+            return None
+        found = self.__storage.find_tracks(title=title, album=album)
+        return [Tracks.fromStored(track_data) for track_data in found] if found is not None else None
+
+    @Stats.measured
+    @requiresLibrary
+    def getTrackWithArtist(self, artistName) -> list['Tracks']:
+        """
+            Finding all tracks where the given artist is the primary or an additional artist.
 
-            if midTitle > targetTitle:
-                right = mid - 1
-            elif midTitle < targetTitle:
-                left = mid + 1
-            else:
-                # Match found, now reduce the search range
-                break
+            Returns:
+                list[Tracks]: A list of tracks featuring the artist.
+        """
+        return list(self.__artistIndex.get(Tracks.normalize(artistName), []))
 
-        # If no match is found during binary search
-        if left > right:
-            return result
+    @Stats.measured
+    def getTrackWithAlbum(self, albumName) -> list['Tracks']:
+        """
+            Finding all tracks that belong to the given album. While a lazy load is running the storage's
+            own index is used if it has one.
+
+            Returns:
+                list[Tracks]: A list of tracks with the matching album name.
+        """
+        found = self.__findStored(album=albumName)
+        if found is not None:
+            return found
+        self.waitUntilLoaded()
+        return list(self.__albumIndex.get(Tracks.normalize(albumName), []))
+
+    @Stats.measured
+    @requiresLibrary
+    def search_prefix(self, text, limit=10, fields=("title", "artist", "album")) -> list['Tracks']:
+        """
+            Finding tracks whose title, artist or album starts with the given text, for as-you-type completion.
+            Each field is a range scan over a sorted list of normalized keys, so the cost depends on
+            the number of results and not on the size of the library.
 
-        # Linear scan backward to find all matching titles before mid
-        start = mid
-        while start >= 0 and lib[start].getAlbumName().strip().lower() == albumName.strip().lower():
-            start -= 1
+            Args:
+                text (str): the beginning of a title, artist or album name.
+                limit (int): maximum number of tracks returned. Defaults to 10.
+                fields (tuple): which fields to search, title matches come first, then artists, then albums.
 
-        # Linear scan forward to find all matching titles after mid
-        end = mid
-        while end < len(lib) and lib[end].getAlbumName().strip().lower() == albumName.strip().lower():
-            end += 1
+            Returns:
+                list[Tracks]: up to limit matching tracks.
+        """
+        prefix = Tracks.normalize(text)
+        if not prefix or limit <= 0:
+            return []
 
-        # Collect all matching tracks
-        result.extend(lib[start + 1:end])
+        result = []
+        seen = set()
+
+        def collect(tracks):
+            for track in tracks:
+                if id(track) not in seen:
+                    seen.add(id(track))
+                    result.append(track)
+                    if len(result) >= limit:
+                        return True
+            return False
+
+        if "title" in fields:
+            lib = self.__library
+            index = bisect.bisect_left(self.__keys, (prefix,))
+            end = index
+            while end < len(lib) and end - index < limit and self.__keys[end][0].startswith(prefix):
+                end += 1
+            if collect(lib[index:end]):
+                return result
+
+        for field, index, sortedKeys in (("artist", self.__artistIndex, self.__artistKeys),
+                                         ("album", self.__albumIndex, self.__albumKeys)):
+            if field not in fields:
+                continue
+            position = bisect.bisect_left(sortedKeys, prefix)
+            while position < len(sortedKeys) and sortedKeys[position].startswith(prefix):
+                if collect(index[sortedKeys[position]]):
+                    return result
+                position += 1
 
         return result
-    
 
+    @Stats.measured
+    @requiresLibrary
+    def search_fuzzy(self, text, limit=10) -> list['Tracks']:
+        """
+            Finding tracks whose title is similar to the given text, so that typos like
+            "watermellon" or "Anti Hero" still find "Watermelon Sugar" and "Anti-Hero".
+
+            Returns:
+                list[Tracks]: tracks of up to limit different titles, most similar title first.
+        """
+        if self.__trigramIndex is None:
+            self.__trigramIndex = TrigramIndex(self.__titleIndex)
+
+        result = []
+        for title in self.__trigramIndex.search(Tracks.normalize(text), limit):
+            result.extend(self.__titleIndex[title])
+        return result
+
+    def __addToTextIndex(self, track: Tracks):
+        self.__textIndex.add(track, (track.getTitle(), track.getArtist(), track.getAlbumName()))
+
+    @Stats.measured
+    @requiresLibrary
+    def search_text(self, query, page=1, per_page=10):
+        """
+            Ranked search for words anywhere in the title, artists and album (BM25),
+            e.g. "harry sugar" finds "Watermelon Sugar" by Harry Styles first.
+
+            Returns:
+                tuple: (list of tracks on the requested page, total number of matching tracks)
+        """
+        if self.__textIndex is None:
+            self.__textIndex = FullTextIndex()
+            for track in self.__library:
+                self.__addToTextIndex(track)
+        return self.__textIndex.search(query, page, per_page)
@@ -1,86 +1,162 @@
 from Tracks import Tracks
-import json
+from Storage import Storage, default_storage
+import Stats
+from contextlib import contextmanager
 
+@Stats.instrumented
 class Playlist:
-    def __init__(self, name):
+    def __init__(self, name, storage: Storage = None):
         self.name = name
-        self.tracks = []
-        self.total_duration = [0, 0]  # [minutes, seconds]
+        # the tracks in playlist order, and identity key -> track to keep them unique
+        self._tracks = []
+        self._members = {}
+        self.total_seconds = 0
+        self.storage = storage if storage is not None else default_storage()
+        self._editing = 0  # depth of nested edit() sessions, saving waits for the outermost one
 
+    @property
+    def tracks(self) -> list[Tracks]:
+        """Return the tracks of the playlist in order."""
+        return list(self._tracks)
+
+    @tracks.setter
+    def tracks(self, tracks):
+        """Replace the tracks of the playlist, later duplicates are dropped."""
+        self._members = {}
+        for track in tracks:
+            self._members.setdefault(track.getIdentityKey(), track)
+        self._tracks = list(self._members.values())
+        self.total_seconds = sum(track.getDurationSeconds() for track in self._tracks)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, track: Tracks):
+        return track.getIdentityKey() in self._members
+
+    @Stats.measured
     def add_track(self, track: Tracks):
         """Add a unique track to the playlist."""
-        if track not in self.tracks:
-            self.tracks.append(track)
-            self._update_duration(track.getNumericDuration())
-            self.save_playlist()
+        key = track.getIdentityKey()
+        if key not in self._members:
+            self._members[key] = track
+            self._tracks.append(track)
+            self._update_duration(track.getDurationSeconds())
+            self._changed()
             return True
         return False
 
+    @Stats.measured
     def remove_track(self, track: Tracks):
         """Remove a track from the playlist."""
-        if track in self.tracks:
-            self.tracks.remove(track)
-            self._update_duration(track.getNumericDuration(), remove=True)
-            self.save_playlist()
+        removed = self._members.pop(track.getIdentityKey(), None)
+        if removed is not None:
+            # Tracks compare by identity, so this is a scan in C
+            self._tracks.remove(removed)
+            self._update_duration(removed.getDurationSeconds(), remove=True)
+            self._changed()
             return True
         return False
 
-    def _update_duration(self, duration, remove=False):
-        """Update the total duration of the playlist."""
-        minutes, seconds = self.total_duration
-        delta_min, delta_sec = duration
+    @Stats.measured
+    def remove_at(self, position: int):
+        """Remove the track at a 0-based position. Returns the removed track or None."""
+        if not 0 <= position < len(self._tracks):
+            return None
+        track = self._tracks.pop(position)
+        del self._members[track.getIdentityKey()]
+        self._update_duration(track.getDurationSeconds(), remove=True)
+        self._changed()
+        return track
+
+    @Stats.measured
+    def move(self, source: int, target: int):
+        """Move the track at position source to position target (both 0-based)."""
+        tracks = self._tracks
+        if not (0 <= source < len(tracks) and 0 <= target < len(tracks)):
+            return False
+        # the same tracks stay in the playlist, only the order changes
+        tracks.insert(target, tracks.pop(source))
+        self._changed()
+        return True
 
-        total_seconds = minutes * 60 + seconds
-        delta_seconds = delta_min * 60 + delta_sec
-        total_seconds = total_seconds - delta_seconds if remove else total_seconds + delta_seconds
+    def _changed(self):
+        """Save right away, or once at the end of the current edit session."""
+        if not self._editing:
+            self.save_playlist()
 
-        self.total_duration = [total_seconds // 60, total_seconds % 60]
+    @contextmanager
+    def edit(self):
+        """
+        Group several changes into one save.
+        The playlist is saved once when the block ends, or restored to its previous state if the block raises.
+
+            with playlist.edit():
+                playlist.add_track(a)
+                playlist.remove_track(b)
+        """
+        tracks, members, total_seconds = list(self._tracks), dict(self._members), self.total_seconds
+        self._editing += 1
+        try:
+            yield self
+        except BaseException:
+            self._tracks, self._members, self.total_seconds = tracks, members, total_seconds
+            raise
+        finally:
+            self._editing -= 1
+        if not self._editing:
+            self.save_playlist()
+
+    @Stats.measured
+    def add_tracks(self, tracks):
+        """Add several tracks with a single save. Returns the number of tracks added."""
+        with self.edit():
+            return sum(1 for track in tracks if self.add_track(track))
+
+    @Stats.measured
+    def remove_tracks(self, tracks):
+        """Remove several tracks with a single save. Returns the number of tracks removed."""
+        with self.edit():
+            return sum(1 for track in tracks if self.remove_track(track))
+
+    def _update_duration(self, seconds, remove=False):
+        """Update the total duration of the playlist."""
+        self.total_seconds += -seconds if remove else seconds
+
+    @property
+    def total_duration(self):
+        """Return the total duration as [minutes, seconds]."""
+        return list(divmod(self.total_seconds, 60))
 
     def get_total_duration(self):
         """Return the total duration in 'mm:ss' format."""
         return f"{self.total_duration[0]:02}:{self.total_duration[1]:02}"
 
+    @Stats.measured
     def save_playlist(self):
-        """Save the playlist to Playlist.json."""
-        try:
-            with open("Playlist.json", "r") as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            data = {}
-
-        data[self.name] = {
+        """Save the playlist to the storage (the Playlists directory by default)."""
+        self.storage.save_playlist(self.name, {
             "Playlist Name": self.name,
             "Total Duration": f"{self.total_duration[0]} min {self.total_duration[1]} sec",
-            "Tracks": [track.newTrack for track in self.tracks]
-        }
-
-        with open("Playlist.json", "w") as f:
-            json.dump(data, f, indent=4)
+            "Track IDs": [track.getId() for track in self._tracks]
+        })
 
+    @Stats.measured
     @staticmethod
-    def load_playlist(name):
-        """Load a playlist by name from Playlist.json."""
-        try:
-            with open("Playlist.json", "r") as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            print("No saved playlists found.")
-            return None
+    def load_playlist(name, library, storage: Storage = None):
+        """
+        Load a playlist by name from the storage (the Playlists directory by default).
+        The stored track ids are resolved against the library, so every playlist shares the library's Tracks objects.
+        """
+        storage = storage if storage is not None else default_storage()
+        playlist_data = storage.load_playlist(name)
 
-        if name in data:
-            playlist_data = data[name]
-            playlist = Playlist(playlist_data["Playlist Name"])
-            playlist.tracks = [
-                Tracks(
-                    title=track_data["Title"],
-                    artist=track_data["Artist"],
-                    album=track_data["Album"],
-                    duration=track_data["Duration"]
-                )
-                for track_data in playlist_data["Tracks"]
-            ]
-            total_duration = playlist_data["Total Duration"].split(" min ")
-            playlist.total_duration = [int(total_duration[0]), int(total_duration[1].replace(" sec", ""))]
+        if playlist_data is not None:
+            playlist = Playlist(playlist_data["Playlist Name"], storage)
+            playlist.tracks = library.resolveTracks(
+                playlist_data.get("Track IDs", ()),
+                playlist_data.get("Tracks", ())  # playlists saved before tracks had ids
+            )
             return playlist
         else:
             print(f"Playlist '{name}' not found.")
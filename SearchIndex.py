@@ -0,0 +1,155 @@
+import heapq
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> list[str]:
+    """
+        returns the lowercase words of a text, punctuation is dropped ("Harry's House" -> ["harry", "s", "house"])
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(text: str) -> set[str]:
+    """
+        returns the set of 3 character pieces of a normalized text, padded so that the
+        beginning and the end of the text count as well ("abc" -> "  a", " ab", "abc", "bc ")
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def editDistance(a: str, b: str) -> int:
+    """
+        returns the Levenshtein distance between two strings
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, charA in enumerate(a, start=1):
+        current = [i]
+        for j, charB in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,                    # deletion
+                current[j - 1] + 1,                 # insertion
+                previous[j - 1] + (charA != charB)  # substitution
+            ))
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+        Inverted index from trigrams to the normalized keys containing them, used for typo tolerant search.
+        Only trigrams shared with the query are looked at, so a search never scans every key.
+    """
+    # trigrams found in more keys than this are skipped when the query has rarer ones
+    MAX_POSTINGS = 50000
+    # number of keys, by shared trigrams, that are ranked by similarity
+    CANDIDATES = 100
+
+    def __init__(self, keys=()):
+        self.__postings = {}
+        self.__keys = set()
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        """
+            Adds a normalized key (e.g. a title) to the index. Adding a key twice has no effect.
+        """
+        if key in self.__keys:
+            return
+        self.__keys.add(key)
+        for gram in trigrams(key):
+            self.__postings.setdefault(gram, []).append(key)
+
+    def getSize(self) -> int:
+        return len(self.__keys)
+
+    def search(self, query: str, limit=10, min_similarity=0.3) -> list[str]:
+        """
+            Finding the keys most similar to a normalized query.
+            Candidates sharing the most trigrams with the query are ranked by their trigram
+            similarity (Dice coefficient), ties are broken by edit distance.
+
+            Returns:
+                list[str]: up to limit keys, best match first.
+        """
+        queryGrams = trigrams(query)
+        postings = sorted((self.__postings[gram] for gram in queryGrams if gram in self.__postings), key=len)
+        if not postings:
+            return []
+
+        shared = {}
+        for i, keys in enumerate(postings):
+            if i > 0 and len(keys) > self.MAX_POSTINGS:
+                break
+            for key in keys:
+                shared[key] = shared.get(key, 0) + 1
+
+        ranked = []
+        for key, count in heapq.nlargest(self.CANDIDATES, shared.items(), key=lambda item: item[1]):
+            similarity = 2 * count / (len(queryGrams) + len(trigrams(key)))
+            if similarity >= min_similarity:
+                ranked.append((-similarity, editDistance(query, key), key))
+        ranked.sort()
+        return [key for _, _, key in ranked[:limit]]
+
+
+class FullTextIndex:
+    """
+        Inverted index of words to the documents containing them, ranked with BM25.
+        A document is any object, it is indexed under the words of the texts given for it.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.__postings = {}  # word -> {document id: term frequency}
+        self.__documents = []
+        self.__lengths = []
+        self.__totalLength = 0
+
+    def add(self, document, texts):
+        """
+            Indexes a document under the words of the given texts (e.g. title, artists and album).
+        """
+        docId = len(self.__documents)
+        words = [word for text in texts for word in tokenize(text)]
+        self.__documents.append(document)
+        self.__lengths.append(len(words))
+        self.__totalLength += len(words)
+
+        for word in words:
+            frequencies = self.__postings.setdefault(word, {})
+            frequencies[docId] = frequencies.get(docId, 0) + 1
+
+    def getSize(self) -> int:
+        return len(self.__documents)
+
+    def search(self, query: str, page=1, per_page=10):
+        """
+            Finding the documents matching any word of the query, best BM25 score first.
+
+            Returns:
+                tuple: (list of documents on the requested page, total number of matching documents)
+        """
+        if not self.__documents:
+            return [], 0
+
+        count = len(self.__documents)
+        averageLength = self.__totalLength / count or 1
+        scores = {}
+
+        for word in set(tokenize(query)):
+            frequencies = self.__postings.get(word)
+            if not frequencies:
+                continue
+            idf = math.log(1 + (count - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for docId, tf in frequencies.items():
+                norm = self.K1 * (1 - self.B + self.B * self.__lengths[docId] / averageLength)
+                scores[docId] = scores.get(docId, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+
+        page = max(1, page)
+        best = heapq.nlargest(page * per_page, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.__documents[docId] for docId, _ in best[(page - 1) * per_page:]], len(scores)
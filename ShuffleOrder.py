@@ -0,0 +1,200 @@
+from BlockList import BlockList
+from bisect import bisect_left
+import hashlib
+import random
+
+class ShuffleOrder:
+    """
+        Random play order over the positions 0..size-1 of a queue, generated lazily.
+
+        Works as a Fisher-Yates shuffle that is only carried out as far as it has been played: the positions
+        drawn so far are kept in play order in a BlockList, and the ones not drawn yet form a pool that is stored
+        sparsely (only the slots moved by a swap are remembered). Each draw is derived from the seed and the number
+        of the draw, so the same seed gives the same order, and nothing of the size of the queue is ever copied.
+
+        Positions are held as keys that never change. Removing a position only marks its key as removed, and
+        the position of a key is the key minus the number of removed keys below it (a sparse Fenwick tree).
+        A position added while shuffled gets a new key after all others, i.e. it is added at the end of the queue.
+        So removing, inserting and moving a drawn place cost O(log n + BlockList.BLOCK_SIZE), however much of the
+        queue has been played.
+    """
+    def __init__(self, size: int, seed: int = None, drawn=(), pool=None, removed=(), low=None):
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.__prefix = b"%d:" % self.seed
+        # keys 0..size-1 plus the removed ones, see getState
+        removed = sorted(set(removed))
+        keyCount = size + len(removed)
+        drawnKeys = [key for key in drawn if 0 <= key < keyCount]
+        self.size = size
+        self.__drawn = BlockList(drawnKeys)
+        self.__nextKey = keyCount
+        self.__removed = []
+        self.__tree = {}
+        self.__capacity = 1 << keyCount.bit_length()
+        for key in removed:
+            self.__markRemoved(key)
+
+        # slots low..high-1 of the pool hold the keys not drawn yet, slot j holds key j unless it is in swaps
+        self.__high = size
+        if pool is not None and len(drawnKeys) == len(drawn):
+            self.__low = low if low is not None else len(drawnKeys)
+            self.__high = self.__low + size - len(drawnKeys)
+            self.__swaps = {slot: key for slot, key in pool}
+        elif removed:
+            # the saved pool does not match, start a new one over the keys that were not drawn
+            self.__rebuildPool(drawnKeys, set(removed))
+        else:
+            self.__low = len(drawnKeys)
+            self.__rebuildPool(drawnKeys)
+
+    def __rebuildPool(self, drawnKeys: list, removed: set = None):
+        """
+            Rebuilds the sparse pool from the drawn positions in O(number drawn).
+            Slot j of the pool holds position j unless it was drawn already, in which case it
+            holds one of the positions below the number drawn that has not been drawn yet.
+        """
+        if removed:
+            drawn = set(drawnKeys)
+            undrawn = [key for key in range(self.__nextKey) if key not in drawn and key not in removed]
+            self.__low = 0
+            self.__high = len(undrawn)
+            self.__swaps = {slot: key for slot, key in enumerate(undrawn) if slot != key}
+            return
+        count = len(drawnKeys)
+        drawn = set(drawnKeys)
+        free = (index for index in range(count) if index not in drawn)
+        self.__swaps = {index: next(free) for index in drawnKeys if index >= count}
+
+    def __removedBefore(self, key: int) -> int:
+        """returns the number of removed keys below key"""
+        total = 0
+        tree = self.__tree
+        while key > 0:
+            total += tree.get(key, 0)
+            key -= key & -key
+        return total
+
+    def __markRemoved(self, key: int):
+        self.__removed.append(key)
+        i = key + 1
+        while i <= self.__capacity:
+            self.__tree[i] = self.__tree.get(i, 0) + 1
+            i += i & -i
+
+    def __newKey(self) -> int:
+        key = self.__nextKey
+        self.__nextKey += 1
+        if self.__nextKey > self.__capacity:
+            # the new root covers the old one, nothing was removed above it yet
+            self.__capacity *= 2
+            self.__tree[self.__capacity] = self.__tree.get(self.__capacity // 2, 0)
+        return key
+
+    def __position(self, key: int) -> int:
+        return key - self.__removedBefore(key)
+
+    def __pick(self, draw: int, poolSize: int) -> int:
+        """returns the pool slot chosen by the given draw, a pure function of the seed and the draw number"""
+        digest = hashlib.blake2b(self.__prefix + b"%d" % draw, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % poolSize
+
+    def __drawUntil(self, count: int):
+        """Draws places until count of them (or all) are drawn."""
+        drawn = self.__drawn
+        first = len(drawn)
+        missing = min(count, self.size) - first
+        if missing <= 0:
+            return
+        swaps = self.__swaps
+        low = self.__low
+        high = self.__high
+        keys = []
+        for draw in range(first, first + missing):
+            slot = low + self.__pick(draw, high - low)
+            front = swaps.pop(low, low)
+            if slot == low:
+                keys.append(front)
+            else:
+                keys.append(swaps.get(slot, slot))
+                swaps[slot] = front
+            low += 1
+        self.__low = low
+        drawn.extend(keys)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, place: int) -> int:
+        """returns the queue position played at the given place of the shuffled order"""
+        if not 0 <= place < self.size:
+            raise IndexError("ShuffleOrder index out of range")
+        self.__drawUntil(place + 1)
+        return self.__position(self.__drawn[place])
+
+    def getDrawn(self) -> list[int]:
+        """returns the queue positions drawn so far, in play order"""
+        removed = sorted(self.__removed)
+        return [key - bisect_left(removed, key) for key in self.__drawn]
+
+    def getDrawnCount(self) -> int:
+        return len(self.__drawn)
+
+    def getState(self) -> dict:
+        """
+            returns what save_queue stores to rebuild this order with fromState: the seed, the drawn keys and
+            the [slot, key] pairs of the pool that differ from slot == key. The removed keys and the first slot
+            of the pool are only stored once positions were removed or inserted, until then keys are positions.
+        """
+        state = {
+            "shuffle_seed": self.seed,
+            "shuffle_drawn": list(self.__drawn),
+            "shuffle_pool": [[slot, key] for slot, key in self.__swaps.items()],
+        }
+        if self.__removed:
+            state["shuffle_removed"] = sorted(self.__removed)
+        if self.__low != len(self.__drawn):
+            state["shuffle_low"] = self.__low
+        return state
+
+    @staticmethod
+    def fromState(size: int, state: dict) -> 'ShuffleOrder':
+        """returns the order saved by getState for a queue of size positions"""
+        return ShuffleOrder(size, state["shuffle_seed"], state.get("shuffle_drawn", ()), state.get("shuffle_pool"),
+                            state.get("shuffle_removed", ()), state.get("shuffle_low"))
+
+    def append(self):
+        """Adds a position at the end of the queue; it joins the positions not drawn yet."""
+        key = self.__newKey()
+        if key != self.__high:
+            self.__swaps[self.__high] = key
+        self.__high += 1
+        self.size += 1
+
+    def insert(self, place: int):
+        """
+            Adds a position at the end of the queue and places it at the given place of the shuffled order,
+            e.g. to play next. The places before it are drawn first.
+        """
+        self.__drawUntil(place)
+        self.__drawn.insert(place, self.__newKey())
+        self.size += 1
+
+    def move(self, source: int, target: int):
+        """Moves the position played at place source of the shuffled order to place target."""
+        self.__drawUntil(max(source, target) + 1)
+        self.__drawn.insert(target, self.__drawn.pop(source))
+
+    def pop(self, place: int) -> int:
+        """
+            Removes the position played at the given place of the shuffled order, the later positions
+            of the queue move back by one.
+
+            Returns:
+                int: the queue position it had.
+        """
+        self[place]
+        key = self.__drawn.pop(place)
+        position = self.__position(key)
+        self.__markRemoved(key)
+        self.size -= 1
+        return position
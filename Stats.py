@@ -0,0 +1,228 @@
+from contextlib import contextmanager
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+class OperationStats:
+    """
+        Counters of one instrumented operation. Latencies are kept in a fixed size random sample,
+        so percentiles stay cheap however often the operation runs.
+    """
+    SAMPLE_SIZE = 2048
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.__sample = []
+
+    def record(self, seconds: float, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if len(self.__sample) < self.SAMPLE_SIZE:
+            self.__sample.append(seconds)
+        else:
+            # reservoir sampling: every call has the same chance to be in the sample
+            slot = random.randrange(self.calls)
+            if slot < self.SAMPLE_SIZE:
+                self.__sample[slot] = seconds
+
+    def percentile(self, fraction: float) -> float:
+        if not self.__sample:
+            return 0.0
+        ordered = sorted(self.__sample)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": self.total_seconds * 1000,
+            "mean_ms": self.total_seconds * 1000 / self.calls if self.calls else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max_seconds * 1000,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+_enabled = False
+_lock = threading.Lock()
+_operations = {}            # operation name -> OperationStats
+_totals = OperationStats("total I/O")  # bytes read and written by anything, measured or not
+_classes = []               # classes whose measured methods are wrapped while enabled
+_running = threading.local()  # names of the measured calls in progress on this thread
+
+def measured(method):
+    """
+        Marks a method of an @instrumented class to be timed while instrumentation is enabled.
+        The method itself is not wrapped, so a marked method costs nothing while it is disabled.
+    """
+    function = method.__func__ if isinstance(method, (staticmethod, classmethod)) else method
+    function._measured = True
+    return method
+
+def instrumented(cls):
+    """
+        Class decorator registering the @measured methods of a class with the instrumentation.
+    """
+    _classes.append(cls)
+    if _enabled:
+        _wrap(cls)
+    return cls
+
+def _measured_methods(cls):
+    for name, member in list(vars(cls).items()):
+        function = member.__func__ if isinstance(member, (staticmethod, classmethod)) else member
+        if getattr(function, "_measured", False):
+            yield name, member, function
+
+def _wrap(cls):
+    for name, member, function in _measured_methods(cls):
+        wrapper = _timed(f"{cls.__name__}.{name}", function)
+        wrapper._original = member
+        setattr(cls, name, type(member)(wrapper) if isinstance(member, (staticmethod, classmethod)) else wrapper)
+
+def _unwrap(cls):
+    for name, member in list(vars(cls).items()):
+        function = member.__func__ if isinstance(member, (staticmethod, classmethod)) else member
+        original = getattr(function, "_original", None)
+        if original is not None:
+            setattr(cls, name, original)
+
+def _timed(name: str, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        running = getattr(_running, "names", None)
+        if running is None:
+            running = _running.names = []
+        running.append(name)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            running.pop()
+            with _lock:
+                operation = _operations.get(name)
+                if operation is None:
+                    operation = _operations[name] = OperationStats(name)
+                operation.record(seconds, failed)
+    wrapper._measured = False
+    return wrapper
+
+def is_enabled() -> bool:
+    return _enabled
+
+def enable():
+    """Starts timing the measured methods and counting bytes."""
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        for cls in _classes:
+            _wrap(cls)
+
+def disable():
+    """Puts the original methods back, the numbers gathered so far are kept."""
+    global _enabled
+    if _enabled:
+        _enabled = False
+        for cls in _classes:
+            _unwrap(cls)
+
+def reset():
+    global _totals
+    with _lock:
+        _operations.clear()
+        _totals = OperationStats("total I/O")
+
+def _add_bytes(read: int, written: int):
+    with _lock:
+        _totals.bytes_read += read
+        _totals.bytes_written += written
+        # a read inside a measured call counts for that call and the calls it is nested in
+        for name in set(getattr(_running, "names", ())):
+            operation = _operations.get(name)
+            if operation is None:
+                operation = _operations[name] = OperationStats(name)
+            operation.bytes_read += read
+            operation.bytes_written += written
+
+def current_operations() -> tuple:
+    """
+        Returns the names of the measured calls in progress on this thread, for work they hand to another
+        thread (see credited_to).
+    """
+    return tuple(getattr(_running, "names", ())) if _enabled else ()
+
+@contextmanager
+def credited_to(names):
+    """
+        Counts the bytes read and written on this thread inside the block for the given operations too,
+        e.g. a background write for the calls that scheduled it. Only bytes are credited, not time.
+    """
+    running = getattr(_running, "names", None)
+    if running is None:
+        running = _running.names = []
+    running.extend(names)
+    try:
+        yield
+    finally:
+        del running[len(running) - len(names):]
+
+# the JSON storage reports the length of the text it reads and writes, which is the size in bytes for ASCII data
+def add_bytes_read(count: int):
+    if _enabled:
+        _add_bytes(count, 0)
+
+def add_bytes_written(count: int):
+    if _enabled:
+        _add_bytes(0, count)
+
+def snapshot() -> dict:
+    """
+        Returns:
+            dict: {"enabled", "operations": {name: counters}, "bytes_read", "bytes_written"}
+    """
+    with _lock:
+        return {
+            "enabled": _enabled,
+            "operations": {name: operation.to_dict() for name, operation in sorted(_operations.items())},
+            "bytes_read": _totals.bytes_read,
+            "bytes_written": _totals.bytes_written,
+        }
+
+def export(filename):
+    """Writes the current numbers to a JSON file."""
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=4)
+
+def report() -> str:
+    """Returns the current numbers as a table, the slowest operations (by total time) first."""
+    data = snapshot()
+    lines = [f"{'operation':<36}{'calls':>8}{'total ms':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'read':>11}{'written':>11}"]
+    for name, counters in sorted(data["operations"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"{name:<36}{counters['calls']:>8}{counters['total_ms']:>11.1f}{counters['p50_ms']:>9.3f}"
+            f"{counters['p95_ms']:>9.3f}{counters['p99_ms']:>9.3f}{counters['bytes_read']:>11}{counters['bytes_written']:>11}"
+        )
+    lines.append(f"Total bytes read: {data['bytes_read']}, written: {data['bytes_written']}")
+    return "\n".join(lines)
+
+# switched on for the whole run with MUSIC_STATS=1
+if os.environ.get("MUSIC_STATS", "") not in ("", "0"):
+    enable()
@@ -0,0 +1,906 @@
+from Journal import Journal, writeAtomically
+from Tracks import Tracks
+from WriteBehind import WriteBehind
+import LibraryCache
+import Stats
+import threading
+import hashlib
+import sqlite3
+import json
+import os
+
+def load_json(filename):
+    """Reads and parses a whole JSON file, counting the bytes read for Stats."""
+    with open(filename, "r") as f:
+        text = f.read()
+    Stats.add_bytes_read(len(text))
+    return json.loads(text)
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+        Yields the elements of a JSON array of objects one at a time while reading the file in chunks,
+        so the whole file and the whole list of dicts are never in memory at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip whitespace, the opening bracket and the separating commas
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not started)):
+            started = started or buffer[pos] == "["
+            pos += 1
+
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        if pos < len(buffer):
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                element = None
+            # an element that reaches the end of the buffer may continue in the next chunk
+            if element is not None and (end < len(buffer) or eof):
+                yield element
+                pos = end
+                continue
+        elif eof:
+            if not started:
+                return
+            raise json.JSONDecodeError("Unterminated array", buffer, pos)
+
+        chunk = f.read(chunk_size)
+        Stats.add_bytes_read(len(chunk))
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+class Storage:
+    """
+        Interface used by MusicLibrary, Playlist and Queue to persist their data.
+        Tracks, playlists and the queue are exchanged as the same dicts that are written to the JSON files,
+        e.g. a track is {"Title", "Artist", "Additional Artists", "Album", "Duration"}. Playlists and the queue
+        refer to library tracks by their stable id (Tracks.getId) in a "Track IDs" list.
+    """
+
+    def load_tracks(self):
+        """Yields every stored track dict. May yield the same track more than once."""
+        raise NotImplementedError
+
+    def append_track(self, track_data: dict):
+        """Persists one newly inserted track."""
+        raise NotImplementedError
+
+    def append_tracks(self, tracks_data: list[dict]):
+        """Persists a batch of newly inserted tracks at once."""
+        for track_data in tracks_data:
+            self.append_track(track_data)
+
+    def find_tracks(self, title=None, artist=None, album=None):
+        """
+            Returns the stored track dicts with the given normalized title, primary artist and/or album,
+            or None when the storage has no index to find them without reading the whole library.
+        """
+        return None
+
+    def has_track(self, track_id: str):
+        """
+            Returns whether a track with the given id (Tracks.getId) is stored, or None when the storage
+            cannot tell without reading the whole library.
+        """
+        return None
+
+    def needs_compaction(self) -> bool:
+        """Returns True when compact_tracks should be called to keep the storage small."""
+        return False
+
+    def compact_tracks(self, snapshot, background=False):
+        """
+            Rewrites the stored library from scratch.
+
+            Args:
+                snapshot (callable): returns all track dicts, called only if a rewrite is needed. It is called
+                    while appends to the storage wait, so it should only capture the tracks, e.g. return a
+                    generator over a copy of the list: the iterable is consumed while the new snapshot is written,
+                    on the background thread with background.
+                background (bool): do the writing on a background thread. Defaults to False.
+        """
+
+    def load_library_cache(self):
+        """
+            Returns (cached tracks payload, iterable of track dicts stored after it) when a cache of the library
+            (see LibraryCache) matches what is stored, or None when there is no usable cache.
+        """
+        return None
+
+    def save_library_cache(self, payload):
+        """
+            Stores a cache of the library as it is stored right now.
+
+            Args:
+                payload (dict or callable): the packed tracks (see LibraryCache.packTracks), or a callable returning
+                    them that is called after the storage has noted what the cache covers, so that tracks stored
+                    meanwhile are read again on top of the cache instead of being missed.
+        """
+
+    def library_cache_is_current(self) -> bool:
+        """Returns False when the stored library was rewritten since the cache was loaded or saved."""
+        return True
+
+    def get_library_stamp(self):
+        """
+            Returns a JSON-serializable mark of the stored library as it is right now, for load_tracks_since,
+            or None if the storage cannot tell what was stored after a point.
+        """
+        return None
+
+    def load_tracks_since(self, stamp):
+        """
+            Returns an iterable of the track dicts stored after get_library_stamp returned stamp, or None when
+            the library was rewritten since then and everything has to be read again with load_tracks.
+        """
+        return None
+
+    def get_playlist_names(self) -> list[str]:
+        raise NotImplementedError
+
+    def load_playlist(self, name):
+        """Returns the stored playlist dict or None if there is no playlist with that name."""
+        raise NotImplementedError
+
+    def save_playlist(self, name, playlist_data: dict):
+        raise NotImplementedError
+
+    def delete_playlist(self, name) -> bool:
+        """Deletes a playlist. Returns False if it did not exist."""
+        raise NotImplementedError
+
+    def load_queue(self):
+        """Returns the stored queue dict or None if no queue was saved."""
+        raise NotImplementedError
+
+    def save_queue(self, queue_data: dict):
+        """Stores a full snapshot of the queue, the changes recorded before it are dropped."""
+        raise NotImplementedError
+
+    def append_queue_change(self, change: dict):
+        """Persists one change made to the queue since the last save_queue."""
+        raise NotImplementedError
+
+    def load_queue_changes(self):
+        """Yields the queue changes recorded since the last save_queue, oldest first."""
+        raise NotImplementedError
+
+    def needs_queue_compaction(self) -> bool:
+        """Returns True when the queue should be saved again to keep its change log small."""
+        return False
+
+    def close(self):
+        """Finishes pending work and releases files or connections."""
+
+
+class JsonStorage(Storage):
+    """
+        Default storage: MusicLibrary.json snapshot with an append-only journal, one JSON file per playlist
+        in the Playlists directory and QueueState.json with a journal of the queue changes made since it was written.
+    """
+    # number of journal records after which the journal is folded into the snapshot
+    COMPACT_THRESHOLD = 10000
+    # number of queue changes after which the queue is saved again
+    QUEUE_COMPACT_THRESHOLD = 1000
+
+    def __init__(self, library_file="MusicLibrary.json", playlist_dir="Playlists", queue_file="QueueState.json",
+                 legacy_playlist_file="Playlist.json"):
+        self.library_file = library_file
+        self.playlist_dir = playlist_dir
+        self.queue_file = queue_file
+        self.legacy_playlist_file = legacy_playlist_file
+        self.__playlistIndex = None  # playlist name -> file name inside playlist_dir
+
+        # inserts are appended to the journal instead of rewriting the whole snapshot
+        base = os.path.splitext(library_file)[0]
+        self.__journal = Journal(base + ".journal")
+        self.__compactingFile = base + ".journal.compacting"
+        self.__lock = threading.Lock()
+        self.__compactThread = None
+        self.__compactLock = threading.Lock()
+        # queue changes are appended here between two saves of queue_file
+        self.__queueJournal = Journal(os.path.splitext(queue_file)[0] + ".journal")
+        # binary snapshot of the loaded library, see load_library_cache
+        self.__cacheFile = base + ".cache"
+        self.__cachedLibraryStat = None
+
+    def load_tracks(self):
+        """
+            Yields the snapshot, parsed incrementally, and then the journal records on top of it.
+            A journal left behind by an interrupted compaction is replayed as well, which can repeat
+            tracks already present in the snapshot.
+        """
+        try:
+            with open(self.library_file, "r", encoding="utf-8") as f:
+                yield from iter_json_array(f)
+        except FileNotFoundError:
+            pass
+
+        for journal in (Journal(self.__compactingFile), self.__journal):
+            for record in journal.replay():
+                if record.get("op") == "insert":
+                    yield record["track"]
+
+    def append_track(self, track_data: dict):
+        with self.__lock:
+            self.__journal.append({"op": "insert", "track": track_data})
+
+    def append_tracks(self, tracks_data: list[dict]):
+        with self.__lock:
+            self.__journal.extend({"op": "insert", "track": track_data} for track_data in tracks_data)
+
+    def needs_compaction(self) -> bool:
+        return self.__journal.getSize() >= self.COMPACT_THRESHOLD or os.path.exists(self.__compactingFile)
+
+    def compact_tracks(self, snapshot, background=False):
+        """
+            Folds the journal into a new snapshot of the library file and starts an empty journal.
+        """
+        # one compaction at a time, whichever thread asks for it, until __writeSnapshot is done
+        if not self.__compactLock.acquire(blocking=not background):
+            return
+        try:
+            with self.__lock:
+                # appends made from now on go to a fresh journal, the old one is kept until the snapshot is safe.
+                # The tracks are captured together with the journal, their dicts are built by __writeSnapshot
+                data = snapshot()
+                self.__journal.rotate(self.__compactingFile)
+        except BaseException:
+            self.__compactLock.release()
+            raise
+
+        if background:
+            self.__compactThread = threading.Thread(target=self.__writeSnapshot, args=(data,), daemon=True)
+            self.__compactThread.start()
+        else:
+            self.__writeSnapshot(data)
+
+    @staticmethod
+    def __stat(filename):
+        """returns (size, modification time in ns) of a file, or None if it does not exist"""
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def __hashFile(filename, length=None) -> str:
+        """returns the hash of the first length bytes of a file (all of it by default)"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filename, "rb") as f:
+            remaining = length if length is not None else float("inf")
+            while remaining > 0:
+                chunk = f.read(int(min(1 << 20, remaining)))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest.hexdigest()
+
+    def load_library_cache(self):
+        """
+            Uses MusicLibrary.cache when it was written from the current MusicLibrary.json: same size and either
+            the same modification time or, if only that changed, the same content hash. Inserts appended to
+            the journal after the cache was written are returned to be replayed on top of it.
+        """
+        if os.path.exists(self.__compactingFile):
+            return None
+        try:
+            with open(self.__cacheFile, "rb") as f:
+                blob = f.read()
+            Stats.add_bytes_read(len(blob))
+            cache = LibraryCache.loads(blob)
+            if cache.get("version") != LibraryCache.VERSION:
+                return None
+            library, journal = cache["library"], cache["journal"]
+        except Exception:
+            # a missing, truncated or foreign cache file only means a slower start
+            return None
+
+        stat = self.__stat(self.library_file)
+        if stat is None or stat[0] != library["size"]:
+            return None
+        if stat[1] != library["mtime_ns"] and self.__hashFile(self.library_file) != library["hash"]:
+            return None
+
+        # the journal only grows until the next compaction, what the cache saw must still be its beginning
+        journalStat = self.__stat(self.__journal.filename)
+        journalSize = journalStat[0] if journalStat is not None else 0
+        if journalSize < journal["size"]:
+            return None
+        if journal["size"] and self.__hashFile(self.__journal.filename, journal["size"]) != journal["hash"]:
+            return None
+
+        self.__cachedLibraryStat = stat
+        tail = (record["track"] for record in self.__journal.replay(journal["size"]) if record.get("op") == "insert")
+        return cache["tracks"], tail
+
+    def save_library_cache(self, payload):
+        with self.__lock:
+            if self.__compactThread is not None:
+                self.__compactThread.join()
+            if os.path.exists(self.__compactingFile):
+                return
+            stat = self.__stat(self.library_file)
+            if stat is None:
+                return
+            journalStat = self.__stat(self.__journal.filename)
+            journalSize = journalStat[0] if journalStat is not None else 0
+            cache = {
+                "version": LibraryCache.VERSION,
+                "library": {"size": stat[0], "mtime_ns": stat[1], "hash": self.__hashFile(self.library_file)},
+                "journal": {
+                    "size": journalSize,
+                    "hash": self.__hashFile(self.__journal.filename, journalSize) if journalSize else None
+                },
+            }
+        # packed without holding up appends, a compaction meanwhile changes the library file and the cache is not used
+        cache["tracks"] = payload() if callable(payload) else payload
+        writeAtomically(self.__cacheFile, LibraryCache.dumps(cache))
+        self.__cachedLibraryStat = stat
+
+    def library_cache_is_current(self) -> bool:
+        return self.__cachedLibraryStat is not None and self.__cachedLibraryStat == self.__stat(self.library_file)
+
+    def get_library_stamp(self):
+        """
+            The size and modification time of MusicLibrary.json and the size of the journal. A compaction
+            rewrites MusicLibrary.json, so the journal offset is only compared while the snapshot is the same.
+        """
+        with self.__lock:
+            if self.__compactThread is not None:
+                self.__compactThread.join()
+            if os.path.exists(self.__compactingFile):
+                return None
+            library = self.__stat(self.library_file)
+            journal = self.__stat(self.__journal.filename)
+            return {"library": list(library) if library is not None else None,
+                    "journal": journal[0] if journal is not None else 0}
+
+    def load_tracks_since(self, stamp):
+        if stamp is None or os.path.exists(self.__compactingFile):
+            return None
+        library = self.__stat(self.library_file)
+        if (list(library) if library is not None else None) != stamp["library"]:
+            return None
+        journal = self.__stat(self.__journal.filename)
+        if (journal[0] if journal is not None else 0) < stamp["journal"]:
+            return None
+        return (record["track"] for record in self.__journal.replay(stamp["journal"]) if record.get("op") == "insert")
+
+    def __writeSnapshot(self, data):
+        """writes the snapshot of compact_tracks and ends the compaction"""
+        try:
+            writeAtomically(self.library_file, self.__snapshotText(data))
+            if os.path.exists(self.__compactingFile):
+                os.remove(self.__compactingFile)
+        finally:
+            self.__compactLock.release()
+
+    @staticmethod
+    def __snapshotText(data):
+        """yields the text of json.dumps(data, indent=4) one track at a time, data can be any iterable of track dicts"""
+        first = True
+        for track_data in data:
+            yield ("[\n    " if first else ",\n    ") + json.dumps(track_data, indent=4).replace("\n", "\n    ")
+            first = False
+        yield "[]" if first else "\n]"
+
+    def __indexFile(self) -> str:
+        return os.path.join(self.playlist_dir, "index.json")
+
+    def __getPlaylistIndex(self) -> dict:
+        """
+            Loads the small name index of the playlist directory, creating it from the
+            old single-file Playlist.json the first time.
+        """
+        if self.__playlistIndex is None:
+            try:
+                self.__playlistIndex = load_json(self.__indexFile())
+            except FileNotFoundError:
+                self.__playlistIndex = {}
+                self.__migrateLegacyPlaylists()
+        return self.__playlistIndex
+
+    def __migrateLegacyPlaylists(self):
+        os.makedirs(self.playlist_dir, exist_ok=True)
+        try:
+            data = load_json(self.legacy_playlist_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+
+        for name, playlist_data in data.items():
+            self.__playlistIndex[name] = self.__playlistFileName(name)
+            writeAtomically(self.__playlistPath(name), json.dumps(playlist_data, indent=4))
+        self.__writePlaylistIndex()
+
+    @staticmethod
+    def __playlistFileName(name) -> str:
+        # names can contain any character, the digest keeps file names safe and unique
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()[:16] + ".json"
+
+    def __playlistPath(self, name) -> str:
+        return os.path.join(self.playlist_dir, self.__playlistIndex[name])
+
+    def __writePlaylistIndex(self):
+        writeAtomically(self.__indexFile(), json.dumps(self.__playlistIndex, indent=4))
+
+    def get_playlist_names(self) -> list[str]:
+        return list(self.__getPlaylistIndex().keys())
+
+    def load_playlist(self, name):
+        if name not in self.__getPlaylistIndex():
+            return None
+        try:
+            return load_json(self.__playlistPath(name))
+        except FileNotFoundError:
+            return None
+
+    def save_playlist(self, name, playlist_data: dict):
+        """
+            Writes only the file of this playlist. The index is rewritten only for a new playlist.
+        """
+        index = self.__getPlaylistIndex()
+        isNew = name not in index
+        if isNew:
+            index[name] = self.__playlistFileName(name)
+        writeAtomically(self.__playlistPath(name), json.dumps(playlist_data, indent=4))
+        if isNew:
+            self.__writePlaylistIndex()
+
+    def delete_playlist(self, name) -> bool:
+        index = self.__getPlaylistIndex()
+        if name not in index:
+            return False
+        path = self.__playlistPath(name)
+        del index[name]
+        self.__writePlaylistIndex()
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+    def load_queue(self):
+        try:
+            return load_json(self.queue_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_queue(self, queue_data: dict):
+        writeAtomically(self.queue_file, json.dumps(queue_data, indent=4))
+        # a crash before this point only leaves changes behind that the snapshot already covers
+        self.__queueJournal.clear()
+
+    def append_queue_change(self, change: dict):
+        self.__queueJournal.append(change)
+
+    def load_queue_changes(self):
+        return self.__queueJournal.replay()
+
+    def needs_queue_compaction(self) -> bool:
+        return self.__queueJournal.getSize() >= self.QUEUE_COMPACT_THRESHOLD
+
+    def close(self):
+        if self.__compactThread is not None:
+            self.__compactThread.join()
+        self.__journal.close()
+        self.__queueJournal.close()
+
+
+class SQLiteStorage(Storage):
+    """
+        Stores the library, the playlists and the queue in one SQLite database.
+        Every change is a point write, so nothing has to parse or rewrite the whole data set.
+        A track is stored once per id (Tracks.getId), inserting it again is ignored.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY,
+            uid TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            additional_artists TEXT NOT NULL,
+            album TEXT NOT NULL,
+            duration TEXT NOT NULL,
+            title_key TEXT NOT NULL,
+            artist_key TEXT NOT NULL,
+            album_key TEXT NOT NULL
+        );
+        -- the title index is in the order of load_tracks, so loading reads it instead of sorting
+        CREATE INDEX IF NOT EXISTS tracks_title ON tracks (title_key, artist_key, album_key);
+        CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist_key);
+        CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album_key);
+
+        CREATE TABLE IF NOT EXISTS playlists (
+            name TEXT PRIMARY KEY,
+            total_duration TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS playlist_entries (
+            playlist TEXT NOT NULL REFERENCES playlists (name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            track_uid TEXT NOT NULL REFERENCES tracks (uid),
+            PRIMARY KEY (playlist, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS queue_entries (
+            position INTEGER PRIMARY KEY,
+            track_uid TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS queue_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS queue_changes (
+            id INTEGER PRIMARY KEY,
+            change TEXT NOT NULL
+        );
+    """
+    # number of queue changes after which the queue is saved again
+    QUEUE_COMPACT_THRESHOLD = 1000
+
+    def __init__(self, filename="MusicLibrary.db"):
+        self.filename = filename
+        self.__db = sqlite3.connect(filename, check_same_thread=False)
+        self.__db.execute("PRAGMA foreign_keys = ON")
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.executescript(self.SCHEMA)
+
+    def import_from(self, source: Storage) -> bool:
+        """
+            Copies the library, the playlists and the queue of another storage (e.g. the JSON files used
+            before switching to SQLite) in one transaction. Only done once, into a database that is still empty.
+
+            Returns:
+                bool: True if anything was imported
+        """
+        version, = self.__db.execute("PRAGMA user_version").fetchone()
+        if version >= 1:
+            return False
+        empty = all(
+            self.__db.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table})").fetchone()[0]
+            for table in ("tracks", "playlists", "queue_state")
+        )
+        with self.__db:
+            if empty:
+                for track_data in source.load_tracks():
+                    self.__insertTrack(track_data)
+                for name in source.get_playlist_names():
+                    playlist_data = source.load_playlist(name)
+                    if playlist_data is not None:
+                        playlist_data = self.__withTrackIds(playlist_data, "Tracks")
+                        # ids of tracks that are not in the library never resolve, the entries reference tracks
+                        playlist_data["Track IDs"] = [uid for uid in playlist_data["Track IDs"] if self.has_track(uid)]
+                        self.__savePlaylist(name, playlist_data)
+                queue_data = source.load_queue()
+                if queue_data is not None:
+                    self.__saveQueue(self.__withTrackIds(queue_data, "tracks"))
+                    self.__db.executemany(
+                        "INSERT INTO queue_changes (change) VALUES (?)",
+                        ((json.dumps(change),) for change in source.load_queue_changes())
+                    )
+            self.__db.execute("PRAGMA user_version = 1")
+        return empty
+
+    def __withTrackIds(self, data: dict, legacyKey: str) -> dict:
+        """
+            returns the data with a "Track IDs" list, converting the track dicts stored before tracks had ids.
+            Tracks that are not in the library are added to it, so that their ids resolve.
+        """
+        if "Track IDs" in data:
+            return data
+        converted = {key: value for key, value in data.items() if key != legacyKey}
+        converted["Track IDs"] = []
+        for track_data in data.get(legacyKey, ()):
+            self.__insertTrack(track_data)
+            converted["Track IDs"].append(Tracks.makeId(track_data["Title"], track_data["Artist"], track_data["Album"]))
+        return converted
+
+    @staticmethod
+    def __key(text: str) -> str:
+        return text.strip().lower()
+
+    @staticmethod
+    def __rowToTrack(row) -> dict:
+        title, artist, additional_artists, album, duration = row
+        return {
+            "Title": title,
+            "Artist": artist,
+            "Additional Artists": json.loads(additional_artists),
+            "Album": album,
+            "Duration": duration
+        }
+
+    def __insertTrack(self, track_data: dict):
+        self.__db.execute(
+            "INSERT OR IGNORE INTO tracks (uid, title, artist, additional_artists, album, duration, title_key, artist_key, album_key)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                Tracks.makeId(track_data["Title"], track_data["Artist"], track_data["Album"]),
+                track_data["Title"],
+                track_data["Artist"],
+                json.dumps(track_data.get("Additional Artists", [])),
+                track_data["Album"],
+                track_data["Duration"],
+                self.__key(track_data["Title"]),
+                self.__key(track_data["Artist"]),
+                self.__key(track_data["Album"])
+            )
+        )
+
+    def load_tracks(self):
+        cursor = self.__db.execute(
+            "SELECT title, artist, additional_artists, album, duration FROM tracks ORDER BY title_key, artist_key, album_key"
+        )
+        for row in cursor:
+            yield self.__rowToTrack(row)
+
+    def get_library_stamp(self):
+        """The highest row id and the number of rows, rows are only ever added."""
+        rowid, count = self.__db.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM tracks").fetchone()
+        return {"rowid": rowid, "count": count}
+
+    def load_tracks_since(self, stamp):
+        if stamp is None or "rowid" not in stamp:
+            return None
+        count, = self.__db.execute("SELECT COUNT(*) FROM tracks WHERE id <= ?", (stamp["rowid"],)).fetchone()
+        if count != stamp["count"]:
+            return None
+        cursor = self.__db.execute(
+            "SELECT title, artist, additional_artists, album, duration FROM tracks WHERE id > ? ORDER BY id",
+            (stamp["rowid"],)
+        )
+        return [self.__rowToTrack(row) for row in cursor]
+
+    def append_track(self, track_data: dict):
+        with self.__db:
+            self.__insertTrack(track_data)
+
+    def append_tracks(self, tracks_data: list[dict]):
+        with self.__db:
+            for track_data in tracks_data:
+                self.__insertTrack(track_data)
+
+    def find_tracks(self, title=None, artist=None, album=None) -> list[dict]:
+        """Looks the tracks up in the title, artist or album index, by normalized title, primary artist and/or album."""
+        conditions, params = [], []
+        for column, value in (("title_key", title), ("artist_key", artist), ("album_key", album)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(self.__key(value))
+        query = "SELECT title, artist, additional_artists, album, duration FROM tracks"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return [self.__rowToTrack(row) for row in self.__db.execute(query + " ORDER BY title_key, artist_key, album_key", params)]
+
+    def has_track(self, track_id: str) -> bool:
+        # a lookup in the unique index on uid
+        return self.__db.execute("SELECT 1 FROM tracks WHERE uid = ? LIMIT 1", (track_id,)).fetchone() is not None
+
+    def get_playlist_names(self) -> list[str]:
+        return [row[0] for row in self.__db.execute("SELECT name FROM playlists ORDER BY rowid")]
+
+    def load_playlist(self, name):
+        row = self.__db.execute("SELECT total_duration FROM playlists WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        cursor = self.__db.execute(
+            "SELECT track_uid FROM playlist_entries WHERE playlist = ? ORDER BY position", (name,)
+        )
+        return {
+            "Playlist Name": name,
+            "Total Duration": row[0],
+            "Track IDs": [uid for uid, in cursor]
+        }
+
+    def save_playlist(self, name, playlist_data: dict):
+        with self.__db:
+            self.__savePlaylist(name, playlist_data)
+
+    def __savePlaylist(self, name, playlist_data: dict):
+        self.__db.execute(
+            "INSERT INTO playlists (name, total_duration) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET total_duration = excluded.total_duration",
+            (name, playlist_data["Total Duration"])
+        )
+        self.__db.execute("DELETE FROM playlist_entries WHERE playlist = ?", (name,))
+        self.__db.executemany(
+            "INSERT INTO playlist_entries (playlist, position, track_uid) VALUES (?, ?, ?)",
+            [(name, position, uid) for position, uid in enumerate(playlist_data["Track IDs"])]
+        )
+
+    def delete_playlist(self, name) -> bool:
+        with self.__db:
+            cursor = self.__db.execute("DELETE FROM playlists WHERE name = ?", (name,))
+        return cursor.rowcount > 0
+
+    def load_queue(self):
+        state = dict(self.__db.execute("SELECT key, value FROM queue_state"))
+        if not state:
+            return None
+        data = {key: json.loads(value) for key, value in state.items()}
+        cursor = self.__db.execute("SELECT track_uid FROM queue_entries ORDER BY position")
+        data["Track IDs"] = [uid for uid, in cursor]
+        return data
+
+    def save_queue(self, queue_data: dict):
+        with self.__db:
+            self.__saveQueue(queue_data)
+
+    def __saveQueue(self, queue_data: dict):
+        self.__db.execute("DELETE FROM queue_entries")
+        self.__db.executemany(
+            "INSERT INTO queue_entries (position, track_uid) VALUES (?, ?)",
+            list(enumerate(queue_data["Track IDs"]))
+        )
+        # keys a state does not have, e.g. the shuffle fields after unshuffling, must not survive from older saves
+        self.__db.execute("DELETE FROM queue_state")
+        self.__db.executemany(
+            "INSERT INTO queue_state (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in queue_data.items() if key != "Track IDs"]
+        )
+        self.__db.execute("DELETE FROM queue_changes")
+
+    def append_queue_change(self, change: dict):
+        with self.__db:
+            self.__db.execute("INSERT INTO queue_changes (change) VALUES (?)", (json.dumps(change),))
+
+    def load_queue_changes(self):
+        for change, in self.__db.execute("SELECT change FROM queue_changes ORDER BY id").fetchall():
+            yield json.loads(change)
+
+    def needs_queue_compaction(self) -> bool:
+        count, = self.__db.execute("SELECT COUNT(*) FROM queue_changes").fetchone()
+        return count >= self.QUEUE_COMPACT_THRESHOLD
+
+    def close(self):
+        self.__db.close()
+
+
+class WriteBehindStorage(Storage):
+    """
+        Wraps a storage so that its writes are made on a background thread (see WriteBehind) and the
+        library, playlists and queue never wait for the disk. Saves of the same playlist or of the queue
+        made in a burst are merged into one write of the latest state, journal appends keep their order.
+        Every read first waits for the pending writes, so it sees them.
+    """
+    def __init__(self, storage: Storage, delay=None):
+        self.storage = storage
+        self.writer = WriteBehind(delay)
+
+    def __getattr__(self, name):
+        # attributes and methods that only one kind of storage has, e.g. JsonStorage.library_file
+        return getattr(self.storage, name)
+
+    def load_tracks(self):
+        self.writer.flush()
+        return self.storage.load_tracks()
+
+    def append_track(self, track_data: dict):
+        self.writer.submit(lambda: self.storage.append_track(track_data))
+
+    def append_tracks(self, tracks_data: list[dict]):
+        tracks_data = list(tracks_data)
+        self.writer.submit(lambda: self.storage.append_tracks(tracks_data))
+
+    def __answers(self, method) -> bool:
+        """returns False if the storage keeps the Storage method that always answers None"""
+        return getattr(type(self.storage), method) is not getattr(Storage, method)
+
+    def find_tracks(self, title=None, artist=None, album=None):
+        # a storage without an index answers None anyway, it is not worth waiting for the writes
+        if not self.__answers("find_tracks"):
+            return None
+        self.writer.flush()
+        return self.storage.find_tracks(title, artist, album)
+
+    def has_track(self, track_id: str):
+        if not self.__answers("has_track"):
+            return None
+        self.writer.flush()
+        return self.storage.has_track(track_id)
+
+    def needs_compaction(self) -> bool:
+        return self.storage.needs_compaction()
+
+    def compact_tracks(self, snapshot, background=False):
+        # the new snapshot must come after the appends it contains
+        self.writer.flush()
+        self.storage.compact_tracks(snapshot, background)
+
+    def load_library_cache(self):
+        self.writer.flush()
+        return self.storage.load_library_cache()
+
+    def save_library_cache(self, payload):
+        # the cache records how far the journal went, so the appends of the cached tracks are made first
+        self.writer.flush()
+        self.storage.save_library_cache(payload)
+
+    def library_cache_is_current(self) -> bool:
+        return self.storage.library_cache_is_current()
+
+    def get_library_stamp(self):
+        # the stamp has to come after the appends made so far
+        self.writer.flush()
+        return self.storage.get_library_stamp()
+
+    def load_tracks_since(self, stamp):
+        self.writer.flush()
+        return self.storage.load_tracks_since(stamp)
+
+    def get_playlist_names(self) -> list[str]:
+        self.writer.flush()
+        return self.storage.get_playlist_names()
+
+    def load_playlist(self, name):
+        self.writer.flush()
+        return self.storage.load_playlist(name)
+
+    def save_playlist(self, name, playlist_data: dict):
+        self.writer.mark_dirty(("playlist", name), lambda: self.storage.save_playlist(name, playlist_data))
+
+    def delete_playlist(self, name) -> bool:
+        self.writer.flush()
+        return self.storage.delete_playlist(name)
+
+    def load_queue(self):
+        self.writer.flush()
+        return self.storage.load_queue()
+
+    def save_queue(self, queue_data: dict):
+        self.writer.mark_dirty(("queue",), lambda: self.storage.save_queue(queue_data))
+
+    def append_queue_change(self, change: dict):
+        self.writer.submit(lambda: self.storage.append_queue_change(change))
+
+    def load_queue_changes(self):
+        self.writer.flush()
+        return self.storage.load_queue_changes()
+
+    def needs_queue_compaction(self) -> bool:
+        # the journal only shrinks once the pending save is made, asking again would only save again
+        return not self.writer.is_pending(("queue",)) and self.storage.needs_queue_compaction()
+
+    def close(self):
+        """Makes the pending writes and closes the wrapped storage."""
+        try:
+            self.writer.close()
+        finally:
+            self.storage.close()
+
+
+_default = None
+
+def default_storage() -> Storage:
+    """
+        Returns the storage shared by the library, the playlists and the queue.
+        JSON files are used unless the MUSIC_STORAGE environment variable is set to "sqlite", in which case
+        a new database is filled from the JSON files the first time.
+        Writes are made in the background (see WriteBehindStorage) unless MUSIC_WRITE_BEHIND is set to 0.
+    """
+    global _default
+    if _default is None:
+        if os.environ.get("MUSIC_STORAGE", "json").lower() == "sqlite":
+            _default = SQLiteStorage()
+            # the first time SQLite is used it starts with what the JSON files hold
+            legacy = JsonStorage()
+            try:
+                _default.import_from(legacy)
+            finally:
+                legacy.close()
+        else:
+            _default = JsonStorage()
+        if os.environ.get("MUSIC_WRITE_BEHIND", "1") != "0":
+            _default = WriteBehindStorage(_default)
+    return _default
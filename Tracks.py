@@ -1,15 +1,98 @@
+import hashlib
+import sys
+
 class Tracks:
+    # no per instance __dict__, a large library holds one of these per track
+    __slots__ = ("__title", "__artist", "__album", "__duration", "__additional_artists", "__durationSeconds", "__sortKey", "__id")
+
     def __init__(self, title, artist, album, duration, additional_artists=None):
+        # artists, albums and durations repeat across many tracks so they share one string object
         self.__title = title
-        self.__artist = artist 
-        self.__album = album 
-        self.__duration = duration
-        self.__additional_artists = additional_artists if additional_artists is not None else []
+        self.__artist = sys.intern(artist)
+        self.__album = sys.intern(album)
+        self.__duration = sys.intern(duration)
+        self.__additional_artists = tuple(sys.intern(a) for a in additional_artists) if additional_artists else ()
+
+        # computed once here so that sorting and comparing never re-parse or re-normalize strings
+        self.__durationSeconds = Tracks.parseDuration(duration)
+        self.__updateSortKey()
+        # computed on the first getId, loading a library does not need the ids
+        self.__id = None
 
-        self.newTrack = {
+    @staticmethod
+    def fromData(track_data: dict) -> 'Tracks':
+        """returns a track from a dict in the MusicLibrary.json format"""
+        return Tracks(
+            track_data["Title"],
+            track_data["Artist"],
+            track_data["Album"],
+            track_data["Duration"],
+            track_data.get("Additional Artists", [])  # Default to empty list
+        )
+
+    @staticmethod
+    def fromStored(track_data: dict) -> 'Tracks':
+        """
+            returns a track from a dict read back from the storage. Unlike fromData a duration that is not mm:ss
+            (e.g. edited by hand) does not make the whole library unreadable, it is kept as it is and counts as
+            unknown, 0 seconds
+        """
+        try:
+            return Tracks.fromData(track_data)
+        except (ValueError, AttributeError):
+            # raises again if the duration was not the problem
+            track = Tracks.fromData({**track_data, "Duration": "00:00"})
+        track.__duration = sys.intern(str(track_data["Duration"]))
+        return track
+
+    @staticmethod
+    def parseDuration(duration: str) -> int:
+        """returns the number of seconds of a mm:ss duration, raises ValueError if it is not one"""
+        minutes, seconds = duration.split(":")
+        return int(minutes) * 60 + int(seconds)
+
+    @staticmethod
+    def storedDurationSeconds(duration) -> int:
+        """returns the number of seconds of a stored duration, 0 if it is not mm:ss (see fromStored)"""
+        try:
+            return Tracks.parseDuration(duration)
+        except (ValueError, AttributeError):
+            return 0
+
+    @staticmethod
+    def fromCache(title, artist, album, duration, additional_artists: tuple, durationSeconds: int, sortKey: tuple) -> 'Tracks':
+        """
+            returns a track rebuilt from already validated and normalized fields (see LibraryCache),
+            skipping the parsing and normalizing done by the constructor
+        """
+        track = Tracks.__new__(Tracks)
+        track.__title = title
+        track.__artist = artist
+        track.__album = album
+        track.__duration = duration
+        track.__additional_artists = additional_artists
+        track.__durationSeconds = durationSeconds
+        track.__sortKey = sortKey
+        track.__id = None
+        return track
+
+    def __updateSortKey(self):
+        self.__sortKey = (
+            Tracks.normalize(self.__title),
+            sys.intern(Tracks.normalize(self.getArtist())),
+            sys.intern(Tracks.normalize(self.__album)),
+            self.__durationSeconds
+        )
+
+    @property
+    def newTrack(self) -> dict:
+        """
+            returns the track as the dict written to the JSON files, built only when it is needed
+        """
+        return {
         "Title": self.__title,
         "Artist": self.__artist,
-        "Additional Artists": self.__additional_artists,
+        "Additional Artists": list(self.__additional_artists),
         "Album": self.__album,
         "Duration": self.__duration
         }
@@ -24,17 +107,30 @@ class Tracks:
         """Returns a formatted string of the primary artist and additional artists."""
         if self.__additional_artists:
             # Join all artists into a single string
-            artists = [self.__artist] + self.__additional_artists
+            artists = [self.__artist, *self.__additional_artists]
             return ", ".join(artists)
         else:
             return self.__artist
     
+    def getPrimaryArtist(self) -> str:
+        """
+            returns the primary artist only
+        """
+        return self.__artist
+
+    def getAdditionalArtists(self) -> list[str]:
+        """
+            returns the list of additional artists
+        """
+        return list(self.__additional_artists)
+
     def addAdditionalArtist(self, artist: str):
         """
             Add an additional artist to the track.
         """
         if artist not in self.__additional_artists:
-            self.__additional_artists.append(artist)
+            self.__additional_artists += (sys.intern(artist),)
+            self.__updateSortKey()
     
     def getAlbumName(self) -> str:
         """
@@ -48,28 +144,72 @@ class Tracks:
         """
         return self.__duration
 
+    def getDurationSeconds(self) -> int:
+        """
+            returns track duration in seconds
+        """
+        return self.__durationSeconds
+
     def getNumericDuration(self):
         """
-            returns track duration in list form integers
+            returns track duration in list form integers [minutes, seconds]
+        """
+        return list(divmod(self.__durationSeconds, 60))
+
+    def getIdentityKey(self) -> tuple:
+        """
+            returns (normalized title, normalized primary artist, normalized album),
+            two tracks with the same identity key are the same song
+        """
+        return (self.__sortKey[0], Tracks.normalize(self.__artist), self.__sortKey[2])
+
+    def getId(self) -> str:
+        """
+            returns the stable id of the track, derived from its identity key so it is the same
+            on every run and in every storage without being stored. Computed once per track, the
+            identity (title, primary artist, album) never changes.
+        """
+        if self.__id is None:
+            self.__id = Tracks.__hashIdentity(self.getIdentityKey())
+        return self.__id
+
+    @staticmethod
+    def makeId(title: str, artist: str, album: str) -> str:
+        """
+            returns the stable id of the track with the given title, primary artist and album
+        """
+        return Tracks.__hashIdentity(tuple(Tracks.normalize(text) for text in (title, artist, album)))
+
+    @staticmethod
+    def __hashIdentity(identity: tuple) -> str:
+        return hashlib.sha1("\x1f".join(identity).encode("utf-8")).hexdigest()[:16]
+
+    def getSortKey(self) -> tuple:
         """
-        #mm:ss
-        colon = self.getDuration().index(":")
-        minutes = int(self.getDuration()[0:colon])
-        seconds = int(self.getDuration()[colon+1:])
-        return [minutes, seconds]   
+            returns the key the library is sorted by:
+            (normalized title, normalized artists, normalized album, duration in seconds)
+        """
+        return self.__sortKey
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+            returns the normalized form of a text used for searching and indexing
+        """
+        return text.strip().lower()
 
     def CompareTrack(track1: 'Tracks', track2: 'Tracks', comparison: int=0):
-        """Compares the names of two different contacts. 
+        """Compares one field of two different tracks using their precomputed sort keys.
         
         Args:
-            c1 (Contact): Contact 1
-            c2 (Contact): Contact 2
-            comparison_type (int): 0 to compare last names. 1 to compare first names. Defaults to 0.
+            track1 (Tracks): Track 1
+            track2 (Tracks): Track 2
+            comparison (int): 0 to compare titles, 1 artists, 2 album names, 3 durations. Defaults to 0.
  
         Returns:
-            int: 1 if name value of c1 > c2.
-            0 if both contacts have same name value.
-            -1 if name value of c1 < c2.
+            int: 1 if the value of track1 > track2.
+            0 if both tracks have the same value.
+            -1 if the value of track1 < track2.
         """
 
         """
@@ -78,22 +218,15 @@ class Tracks:
                 - True is 1
                 - False is 0
 
-                - returns 1 if (c1 name value > c2 name value) is True since 1 - 0 == 1
+                - returns 1 if (t1 value > t2 value) is True since 1 - 0 == 1
                 on the other hand
-                - returns -1 if (c1 name value < c2 name value) is True since 1 - 0 == 1
+                - returns -1 if (t1 value < t2 value) is True since 1 - 0 == 1
                 - return 0 if they are both false since 0 - 0 == 0
         """
-
-        #compare last names
-        if comparison == 0:
-            return (track1.getTitle()> track2.getTitle()) - (track1.getTitle()< track2.getTitle())
-        #compare first names
-        elif comparison == 1:
-            return (track1.getArtist()> track2.getArtist()) - (track1.getArtist() < track2.getArtist())
-        elif comparison == 2:
-            return (track1.getAlbumName()> track2.getAlbumName()) - (track1.getAlbumName() < track2.getAlbumName())
-        elif comparison == 3:
-            return (track1.getNumericDuration()[0]> track2.getNumericDuration()[0]) - (track1.getNumericDuration()[0] < track2.getNumericDuration()[0])
+        if 0 <= comparison <= 3:
+            value1 = track1.getSortKey()[comparison]
+            value2 = track2.getSortKey()[comparison]
+            return (value1 > value2) - (value1 < value2)
         return -1
 
     def __str__(self):
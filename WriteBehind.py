@@ -0,0 +1,140 @@
+import Stats
+import atexit
+import itertools
+import threading
+import time
+
+class WriteError(RuntimeError):
+    """A write made on the background thread failed. Raised by the next flush, the cause is the original error."""
+
+class WriteBehind:
+    """
+        Makes writes on a background thread so that the caller never waits for the disk.
+
+        A write is a callable. Writes run in the order they were scheduled, but a write scheduled under a key
+        replaces the pending write with the same key, so a burst of saves of one playlist or of the queue
+        ends in a single write of its latest state. A batch is written once no write has come in for
+        `delay` seconds, at most `max_delay` seconds after the first write of the batch, or at once on flush.
+        The bytes a write reads and writes are counted in Stats for the measured calls that scheduled it.
+    """
+    DELAY = 0.2
+    MAX_DELAY = 2.0
+
+    def __init__(self, delay=None, max_delay=None, name="write-behind"):
+        self.delay = self.DELAY if delay is None else delay
+        self.max_delay = self.MAX_DELAY if max_delay is None else max_delay
+        self.scheduled = 0  # writes handed in
+        self.written = 0    # writes made, lower than scheduled by the number of merged writes
+
+        self.__pending = {}  # key -> (write, names of the measured calls that scheduled it), in the order they run
+        self.__unique = itertools.count()
+        self.__condition = threading.Condition()
+        self.__first = None  # time of the first and of the last write of the pending batch
+        self.__last = None
+        self.__busy = False
+        self.__flushing = 0
+        self.__closed = False
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+        # the thread is a daemon, pending writes are made when the program exits without close()
+        atexit.register(self.close)
+
+    def mark_dirty(self, key, write):
+        """
+            Schedules write, replacing the pending write with the same key. The write moves to the end
+            of the batch, after everything scheduled before it.
+        """
+        operations = Stats.current_operations()
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The writer is closed")
+            replaced = self.__pending.pop(key, None)
+            if replaced is not None:
+                # the write stands for the replaced one too
+                operations = tuple(dict.fromkeys(replaced[1] + operations))
+            self.__pending[key] = (write, operations)
+            self.scheduled += 1
+            self.__last = time.monotonic()
+            if self.__first is None:
+                self.__first = self.__last
+            self.__condition.notify_all()
+
+    def submit(self, write):
+        """Schedules a write that is never merged with another one, e.g. an append to a journal."""
+        self.mark_dirty(("unique", next(self.__unique)), write)
+
+    def has_pending(self) -> bool:
+        with self.__condition:
+            return bool(self.__pending) or self.__busy
+
+    def is_pending(self, key) -> bool:
+        """returns True if a write with this key is scheduled and not started yet"""
+        with self.__condition:
+            return key in self.__pending
+
+    def flush(self):
+        """
+            Blocks until every write scheduled so far has been made. Re-raises the error of a write that failed.
+        """
+        if threading.current_thread() is self.__thread:
+            return
+        with self.__condition:
+            self.__flushing += 1
+            self.__condition.notify_all()
+            try:
+                while self.__pending or self.__busy:
+                    self.__condition.wait()
+            finally:
+                self.__flushing -= 1
+            error, self.__error = self.__error, None
+        if error is not None:
+            raise WriteError(f"A background write failed: {error}") from error
+
+    def close(self):
+        """Makes the pending writes and stops the thread."""
+        with self.__condition:
+            if self.__closed:
+                return
+        try:
+            self.flush()
+        finally:
+            with self.__condition:
+                self.__closed = True
+                self.__condition.notify_all()
+            self.__thread.join()
+            atexit.unregister(self.close)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                # let a burst of changes settle so that it is written once
+                while not self.__flushing and not self.__closed:
+                    remaining = min(self.__last + self.delay, self.__first + self.max_delay) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+                batch = list(self.__pending.values())
+                self.__pending.clear()
+                self.__first = self.__last = None
+                self.__busy = True
+
+            try:
+                for write, operations in batch:
+                    try:
+                        with Stats.credited_to(operations):
+                            write()
+                    except Exception as e:
+                        # the other writes are still made, the first error is raised by the next flush
+                        with self.__condition:
+                            if self.__error is None:
+                                self.__error = e
+            finally:
+                with self.__condition:
+                    self.written += len(batch)
+                    self.__busy = False
+                    self.__condition.notify_all()
@@ -0,0 +1,291 @@
+"""
+    Benchmarks of the library, playlist and queue hot paths on synthetic data (see generate_catalog.py).
+
+    Every benchmark runs at each requested library size in a fresh temporary directory, so the project's own
+    data files are never touched. For each operation the throughput, the p50/p99 latency and the peak memory
+    of the process are reported, and the results can be saved as JSON and compared with an earlier run:
+
+        python benchmark.py --sizes 1000 10000 --output before.json
+        python benchmark.py --sizes 1000 10000 --output after.json
+        python benchmark.py --compare before.json after.json
+"""
+from MusicLibrary import MusicLibrary
+from Playlist import Playlist
+from queuesC import Queue
+from Storage import JsonStorage
+from generate_catalog import CatalogGenerator
+from Tracks import Tracks
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# number of timed calls per benchmark, capped by what the library size allows
+LOAD_ROUNDS = 3
+INSERTS = 1000
+LOOKUPS = 10000
+PLAYLIST_SIZE = 1000
+PLAYLIST_ROUNDS = 50
+SHUFFLES = 200
+DEQUEUES = 1000
+
+def reset_peak_memory() -> int:
+    """
+        Resets the peak resident set size of the process where Linux allows it and returns the current size in bytes.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return read_memory()[0]
+
+def read_memory():
+    """returns (current, peak) resident set size of the process in bytes"""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError):
+        # without /proc only the peak since the start of the process is known
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return peak, peak
+
+class Timer:
+    """Collects the latency of each timed call of one benchmark."""
+    def __init__(self):
+        self.latencies = []
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.latencies.append(time.perf_counter() - self.__start)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class UncachedJsonStorage(JsonStorage):
+    """JsonStorage without the library cache, so every load parses MusicLibrary.json like before the cache existed."""
+    def load_library_cache(self):
+        return None
+
+    def save_library_cache(self, payload: dict):
+        pass
+
+class Benchmark:
+    """
+        Runs the benchmarks at one library size in a temporary directory and collects their results.
+    """
+    def __init__(self, size: int, directory: str, seed=0):
+        self.size = size
+        self.directory = directory
+        self.rng = random.Random(seed)
+        self.results = []
+        self.catalog = CatalogGenerator(size, seed)
+        self.catalog.write_library(self.path("MusicLibrary.json"))
+        self.storage = self.new_storage()
+        self.library = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def new_storage(self, cached=True) -> JsonStorage:
+        return (JsonStorage if cached else UncachedJsonStorage)(
+            library_file=self.path("MusicLibrary.json"), playlist_dir=self.path("Playlists"),
+            queue_file=self.path("QueueState.json"), legacy_playlist_file=self.path("Playlist.json")
+        )
+
+    def measure(self, name: str, run, items_per_call=1):
+        """
+            Calls run(timer), which times each of its calls with `with timer:`, and records the result.
+            Throughput is items per second of timed work; items_per_call counts e.g. tracks loaded per call.
+        """
+        timer = Timer()
+        baseline = reset_peak_memory()
+        run(timer)
+        peak = read_memory()[1]
+
+        latencies = timer.latencies
+        total = sum(latencies)
+        result = {
+            "benchmark": name,
+            "size": self.size,
+            "calls": len(latencies),
+            "seconds": total,
+            "throughput": len(latencies) * items_per_call / total if total else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "peak_rss_bytes": peak,
+            "peak_rss_increase_bytes": max(0, peak - baseline),
+        }
+        self.results.append(result)
+        print_result(result)
+        return result
+
+    def run_all(self):
+        # the cold load is what a start without MusicLibrary.cache costs, and what results from before the cache measured
+        self.measure("load_library", self.load_library, self.size)
+        self.measure("load_library_cached", self.load_library_cached, self.size)
+        self.measure("get_track_with_title", self.get_track_with_title)
+        self.measure("insert_track", self.insert_track)
+        self.measure("save_playlist", self.save_playlist)
+        self.measure("load_playlist", self.load_playlist)
+        self.measure("shuffle_queue", self.shuffle_queue)
+        self.measure("dequeue", self.dequeue)
+        self.library.close()
+        return self.results
+
+    def load_library(self, timer):
+        for _ in range(LOAD_ROUNDS):
+            if self.library is not None:
+                self.library.close()
+            self.storage = self.new_storage(cached=False)
+            with timer:
+                self.library = MusicLibrary(self.storage)
+
+    def load_library_cached(self, timer):
+        # the first load writes the cache, the timed ones read it
+        self.library.close()
+        self.storage = self.new_storage()
+        self.library = MusicLibrary(self.storage)
+        for _ in range(LOAD_ROUNDS):
+            self.library.close()
+            self.storage = self.new_storage()
+            with timer:
+                self.library = MusicLibrary(self.storage)
+
+    def get_track_with_title(self, timer):
+        titles = [self.catalog.track(self.rng.randrange(self.size))["Title"] for _ in range(LOOKUPS)]
+        for title in titles:
+            with timer:
+                self.library.getTrackWithTitle(title)
+
+    def insert_track(self, timer):
+        tracks = [Tracks(f"New Track {i}", "New Artist", "New Album", "03:00") for i in range(INSERTS)]
+        for track in tracks:
+            with timer:
+                self.library.insertTrackToLibrary(track)
+
+    def playlist_tracks(self):
+        tracks = self.library.getMusicLibrary()
+        return self.rng.sample(tracks, min(PLAYLIST_SIZE, len(tracks)))
+
+    def save_playlist(self, timer):
+        playlist = Playlist("Benchmark", self.storage)
+        with playlist.edit():
+            playlist.add_tracks(self.playlist_tracks())
+        for _ in range(PLAYLIST_ROUNDS):
+            with timer:
+                playlist.save_playlist()
+
+    def load_playlist(self, timer):
+        for _ in range(PLAYLIST_ROUNDS):
+            with timer:
+                Playlist.load_playlist("Benchmark", self.library, self.storage)
+
+    def full_queue(self) -> Queue:
+        queue = Queue(self.storage)
+        everything = Playlist("Everything", self.storage)
+        everything.tracks = self.library.getMusicLibrary()
+        queue.enqueue_playlist(everything)
+        queue.save_queue()
+        return queue
+
+    def shuffle_queue(self, timer):
+        queue = self.full_queue()
+        for _ in range(SHUFFLES):
+            # shuffling on and off, with a few tracks played in between
+            with timer:
+                queue.shuffle_queue()
+            for _ in range(10):
+                queue.next_track()
+            with timer:
+                queue.shuffle_queue()
+
+    def dequeue(self, timer):
+        queue = self.full_queue()
+        for _ in range(min(DEQUEUES, len(queue.tracks))):
+            queue.jump_to(self.rng.randrange(len(queue.tracks)))
+            with timer:
+                queue.dequeue()
+
+def print_result(result):
+    print(f"{result['benchmark']:<22}{result['size']:>10}{result['calls']:>8}"
+          f"{result['throughput']:>14.1f}/s{result['p50_ms']:>11.3f}ms{result['p99_ms']:>11.3f}ms"
+          f"{result['peak_rss_increase_bytes'] / 2 ** 20:>10.1f}MiB")
+
+def run(sizes, seed=0):
+    print(f"{'benchmark':<22}{'size':>10}{'calls':>8}{'throughput':>16}{'p50':>13}{'p99':>13}{'peak +':>13}")
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="music-benchmark-") as directory:
+            results.extend(Benchmark(size, directory, seed).run_all())
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+def compare(before, after, threshold=0.20) -> bool:
+    """
+        Prints the change of every benchmark measured in both runs.
+        A benchmark regressed when its p50 latency or its peak memory grew by more than threshold.
+
+        Returns:
+            bool: True if nothing regressed.
+    """
+    baseline = {(result["benchmark"], result["size"]): result for result in before["results"]}
+    ok = True
+    print(f"{'benchmark':<22}{'size':>10}{'p50 before':>14}{'p50 after':>14}{'change':>9}{'peak change':>13}")
+    for result in after["results"]:
+        old = baseline.get((result["benchmark"], result["size"]))
+        if old is None:
+            continue
+        latency = result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        memory = (result["peak_rss_bytes"] / old["peak_rss_bytes"] - 1) if old["peak_rss_bytes"] else 0.0
+        regressed = latency > threshold or memory > threshold
+        ok = ok and not regressed
+        print(f"{result['benchmark']:<22}{result['size']:>10}{old['p50_ms']:>12.3f}ms{result['p50_ms']:>12.3f}ms"
+              f"{latency:>+9.1%}{memory:>+13.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the music library, playlists and queue.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="library sizes to run at")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data and the random choices")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two saved runs instead of running, exits with 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="relative growth of p50 latency or peak memory counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        runs = []
+        for filename in args.compare:
+            with open(filename, "r", encoding="utf-8") as f:
+                runs.append(json.load(f))
+        return 0 if compare(*runs, threshold=args.threshold) else 1
+
+    report = run(args.sizes, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
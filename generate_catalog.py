@@ -0,0 +1,262 @@
+"""
+    Writes a synthetic catalog (MusicLibrary.json, Playlist.json and QueueState.json) for load testing.
+
+    The output only depends on the options and the seed, so the same command always produces the same files.
+    Every track is a pure function of its number, which lets the files be streamed one track at a time and
+    lets playlists and the queue pick tracks anywhere in the library, so millions of tracks can be written
+    without holding them in memory:
+
+        python generate_catalog.py --tracks 1000000 --playlists 200 --queue-size 5000 --output-dir data
+"""
+from Tracks import Tracks
+from array import array
+import argparse
+import bisect
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+
+WORDS = [
+    "Golden", "River", "Midnight", "Echo", "Silver", "Heart", "Summer", "Rain", "Electric", "Dream", "Broken", "Fire",
+    "Neon", "Ocean", "Wild", "Shadow", "Paper", "Moon", "Velvet", "Road", "Crystal", "Storm", "Lonely", "City",
+    "Sweet", "Light", "Hollow", "Stars", "Blue", "Garden", "Fading", "Thunder", "Little", "Wings", "Northern", "Sky",
+    "Glass", "Horizon", "Secret", "Waves", "Burning", "Night", "Quiet", "Desert", "Faded", "Ghost", "Sugar", "Skin",
+    "Endless", "Memory", "Bright", "Island", "Cold", "Fever", "Tender", "Highway", "Crimson", "Shore", "Lost", "Signal",
+    "Young", "Kingdom", "Running", "Home",
+]
+FIRST_NAMES = [
+    "Ava", "Leo", "Mia", "Noah", "Luna", "Kai", "Zoe", "Eli", "Nina", "Omar", "Iris", "Jude", "Ruby", "Axel", "Lila", "Theo",
+    "Maya", "Finn", "Nora", "Remy", "Cleo", "Milo", "Sade", "Ezra", "Juno", "Otis", "Vera", "Hugo", "Tess", "Ivan", "Lena", "Rio",
+]
+LAST_NAMES = [
+    "Hart", "Vale", "Cruz", "Stone", "Reyes", "Frost", "Lane", "Moreau", "Kim", "Wolfe", "Sato", "Blake", "Rivers", "Quinn",
+    "Okafor", "Marsh", "Ibarra", "Cole", "Novak", "Lindqvist", "Shah", "Brooks", "Ferreira", "Hale", "Duval", "Park", "Nyx",
+    "Ward", "Costa", "Fox", "Rossi", "Grey",
+]
+
+def spell(number: int, words: list[str], count: int) -> list[str]:
+    """returns number written with count digits in base len(words), one word per digit"""
+    digits = []
+    for _ in range(count):
+        number, digit = divmod(number, len(words))
+        digits.append(words[digit])
+    return digits
+
+def digits_needed(count: int, base: int, minimum=2) -> int:
+    """returns the number of base digits needed to give count different values, at least minimum"""
+    digits = minimum
+    while base ** digits < count:
+        digits += 1
+    return digits
+
+class ZipfSampler:
+    """
+        Picks 0..n-1 with the probability of k proportional to 1 / (k + 1) ** exponent,
+        so a few artists (or albums) get most of the tracks, as in a real catalog.
+    """
+    def __init__(self, n: int, exponent: float):
+        self.__cumulative = array("d", itertools.accumulate((k + 1) ** -exponent for k in range(n)))
+
+    def sample(self, uniform: float) -> int:
+        """maps a uniform number in [0, 1) to a rank"""
+        return min(len(self.__cumulative) - 1, bisect.bisect_right(self.__cumulative, uniform * self.__cumulative[-1]))
+
+class CatalogGenerator:
+    """
+        Deterministic synthetic catalog in the project's JSON schema.
+
+        Args:
+            tracks (int): number of tracks in the library.
+            seed (int): the same seed gives the same catalog.
+            artists (int): number of distinct artists. Defaults to one per 10 tracks.
+            albums_per_artist (int): maximum number of albums of an artist.
+            zipf_exponent (float): skew of the artist and album popularity, 0 is uniform.
+            additional_artist_rate (float): share of tracks featuring one or two additional artists.
+            duplicate_title_rate (float): share of tracks reusing the title of another track, by another artist
+                or on another album so that every track still has its own id.
+    """
+    def __init__(self, tracks=10000, seed=0, artists=None, albums_per_artist=8, zipf_exponent=1.1,
+                 additional_artist_rate=0.1, duplicate_title_rate=0.05):
+        self.tracks = tracks
+        self.seed = seed
+        self.artists = artists if artists is not None else max(1, tracks // 10)
+        self.albums_per_artist = max(1, albums_per_artist)
+        self.additional_artist_rate = additional_artist_rate
+        self.duplicate_title_rate = duplicate_title_rate
+
+        self.__artistSampler = ZipfSampler(self.artists, zipf_exponent)
+        self.__albumSampler = ZipfSampler(self.albums_per_artist, zipf_exponent)
+        self.__titleWords = digits_needed(tracks, len(WORDS))
+        self.__albumWords = digits_needed(self.artists * self.albums_per_artist, len(WORDS))
+        self.__nameWords = digits_needed(-(-self.artists // len(FIRST_NAMES)), len(LAST_NAMES), minimum=1)
+
+    def __uniforms(self, kind: str, number: int) -> list[float]:
+        """returns 12 uniform numbers in [0, 1) that only depend on the seed, the kind and the number"""
+        digest = hashlib.blake2b(f"{self.seed}:{kind}:{number}".encode(), digest_size=48).digest()
+        return [int.from_bytes(digest[i:i + 4], "big") / 2 ** 32 for i in range(0, 48, 4)]
+
+    @staticmethod
+    def __scramble(number: int, modulus: int, offset=0x7F4A7C15) -> int:
+        """a bijection of 0..modulus-1 (modulus is a power of two), so consecutive numbers get unrelated names"""
+        return (number * 0x9E3779B1 + offset) % modulus
+
+    def __titleSource(self, index: int) -> tuple[int, int]:
+        """
+            returns the track whose title track index reuses and the number of steps to it, following a permutation
+            of the track numbers (cycle walking a bijection of the next power of two) to the first track keeping
+            its own title. (index, 0) if there is none close enough to keep every reuse a distinct track.
+        """
+        modulus = 1 << (self.tracks - 1).bit_length()
+        source = index
+        for distance in range(1, min(64, self.artists * self.albums_per_artist)):
+            source = self.__scramble(source, modulus, 0x3C6EF372)
+            while source >= self.tracks:
+                source = self.__scramble(source, modulus, 0x3C6EF372)
+            if source == index:
+                break
+            if self.__uniforms("track", source)[2] >= self.duplicate_title_rate:
+                return source, distance
+        return index, 0
+
+    def title(self, index: int) -> str:
+        """returns the title first given to track number index, distinct for every index"""
+        modulus = len(WORDS) ** self.__titleWords
+        return " ".join(spell(self.__scramble(index, modulus), WORDS, self.__titleWords))
+
+    def artist(self, number: int) -> str:
+        """returns the name of artist number (the popularity rank), distinct for every number"""
+        number = self.__scramble(number, len(FIRST_NAMES) * len(LAST_NAMES) ** self.__nameWords)
+        first = FIRST_NAMES[number % len(FIRST_NAMES)]
+        last = spell(number // len(FIRST_NAMES), LAST_NAMES, self.__nameWords)
+        return " ".join([first] + last)
+
+    def album(self, artist: int, number: int) -> str:
+        """returns the name of album number of an artist, distinct for every artist and number"""
+        modulus = len(WORDS) ** self.__albumWords
+        return " ".join(spell(self.__scramble(artist * self.albums_per_artist + number, modulus, 0x2545F491), WORDS, self.__albumWords))
+
+    def track(self, index: int) -> dict:
+        """returns the track dict of track number index"""
+        u = self.__uniforms("track", index)
+        artist = self.__artistSampler.sample(u[0])
+        album = self.__albumSampler.sample(u[1])
+
+        title = self.title(index)
+        if u[2] < self.duplicate_title_rate:
+            source, distance = self.__titleSource(index)
+            if distance:
+                # the tracks reusing the title of source all have a different distance to it, which
+                # moves them to a different album or artist, so that no two tracks have the same id
+                v = self.__uniforms("track", source)
+                title = self.title(source)
+                rank = self.__albumSampler.sample(v[1]) + distance
+                artist = (self.__artistSampler.sample(v[0]) + rank // self.albums_per_artist) % self.artists
+                album = rank % self.albums_per_artist
+
+        # durations are roughly normal around 3:30, between 0:45 and 15:00
+        z = math.sqrt(-2 * math.log(1 - u[4])) * math.cos(2 * math.pi * u[5])
+        seconds = min(900, max(45, int(210 + 60 * z)))
+
+        additional = []
+        if u[6] < self.additional_artist_rate:
+            for uniform in u[7:9] if u[9] < 0.25 else u[7:8]:
+                featured = self.artist(self.__artistSampler.sample(uniform))
+                if featured != self.artist(artist) and featured not in additional:
+                    additional.append(featured)
+
+        return {
+            "Title": title,
+            "Artist": self.artist(artist),
+            "Additional Artists": additional,
+            "Album": self.album(artist, album),
+            "Duration": f"{seconds // 60:02}:{seconds % 60:02}",
+        }
+
+    def iter_tracks(self):
+        for index in range(self.tracks):
+            yield self.track(index)
+
+    def track_id(self, index: int) -> str:
+        """returns the stable id (Tracks.getId) of track number index"""
+        track = self.track(index)
+        return Tracks.makeId(track["Title"], track["Artist"], track["Album"])
+
+    def pick_tracks(self, kind: str, number: int, size: int) -> list[int]:
+        """returns size track numbers picked at random (with repeats) for playlist or queue number"""
+        picked = []
+        for block in range(0, size, 12):
+            picked.extend(int(u * self.tracks) for u in self.__uniforms(f"{kind}-{number}", block)[:size - block])
+        return picked
+
+    def playlist(self, number: int, mean_size: int) -> dict:
+        """returns playlist number as stored by Playlist.save_playlist, of 1 to 2 * mean_size tracks"""
+        size = 1 + int(self.__uniforms("playlist-size", number)[0] * 2 * mean_size)
+        ids, seconds = [], 0
+        for index in dict.fromkeys(self.pick_tracks("playlist", number, size)):
+            track = self.track(index)
+            minutes, secs = map(int, track["Duration"].split(":"))
+            seconds += minutes * 60 + secs
+            ids.append(Tracks.makeId(track["Title"], track["Artist"], track["Album"]))
+        return {
+            "Playlist Name": f"Playlist {number + 1}",
+            "Total Duration": f"{seconds // 60} min {seconds % 60} sec",
+            "Track IDs": ids,
+        }
+
+    def write_library(self, filename):
+        """Writes MusicLibrary.json one track at a time."""
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write("[")
+            for index, track in enumerate(self.iter_tracks()):
+                f.write(("\n    " if index == 0 else ",\n    ") + json.dumps(track))
+            f.write("\n]\n")
+
+    def write_playlists(self, filename, count: int, mean_size: int):
+        """Writes Playlist.json (playlist name -> playlist) one playlist at a time."""
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write("{")
+            for number in range(count):
+                playlist = self.playlist(number, mean_size)
+                f.write(("\n    " if number == 0 else ",\n    ")
+                        + f"{json.dumps(playlist['Playlist Name'])}: {json.dumps(playlist)}")
+            f.write("\n}\n")
+
+    def write_queue(self, filename, size: int):
+        """Writes QueueState.json with size tracks, the track ids are written one at a time."""
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write('{\n    "Track IDs": [')
+            for position, index in enumerate(self.pick_tracks("queue", 0, size)):
+                f.write(("" if position == 0 else ", ") + json.dumps(self.track_id(index)))
+            f.write('],\n    "current_index": 0,\n    "is_repeat": false,\n    "is_shuffled": false,\n    "seq": 0\n}\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes a seeded synthetic MusicLibrary.json, Playlist.json and QueueState.json.")
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--artists", type=int, help="number of artists, defaults to one per 10 tracks")
+    parser.add_argument("--albums-per-artist", type=int, default=8)
+    parser.add_argument("--zipf-exponent", type=float, default=1.1, help="popularity skew of artists and albums")
+    parser.add_argument("--additional-artist-rate", type=float, default=0.1)
+    parser.add_argument("--duplicate-title-rate", type=float, default=0.05)
+    parser.add_argument("--playlists", type=int, default=20)
+    parser.add_argument("--playlist-size", type=int, default=50, help="mean number of tracks per playlist")
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--output-dir", default=".", help="directory the files are written to")
+    args = parser.parse_args(argv)
+
+    generator = CatalogGenerator(
+        args.tracks, args.seed, args.artists, args.albums_per_artist, args.zipf_exponent,
+        args.additional_artist_rate, args.duplicate_title_rate
+    )
+    os.makedirs(args.output_dir, exist_ok=True)
+    generator.write_library(os.path.join(args.output_dir, "MusicLibrary.json"))
+    generator.write_playlists(os.path.join(args.output_dir, "Playlist.json"), args.playlists, args.playlist_size)
+    generator.write_queue(os.path.join(args.output_dir, "QueueState.json"), args.queue_size)
+    print(f"Wrote {args.tracks} tracks, {args.playlists} playlists and a queue of {args.queue_size} tracks to {args.output_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
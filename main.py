@@ -1,9 +1,69 @@
 from MusicLibrary import MusicLibrary
+from MappedLibrary import MappedLibrary
 from Playlist import Playlist
 from queuesC import Queue
 from Tracks import Tracks
-import json
+from WriteBehind import WriteError
+import Stats
+import os
 
+try:
+    import readline
+except ImportError:
+    # readline is not available on every platform, title completion is simply disabled there
+    readline = None
+
+
+def inputTrackTitle(library, prompt: str) -> str:
+    """
+    Asks for a track title. When readline is available, pressing Tab completes
+    the title from the library using a prefix search.
+    """
+    if readline is None:
+        return input(prompt)
+
+    matches = []
+
+    def completer(text, state):
+        if state == 0:
+            tracks = library.search_prefix(text, 20, fields=("title",))
+            matches[:] = list(dict.fromkeys(track.getTitle() for track in tracks))
+        return matches[state] if state < len(matches) else None
+
+    previous_completer = readline.get_completer()
+    previous_delims = readline.get_completer_delims()
+    readline.set_completer(completer)
+    readline.set_completer_delims("")
+    readline.parse_and_bind("tab: complete")
+    try:
+        return input(prompt)
+    finally:
+        readline.set_completer(previous_completer)
+        readline.set_completer_delims(previous_delims)
+
+def findTrackByTitle(library, prompt: str) -> list[Tracks]:
+    """
+    Asks for a track title and returns the tracks with that exact title.
+    If there are none, similar titles from a fuzzy search are offered and the chosen track is returned.
+    """
+    title = inputTrackTitle(library, prompt)
+    tracks = library.getTrackWithTitle(title)
+    if tracks:
+        return tracks
+
+    suggestions = library.search_fuzzy(title, 5)
+    if not suggestions:
+        return []
+
+    print(f"No exact match for '{title}'. Did you mean:")
+    for idx, track in enumerate(suggestions, start=1):
+        print(f"[{idx}] {track.getTitle()} - {track.getArtist()} ({track.getAlbumName()})")
+    print("[0] None of these")
+    try:
+        choice = int(input("Select a track: "))
+    except ValueError:
+        return []
+    return [suggestions[choice - 1]] if 1 <= choice <= len(suggestions) else []
 
 def validate_duration(duration: str) -> bool:
     """
@@ -44,7 +104,9 @@ MENUS = {
         3: "Add Track to Music Library",
         4: "Manage Playlists",
         5: "Manage Queue",
-        6: "Exit"
+        6: "Import Tracks from File",
+        7: "Exit",
+        0: "Stats"
     },
     "playlist": {
         1: "Create Playlist",
@@ -52,7 +114,8 @@ MENUS = {
         3: "Delete Playlist",
         4: "Add Track to Playlist",
         5: "Remove Track from Playlist",
-        6: "Back to Main Menu"
+        6: "Add Multiple Tracks to Playlist",
+        7: "Back to Main Menu"
     },
     "queue": {
         1: "Add Track to Queue",
@@ -62,26 +125,76 @@ MENUS = {
         5: "Next Track",
         6: "Previous Track",
         7: "View Queue",
-        8: "Save and Exit Queue"
+        8: "Play Track Next",
+        9: "Remove Current Track",
+        10: "Jump to Position",
+        11: "Remove Track at Position",
+        12: "Move Track",
+        13: "Insert Track at Position",
+        14: "Save and Exit Queue"
     }
 }
 
+# entries that work when chosen but are not listed
+HIDDEN_MENU_ENTRIES = {"Stats"}
+
 def showMenu(menu_name):
     """
     Displays the menu based on the provided name.
     """
     print("\n<----- Menu ----->")
     for key, value in MENUS[menu_name].items():
+        if value in HIDDEN_MENU_ENTRIES:
+            continue
         print(f"[{key}] {value}")
 
+def openLibrary():
+    """
+    Opens the music library. MUSIC_LIBRARY=mapped selects the memory-mapped track file (see MappedLibrary.py)
+    for catalogs too large to keep in memory, otherwise the library is loaded in the background.
+    """
+    if os.environ.get("MUSIC_LIBRARY", "").lower() == "mapped":
+        return MappedLibrary()
+    return MusicLibrary(lazy=True)
+
+def showLoadingProgress(library, queue):
+    """
+    Shows how far the background load of the library has got, nothing once the library and the queue are ready.
+    """
+    if not library.isLoaded():
+        print(f"\n(Loading music library: {library.getLoadedCount():,} tracks read so far)")
+    elif not queue.is_restored():
+        print("\n(Restoring queue)")
+
+def waitForLibrary(library):
+    """
+    Waits for the background load of the library before an operation that needs its tracks, showing the progress.
+    """
+    if library.isLoaded():
+        return
+    while not library.waitUntilLoaded(0.5):
+        print(f"\rLoading music library... {library.getLoadedCount():,} tracks read", end="", flush=True)
+    print(f"\rMusic library loaded, {library.getLoadedCount():,} tracks read.")
+
+def waitForQueue(queue, library):
+    """
+    Waits for the queue, which is restored in the background once the library has loaded.
+    """
+    waitForLibrary(library)
+    queue.wait_until_restored()
+
 def mainMenu():
     """
     Entry point for the program: displays the main menu.
     """
-    library = MusicLibrary()
-    queue = Queue()
+    library = openLibrary()
+    queue = Queue(library.getStorage())
+    # picks up the queue of the last session, including changes made after it was last saved,
+    # as soon as the library has loaded. The menu is usable meanwhile.
+    queue.load_queue_in_background(library)
 
     while True:
+        showLoadingProgress(library, queue)
         showMenu("main")
         try:
             choice = int(input("Select Operation: "))
@@ -89,21 +202,68 @@ def mainMenu():
             print("Invalid input. Please enter a number.")
             continue
 
-        if choice == 1:
-            viewMusicLibrary(library)
-        elif choice == 2:
-            searchTrack(library)
-        elif choice == 3:
-            addTrack(library)
-        elif choice == 4:
-            managePlaylists(library)
-        elif choice == 5:
-            manageQueue(queue, library)
-        elif choice == 6:
+        if choice == 7:
+            try:
+                library.close()
+            except WriteError as e:
+                reportWriteError(e)
             print("Exiting program. Goodbye!")
             break
+
+        # changes are saved in the background, a save that failed is reported by the next one that waits for it
+        try:
+            if choice == 1:
+                waitForLibrary(library)
+                viewMusicLibrary(library)
+            elif choice == 2:
+                waitForLibrary(library)
+                searchTrack(library)
+            elif choice == 3:
+                addTrack(library)
+            elif choice == 4:
+                managePlaylists(library)
+            elif choice == 5:
+                manageQueue(queue, library)
+            elif choice == 6:
+                waitForLibrary(library)
+                importTracks(library)
+            elif choice == 0:
+                showStats()
+            else:
+                print("Invalid option. Please try again.")
+        except WriteError as e:
+            reportWriteError(e)
+
+def reportWriteError(error):
+    """
+    Tells the user that a change made earlier could not be saved, the program carries on.
+    """
+    print(f"\nSaving failed: {error.__cause__ or error}. The latest changes may not have been stored.")
+
+def showStats():
+    """
+    Shows the timings, call counts and bytes read/written recorded by the instrumentation (see Stats.py).
+    Recording is off unless MUSIC_STATS=1 is set or it is switched on here.
+    """
+    while True:
+        print("\n<----- Stats ----->")
+        print(f"Recording: {'On' if Stats.is_enabled() else 'Off'}")
+        print(Stats.report())
+        print("\n[1] Switch Recording On/Off  [2] Export to JSON  [3] Reset  [4] Back")
+        option = input("Select option: ").strip()
+        if option == "1":
+            if Stats.is_enabled():
+                Stats.disable()
+            else:
+                Stats.enable()
+        elif option == "2":
+            filename = input("Enter file name (default stats.json): ").strip() or "stats.json"
+            Stats.export(filename)
+            print(f"Stats written to {filename}.")
+        elif option == "3":
+            Stats.reset()
         else:
-            print("Invalid option. Please try again.")
+            break
 
 def viewMusicLibrary(library):
     print("\n<----- Music Library ----->")
@@ -114,36 +274,109 @@ def viewMusicLibrary(library):
             print(track)
 
 def searchTrack(library):
-    title = input("Enter track title to search: ")
-    results = library.getTrackWithTitle(title)
+    print("\nSearch by: [1] Title  [2] Artist  [3] Album  [4] Title (typo tolerant)  [5] All fields (ranked)")
+    mode = input("Select search type (default 1): ").strip() or "1"
+    if mode == "5":
+        searchAllFields(library)
+        return
+    elif mode == "2":
+        query = input("Enter artist name to search: ")
+        results = library.getTrackWithArtist(query)
+    elif mode == "3":
+        query = input("Enter album name to search: ")
+        results = library.getTrackWithAlbum(query)
+    elif mode == "4":
+        query = input("Enter track title to search: ")
+        results = library.search_fuzzy(query, 10)
+    else:
+        query = inputTrackTitle(library, "Enter track title to search (Tab to complete): ")
+        results = library.getTrackWithTitle(query)
     if not results:
-        print(f"No tracks found for '{title}'.")
+        suggestions = library.search_prefix(query, 10)
+        if suggestions:
+            print(f"\nNo exact match for '{query}'. Tracks starting with '{query}':")
+            for track in suggestions:
+                print(track)
+        else:
+            print(f"No tracks found for '{query}'.")
     else:
         print("\nSearch Results:")
         for track in results:
             print(track)
 
+def searchAllFields(library, items_per_page=10):
+    """
+    Ranked search for words in the title, artists and album, shown page by page.
+    """
+    query = input("Enter words to search (title, artist or album): ")
+    page = 1
+    while True:
+        results, total = library.search_text(query, page, items_per_page)
+        if total == 0:
+            print(f"No tracks found for '{query}'.")
+            return
+
+        total_pages = (total + items_per_page - 1) // items_per_page
+        print(f"\nSearch Results ({total} found):")
+        for idx, track in enumerate(results, start=(page - 1) * items_per_page + 1):
+            print(f"[{idx}] {track.getTitle()} – {track.getArtist()} ({track.getAlbumName()}, {track.getDuration()})")
+        print(f"\n<Page {page} of {total_pages}>")
+        print("[11] Previous Page")
+        print("[12] Next Page")
+        print("[0] Back")
+
+        try:
+            choice = int(input("Select an option: "))
+        except ValueError:
+            print("Invalid input. Please enter a number.")
+            continue
+
+        if choice == 0:
+            return
+        elif choice == 11 and page > 1:
+            page -= 1
+        elif choice == 12 and page < total_pages:
+            page += 1
+        else:
+            print("Invalid option. Please try again.")
+
 def addTrack(library):
     track = receiveTrackInfo()
-    library.insertTrackToLibrary(track)
-    print("Track added successfully!")
+    loaded = library.isLoaded()
+    if library.insertTrackToLibrary(track):
+        print("Track already exists in the library.")
+    elif not loaded:
+        # it joins the library once loading finishes, unless a stored track turns out to be the same
+        print("The library is still loading, the track will be added once loading has finished unless it is already in the library.")
+    else:
+        print("Track added successfully!")
+
+def importTracks(library):
+    path = input("Enter path of the file to import (.json, .jsonl or .csv): ").strip()
+    try:
+        report = library.import_file(path)
+    except FileNotFoundError:
+        print(f"File '{path}' not found.")
+    except (ValueError, UnicodeDecodeError) as e:
+        print(f"Could not import '{path}': {e}")
+    else:
+        print(f"Imported {report['inserted']} track(s), "
+              f"skipped {report['duplicates']} duplicate(s), "
+              f"rejected {report['rejected']} invalid track(s).")
 
 
-def display_playlist_details(playlist_data):
+def display_playlist_details(playlist):
     """
     Displays the details of a selected playlist.
 
     Args:
-        playlist_data (dict): Details of the playlist, including tracks, total duration, etc.
+        playlist (Playlist): The playlist, with its tracks resolved from the library.
     """
-    print(f"\nPlaylist Name: {playlist_data['Playlist Name']}")
-    print(f"Total Duration: {playlist_data['Total Duration']}")
+    print(f"\nPlaylist Name: {playlist.name}")
+    print(f"Total Duration: {playlist.get_total_duration()}")
     print("Tracks:")
-    for track in playlist_data["Tracks"]:
-        title = track["Title"]
-        artist = track["Artist"]
-        duration = track["Duration"]
-        print(f"    {title} – {artist} ({duration})")
+    for track in playlist.tracks:
+        print(f"    {track.getTitle()} – {track.getArtist()} ({track.getDuration()})")
     print("\n")
 
 def display_playlists_with_pagination(playlists, page=1, items_per_page=10):
@@ -177,6 +410,24 @@ def display_playlists_with_pagination(playlists, page=1, items_per_page=10):
 
     return page, total_pages  # Return current state to handle navigation
 
+def selectMultipleTracks(library) -> list[Tracks]:
+    """
+    Asks which group of library tracks to use: a whole album, everything by an artist
+    or all results of a ranked search.
+    """
+    print("\nAdd: [1] All tracks of an album  [2] All tracks of an artist  [3] All results of a search")
+    mode = input("Select an option: ").strip()
+    if mode == "1":
+        return library.getTrackWithAlbum(input("Enter album name: "))
+    elif mode == "2":
+        return library.getTrackWithArtist(input("Enter artist name: "))
+    elif mode == "3":
+        query = input("Enter words to search (title, artist or album): ")
+        _, total = library.search_text(query, 1, 1)
+        return library.search_text(query, 1, total)[0] if total else []
+    print("Invalid option.")
+    return []
+
 def managePlaylists(library):
     while True:
         showMenu("playlist")
@@ -184,7 +435,7 @@ def managePlaylists(library):
 
         if choice == 1:
             name = input("Enter playlist name: ")
-            if Playlist.load_playlist(name):
+            if name in library.getStorage().get_playlist_names():
                 print("Playlist with this name already exists.")
             else:
                 playlist = Playlist(name)
@@ -195,16 +446,11 @@ def managePlaylists(library):
             """
             Handles playlist management with pagination and details display functionality.
             """
-            try:
-                with open("Playlist.json", "r") as f:
-                    data = json.load(f)  # Load JSON data
-                playlists = list(data.keys())  # Extract playlist names
-            except FileNotFoundError:
+            storage = library.getStorage()
+            playlists = storage.get_playlist_names()
+            if not playlists:
                 print("No playlists found.")
                 return
-            except json.JSONDecodeError:
-                print("Error decoding Playlist.json file.")
-                return
 
             page = 1
             while True:
@@ -241,31 +487,24 @@ def managePlaylists(library):
                     selected_playlist = playlists[choice - 1]
 
                     # Display details of the selected playlist
-                    display_playlist_details(data[selected_playlist])
+                    waitForLibrary(library)
+                    display_playlist_details(Playlist.load_playlist(selected_playlist, library, storage))
                 else:
                     print("Invalid option. Please try again.")
 
         elif choice == 3:
             name = input("Enter playlist name to delete: ")
-            try:
-                with open("Playlist.json", "r") as f:
-                    data = json.load(f)
-                if name in data:
-                    del data[name]
-                    with open("Playlist.json", "w") as f:
-                        json.dump(data, f, indent=4)
-                    print(f"Playlist '{name}' deleted successfully!")
-                else:
-                    print("Playlist not found.")
-            except FileNotFoundError:
-                print("No playlists available.")
+            if library.getStorage().delete_playlist(name):
+                print(f"Playlist '{name}' deleted successfully!")
+            else:
+                print("Playlist not found.")
 
         elif choice == 4:
             name = input("Enter playlist name: ")
-            playlist = Playlist.load_playlist(name)
-            if playlist:
-                title = input("Enter track title to add: ")
-                track = library.getTrackWithTitle(title)
+            waitForLibrary(library)
+            playlist = Playlist.load_playlist(name, library)
+            if playlist is not None:
+                track = findTrackByTitle(library, "Enter track title to add: ")
                 if track:
                     playlist.add_track(track[0])  # Add the first match
                     print("Track added to playlist!")
@@ -276,10 +515,10 @@ def managePlaylists(library):
 
         elif choice == 5:
             name = input("Enter playlist name: ")
-            playlist = Playlist.load_playlist(name)
-            if playlist:
-                title = input("Enter track title to remove: ")
-                track = library.getTrackWithTitle(title)
+            waitForLibrary(library)
+            playlist = Playlist.load_playlist(name, library)
+            if playlist is not None:
+                track = findTrackByTitle(library, "Enter track title to remove: ")
                 if track:
                     playlist.remove_track(track[0])
                     print("Track removed from playlist!")
@@ -289,18 +528,47 @@ def managePlaylists(library):
                 print("Playlist not found.")
 
         elif choice == 6:
+            name = input("Enter playlist name: ")
+            waitForLibrary(library)
+            playlist = Playlist.load_playlist(name, library)
+            if playlist is not None:
+                tracks = selectMultipleTracks(library)
+                if tracks:
+                    added = playlist.add_tracks(tracks)
+                    print(f"{added} track(s) added to playlist, {len(tracks) - added} already in it.")
+                else:
+                    print("No tracks found in library.")
+            else:
+                print("Playlist not found.")
+
+        elif choice == 7:
             break
         else:
             print("Invalid option. Please try again.")
 
+def inputQueuePosition(queue, prompt: str, allow_end=False):
+    """
+    Asks for a position in the queue, as numbered by View Queue.
+    Returns:
+        int: the 0 based position, or None if the input is not a valid position.
+    """
+    try:
+        position = int(input(prompt))
+    except ValueError:
+        return None
+    last = len(queue.tracks) + 1 if allow_end else len(queue.tracks)
+    return position - 1 if 1 <= position <= last else None
+
 def manageQueue(queue, library):
     while True:
         showMenu("queue")
         choice = int(input("Select Operation: "))
+        # shuffle and repeat can be toggled before the queue is restored, they are applied after it
+        if choice not in (3, 4):
+            waitForQueue(queue, library)
 
         if choice == 1:
-            title = input("Enter track title to add: ")
-            track = library.getTrackWithTitle(title)
+            track = findTrackByTitle(library, "Enter track title to add: ")
             if track:
                 queue.enqueue(track[0])
                 print("Track added to queue!")
@@ -309,8 +577,8 @@ def manageQueue(queue, library):
 
         elif choice == 2:
             name = input("Enter playlist name to add: ")
-            playlist = Playlist.load_playlist(name)
-            if playlist:
+            playlist = Playlist.load_playlist(name, library)
+            if playlist is not None:
                 queue.enqueue_playlist(playlist)
                 print(f"Playlist '{name}' added to queue!")
             else:
@@ -339,9 +607,62 @@ def manageQueue(queue, library):
                 print("Start of queue.")
 
         elif choice == 7:
-            queue.display_queue()
+            # open the page with the current track, positions are numbered for the options below
+            queue.display_queue(queue.current_index // 10 + 1)
 
         elif choice == 8:
+            track = findTrackByTitle(library, "Enter track title to play next: ")
+            if track:
+                queue.enqueue_next(track[0])
+                print("Track will play next!")
+            else:
+                print("Track not found in library.")
+
+        elif choice == 9:
+            removed = queue.current_track()
+            if removed is not None:
+                queue.dequeue()
+                print(f"Removed '{removed.getTitle()}' from queue.")
+            else:
+                print("Queue is empty.")
+
+        elif choice == 10:
+            position = inputQueuePosition(queue, "Enter position to jump to: ")
+            if position is not None:
+                print(f"Now playing: {queue.jump_to(position)}")
+            else:
+                print("Invalid position.")
+
+        elif choice == 11:
+            position = inputQueuePosition(queue, "Enter position to remove: ")
+            if position is not None:
+                removed = queue.remove_at(position)
+                print(f"Removed '{removed.getTitle()}' from queue.")
+            else:
+                print("Invalid position.")
+
+        elif choice == 12:
+            source = inputQueuePosition(queue, "Enter position of the track to move: ")
+            target = inputQueuePosition(queue, "Enter new position: ") if source is not None else None
+            if target is not None:
+                queue.move(source, target)
+                print(f"Moved track to position {target + 1}.")
+            else:
+                print("Invalid position.")
+
+        elif choice == 13:
+            track = findTrackByTitle(library, "Enter track title to insert: ")
+            if track:
+                position = inputQueuePosition(queue, "Enter position to insert at: ", allow_end=True)
+                if position is not None:
+                    queue.insert_at(position, track[0])
+                    print(f"Track inserted at position {position + 1}.")
+                else:
+                    print("Invalid position.")
+            else:
+                print("Track not found in library.")
+
+        elif choice == 14:
             queue.save_queue()
             print("Queue saved. Exiting queue management.")
             break
@@ -1,88 +1,320 @@
 from Playlist import Playlist
 from Tracks import Tracks
+from Storage import Storage, default_storage
+from BlockList import BlockList
+from ShuffleOrder import ShuffleOrder
+import Stats
+from contextlib import contextmanager
+import functools
 import random
-import json
+import threading
 
+def requiresRestore(method):
+    """
+        Makes a Queue method wait until a background restore (see load_queue_in_background) has finished.
+        The restore itself calls these methods to replay the logged changes, it does not wait for itself.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if threading.current_thread() is not self._restore_thread:
+            self.wait_until_restored()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+@Stats.instrumented
 class Queue:
-    def __init__(self):
-        self.tracks = []
+    def __init__(self, storage: Storage = None):
+        self.storage = storage if storage is not None else default_storage()
+        # blocks of tracks: appending, removing and inserting near the cursor never shift the whole queue
+        self.tracks = BlockList()
         self.current_index = 0
         self.is_repeat = False
         self.is_shuffled = False
-        self.original_order = []  # To preserve the original order when shuffling
+        # while shuffled, tracks keeps the original order and current_index is a place in this play order
+        self.shuffle_order = None
+        self.total_seconds = 0
+        # every change is appended to the storage's queue log, numbered so that replaying skips
+        # the changes already part of the saved snapshot
+        self.change_seq = 0
+        self._recording = True
+        # set while no background restore is running, see load_queue_in_background
+        self._restored = threading.Event()
+        self._restored.set()
+        self._restore_lock = threading.Lock()
+        self._restore_thread = None
+        self._deferred = []  # (method, args) called while restoring, made once the restore is done
+
+    @contextmanager
+    def _change(self, change: dict):
+        """
+            Records the change made inside the with block in the queue log once it succeeded.
+            While shuffled, the number of places drawn before the change is kept with it, so that
+            replaying draws exactly the same shuffled order.
+        """
+        if self.shuffle_order is not None:
+            change["drawn"] = self.shuffle_order.getDrawnCount()
+        yield change
+        if self._recording:
+            self.change_seq += 1
+            change["seq"] = self.change_seq
+            self.storage.append_queue_change(change)
+            if self.storage.needs_queue_compaction():
+                self.save_queue()
+
+    def _apply(self, change: dict, library):
+        """Replays one change read from the queue log."""
+        if self.shuffle_order is not None and change.get("drawn"):
+            self.shuffle_order[min(change["drawn"], len(self.tracks)) - 1]
+
+        op = change["op"]
+        if op == "enqueue":
+            for track in library.resolveTracks(change["ids"]):
+                self._append(track)
+        elif op == "enqueue_next":
+            for track in library.resolveTracks([change["id"]]):
+                self.enqueue_next(track)
+        elif op == "dequeue":
+            self.dequeue()
+        elif op == "remove_at":
+            self.remove_at(change["index"])
+        elif op == "insert_at":
+            for track in library.resolveTracks([change["id"]]):
+                self.insert_at(change["index"], track)
+        elif op == "move":
+            self.move(change["source"], change["target"])
+        elif op == "cursor":
+            self.current_index = max(0, min(change["index"], len(self.tracks) - 1))
+        elif op == "repeat":
+            self.toggle_repeat()
+        elif op == "shuffle":
+            self.shuffle_queue(change.get("seed"))
 
+    @requiresRestore
+    def current_track(self):
+        """Returns the track at the cursor, or None if the queue is empty."""
+        return self._track_at(self.current_index) if self.tracks else None
+
+    def _track_at(self, place: int) -> Tracks:
+        """Returns the track played at the given place, following the shuffled order when shuffled."""
+        if self.shuffle_order is not None:
+            return self.tracks[self.shuffle_order[place]]
+        return self.tracks[place]
+
+    def _append(self, track: Tracks):
+        self.tracks.append(track)
+        self.total_seconds += track.getDurationSeconds()
+        if self.shuffle_order is not None:
+            self.shuffle_order.append()
+
+    @Stats.measured
+    @requiresRestore
     def enqueue(self, track: Tracks):
         """Adds a track to the queue."""
-        self.tracks.append(track)
-        if not self.is_shuffled:
-            self.original_order.append(track)
+        with self._change({"op": "enqueue", "ids": [track.getId()]}):
+            self._append(track)
+
+    @Stats.measured
+    @requiresRestore
+    def enqueue_next(self, track: Tracks):
+        """
+            Adds a track right after the current track, so it plays next.
+            While shuffled it is added at the end of the original order, like insert_at.
+        """
+        with self._change({"op": "enqueue_next", "id": track.getId()}):
+            self.__insert_next(track)
+
+    def __insert_next(self, track: Tracks):
+        if self.shuffle_order is not None and self.tracks:
+            self.tracks.append(track)
+            self.shuffle_order.insert(self.current_index + 1)
+        else:
+            position = self.current_index + 1 if self.tracks else 0
+            self.tracks.insert(position, track)
+            if self.shuffle_order is not None:
+                self.shuffle_order.append()
+        self.total_seconds += track.getDurationSeconds()
 
+    @Stats.measured
+    @requiresRestore
     def enqueue_playlist(self, playlist: Playlist):
         """Adds all tracks from a playlist to the queue."""
-        for track in playlist.tracks:
-            self.enqueue(track)
+        tracks = list(playlist.tracks)
+        with self._change({"op": "enqueue", "ids": [track.getId() for track in tracks]}):
+            for track in tracks:
+                self._append(track)
 
+    @Stats.measured
+    @requiresRestore
     def dequeue(self):
         """Removes the current track from the queue."""
-        if self.tracks:
-            self.tracks.pop(self.current_index)
-            self.original_order = self.tracks.copy()
-            self.current_index = min(self.current_index, len(self.tracks) - 1)
+        if not self.tracks:
+            return
+        with self._change({"op": "dequeue"}):
+            self.__remove(self.current_index)
+
+    def __check_index(self, index: int, size: int):
+        if not 0 <= index < size:
+            raise IndexError("Queue index out of range")
+
+    def __remove(self, index: int) -> Tracks:
+        """Removes the track at the given place of the play order, keeping the cursor on the same track when it stays."""
+        if self.shuffle_order is not None:
+            position = self.shuffle_order.pop(index)
+        else:
+            position = index
+        track = self.tracks.pop(position)
+        self.total_seconds -= track.getDurationSeconds()
+        if index < self.current_index:
+            self.current_index -= 1
+        self.current_index = max(0, min(self.current_index, len(self.tracks) - 1))
+        return track
+
+    @Stats.measured
+    @requiresRestore
+    def jump_to(self, index: int) -> Tracks:
+        """
+            Moves the cursor to the track at the given place (0 based) of the queue and returns it.
+            O(log n), except that while shuffled the places up to it that were not played yet are drawn first.
+        """
+        self.__check_index(index, len(self.tracks))
+        return self._move_to(index)
+
+    @Stats.measured
+    @requiresRestore
+    def remove_at(self, index: int) -> Tracks:
+        """
+            Removes and returns the track at the given place (0 based) of the queue.
+            O(log n + BlockList.BLOCK_SIZE), shuffled or not (plus drawing the places up to it while shuffled).
+        """
+        self.__check_index(index, len(self.tracks))
+        with self._change({"op": "remove_at", "index": index}):
+            return self.__remove(index)
+
+    @Stats.measured
+    @requiresRestore
+    def insert_at(self, index: int, track: Tracks):
+        """
+            Inserts a track before the given place (0 based) of the queue, or at the end if the place is past it.
+            While shuffled it is placed in the shuffled order and added at the end of the original order.
+            O(log n + BlockList.BLOCK_SIZE), shuffled or not (plus drawing the places up to it while shuffled).
+        """
+        index = max(0, min(index, len(self.tracks)))
+        with self._change({"op": "insert_at", "index": index, "id": track.getId()}):
+            if self.shuffle_order is not None:
+                self.tracks.append(track)
+                self.shuffle_order.insert(index)
+            else:
+                self.tracks.insert(index, track)
+            self.total_seconds += track.getDurationSeconds()
+            if index <= self.current_index and len(self.tracks) > 1:
+                self.current_index += 1
+
+    @Stats.measured
+    @requiresRestore
+    def move(self, source: int, target: int):
+        """
+            Moves the track at place source of the queue to place target (both 0 based), the cursor follows its track.
+            O(log n + BlockList.BLOCK_SIZE), shuffled or not (plus drawing the places up to them while shuffled).
+        """
+        self.__check_index(source, len(self.tracks))
+        self.__check_index(target, len(self.tracks))
+        with self._change({"op": "move", "source": source, "target": target}):
+            if self.shuffle_order is not None:
+                self.shuffle_order.move(source, target)
+            else:
+                self.tracks.insert(target, self.tracks.pop(source))
+
+            if self.current_index == source:
+                self.current_index = target
+            elif source < self.current_index <= target:
+                self.current_index -= 1
+            elif target <= self.current_index < source:
+                self.current_index += 1
+
+    def get_total_duration(self):
+        """Return the total duration of the queue in 'mm:ss' format."""
+        minutes, seconds = divmod(self.total_seconds, 60)
+        return f"{minutes:02}:{seconds:02}"
 
     def toggle_repeat(self):
         """Toggles the repeat state."""
-        self.is_repeat = not self.is_repeat
+        if self._defer(self.toggle_repeat, preview=self.__flip_repeat):
+            return
+        with self._change({"op": "repeat"}):
+            self.is_repeat = not self.is_repeat
 
-    def shuffle_queue(self):
-        """Shuffles the queue but preserves the original order."""
+    @Stats.measured
+    def shuffle_queue(self, seed: int = None):
+        """
+            Toggles shuffle. The shuffled order is drawn lazily as the queue is played, starting
+            with the current track; the tracks keep their original order, which unshuffling returns to.
+        """
+        if self._defer(self.shuffle_queue, seed):
+            return
         if not self.is_shuffled:
-            random.shuffle(self.tracks)
-            self.is_shuffled = True
+            seed = seed if seed is not None else random.getrandbits(63)
+            with self._change({"op": "shuffle", "seed": seed}):
+                self.shuffle_order = ShuffleOrder(len(self.tracks), seed, [self.current_index] if self.tracks else ())
+                self.current_index = 0
+                self.is_shuffled = True
         else:
-            self.tracks = self.original_order.copy()
-            self.is_shuffled = False
+            with self._change({"op": "shuffle"}):
+                if self.tracks:
+                    self.current_index = self.shuffle_order[self.current_index]
+                self.shuffle_order = None
+                self.is_shuffled = False
 
+    @Stats.measured
+    @requiresRestore
     def next_track(self):
         """Moves to the next track in the queue."""
         if not self.tracks:
             return None
 
-        self.current_index += 1
-        if self.current_index >= len(self.tracks):
-            if self.is_repeat:
-                self.current_index = 0
-            else:
-                self.current_index -= 1  # Stay at the last track
-                return None
+        index = self.current_index + 1
+        if index >= len(self.tracks):
+            if not self.is_repeat:
+                return None  # Stay at the last track
+            index = 0
 
-        return self.tracks[self.current_index]
+        return self._move_to(index)
 
+    @Stats.measured
+    @requiresRestore
     def previous_track(self):
         """Moves to the previous track in the queue."""
         if not self.tracks:
             return None
 
-        self.current_index -= 1
-        if self.current_index < 0:
-            if self.is_repeat:
-                self.current_index = len(self.tracks) - 1
-            else:
-                self.current_index += 1  # Stay at the first track
-                return None
+        index = self.current_index - 1
+        if index < 0:
+            if not self.is_repeat:
+                return None  # Stay at the first track
+            index = len(self.tracks) - 1
+
+        return self._move_to(index)
 
-        return self.tracks[self.current_index]
+    def _move_to(self, index: int) -> Tracks:
+        with self._change({"op": "cursor", "index": index}):
+            self.current_index = index
+        return self._track_at(index)
 
+    @requiresRestore
     def display_queue(self, page=1, items_per_page=10):
         """Displays the queue with pagination."""
         start = (page - 1) * items_per_page
         end = start + items_per_page
 
-        current_track = self.tracks[self.current_index] if self.tracks else None
-        tracks_to_display = self.tracks[start:end]
+        current_track = self.current_track()
+        if self.shuffle_order is not None:
+            tracks_to_display = [self._track_at(i) for i in range(start, min(end, len(self.tracks)))]
+        else:
+            tracks_to_display = self.tracks[start:end]
 
         print(f"\nQueue (Page {page}):")
         print(f"Repeat: {'On' if self.is_repeat else 'Off'}")
         print(f"Shuffled: {'Yes' if self.is_shuffled else 'No'}")
+        print(f"Total Duration: {self.get_total_duration()}")
         print(f"Currently Playing: {current_track.getTitle() if current_track else 'None'}\n")
 
         for i, track in enumerate(tracks_to_display, start=start + 1):
@@ -90,30 +322,158 @@ class Queue:
 
         print(f"\n<Page {page} of {len(self.tracks) // items_per_page + 1}>")
 
-    def save_queue(self, filename="QueueState.json"):
-        """Saves the current queue to a file."""
-        with open(filename, "w") as f:
-            data = {
-                "tracks": [track.newTrack for track in self.tracks],
-                "current_index": self.current_index,
-                "is_repeat": self.is_repeat,
-                "is_shuffled": self.is_shuffled,
-            }
-            json.dump(data, f, indent=4)
-
-    def load_queue(self, filename="QueueState.json"):
-        """Loads a queue from a file."""
+    @Stats.measured
+    @requiresRestore
+    def save_queue(self):
+        """Saves the current queue to the storage (QueueState.json by default)."""
+        state = {
+            "Track IDs": [track.getId() for track in self.tracks],
+            "current_index": self.current_index,
+            "is_repeat": self.is_repeat,
+            "is_shuffled": self.is_shuffled,
+            "seq": self.change_seq,
+        }
+        if self.shuffle_order is not None:
+            # the seed and the places played so far are enough to reproduce the shuffled order
+            state.update(self.shuffle_order.getState())
+        self.storage.save_queue(state)
+
+    @Stats.measured
+    def load_queue(self, library):
+        """
+            Loads the queue from the storage (QueueState.json by default), resolving track ids against the library,
+            and replays the changes logged after it was saved, so a session that was not saved is recovered too.
+        """
+        if not self._restore(library, self.storage.load_queue(), list(self.storage.load_queue_changes())):
+            print("No saved queue found.")
+
+    def load_queue_in_background(self, library):
+        """
+            Restores the queue like load_queue on a background thread, once the library has finished loading.
+            The stored queue is read on that thread too. The repeat state does not depend on the tracks and is
+            set as soon as it has been read. Until the restore is done, toggle_repeat and shuffle_queue are
+            remembered and made after it, other operations wait for it.
+        """
+        is_repeat = self.is_repeat
+        self._restored.clear()
+        self._restore_thread = threading.Thread(
+            target=self.__restore_later, args=(library, is_repeat), daemon=True)
+        self._restore_thread.start()
+
+    def __restore_later(self, library, is_repeat):
         try:
-            with open(filename, "r") as f:
-                data = json.load(f)
+            data = self.storage.load_queue()
+            changes = list(self.storage.load_queue_changes())
+            seq = data.get("seq", 0) if data is not None else 0
+            repeats = sum(1 for change in changes if change.get("op") == "repeat" and change.get("seq", 0) > seq)
+            with self._restore_lock:
+                # toggles made before the state was read were previewed on top of the state before the restore
+                toggles = sum(1 for method, _ in self._deferred if method == self.toggle_repeat)
+                self.is_repeat = (data is not None and data["is_repeat"]) != ((repeats + toggles) % 2 == 1)
+
+            library.waitUntilLoaded()
+            with self._restore_lock:
+                # the replay makes the repeat toggles again, as do the deferred calls
+                self.is_repeat = is_repeat
+                self._restore(library, data, changes)
+        finally:
+            with self._restore_lock:
+                try:
+                    for method, args in self._deferred:
+                        method(*args)
+                finally:
+                    self._deferred.clear()
+                    self._restored.set()
+
+    def wait_until_restored(self, timeout=None) -> bool:
+        """
+            Blocks until a background restore has finished.
 
-            self.tracks = [Tracks(**track) for track in data["tracks"]]
-            self.original_order = self.tracks.copy()
+            Returns:
+                bool: False if the timeout expired first.
+        """
+        return self._restored.wait(timeout)
+
+    def is_restored(self) -> bool:
+        return self._restored.is_set()
+
+    def _defer(self, method, *args, preview=None) -> bool:
+        """
+            While a background restore is running, remembers a call to make once it is done.
+            preview, if given, shows the effect of the call at once.
+
+            Returns:
+                bool: True if the call was deferred, False if it should be made now.
+        """
+        if self._restored.is_set() or threading.current_thread() is self._restore_thread:
+            return False
+        with self._restore_lock:
+            if self._restored.is_set():
+                return False
+            self._deferred.append((method, args))
+            if preview is not None:
+                preview()
+            return True
+
+    def __flip_repeat(self):
+        self.is_repeat = not self.is_repeat
+
+    def _restore(self, library, data, changes: list) -> bool:
+        """
+            Replaces the queue with a saved state and the changes logged after it.
+
+            Returns:
+                bool: False if nothing was saved.
+        """
+        if data is None:
+            if not changes:
+                return False
+        else:
+            # ids the library no longer has are dropped, the positions after them move up
+            resolved = [library.getTrackWithId(trackId) for trackId in data.get("Track IDs", ())]
+            positions = [position for position, track in enumerate(resolved) if track is not None]
+            moved = len(positions) < len(resolved)
+            newPositions = {old: new for new, old in enumerate(positions)} if moved else None
+            # queues saved before tracks had ids stored the full track dicts
+            tracks = [resolved[position] for position in positions] + library.resolveTracks((), data.get("tracks", ()))
+            self.tracks = BlockList(tracks)
+            self.shuffle_order = None
+            self.total_seconds = sum(track.getDurationSeconds() for track in tracks)
             self.current_index = data["current_index"]
             self.is_repeat = data["is_repeat"]
             self.is_shuffled = data["is_shuffled"]
 
+            if self.is_shuffled and "shuffle_seed" in data:
+                self.shuffle_order = ShuffleOrder.fromState(len(resolved), data)
+
+            if moved:
+                if self.shuffle_order is not None:
+                    # the current place moves up by the dropped tracks played before it, the drawn
+                    # positions are renumbered and the sparse pool is rebuilt from them
+                    drawn = self.shuffle_order.getDrawn()
+                    self.current_index -= sum(1 for index in drawn[:self.current_index] if index not in newPositions)
+                    drawn = [newPositions[index] for index in drawn if index in newPositions]
+                    self.shuffle_order = ShuffleOrder(len(tracks), self.shuffle_order.seed, drawn)
+                else:
+                    self.current_index = sum(1 for position in positions if position < self.current_index)
+            self.current_index = max(0, min(self.current_index, len(tracks) - 1))
+
             if self.is_shuffled:
-                random.shuffle(self.tracks)
-        except FileNotFoundError:
-            print("No saved queue found.")
\ No newline at end of file
+                if self.shuffle_order is None:
+                    # older saves stored the tracks already shuffled, carry on from the current one
+                    self.is_shuffled = False
+                    self._recording = False
+                    self.shuffle_queue()
+                    self._recording = True
+
+        self.change_seq = data.get("seq", 0) if data is not None else 0
+        self._recording = False
+        try:
+            for change in changes:
+                if change.get("seq", 0) > self.change_seq:
+                    self._apply(change, library)
+                    self.change_seq = change["seq"]
+        finally:
+            self._recording = True
+        self.current_index = max(0, min(self.current_index, len(self.tracks) - 1))
+        return True
@@ -0,0 +1,17 @@
+import pytest
+
+from generate_catalog import CatalogGenerator
+
+
+@pytest.mark.parametrize("options, share", [
+    ({"tracks": 20000, "duplicate_title_rate": 0.1}, 0.1),
+    ({"tracks": 2000, "duplicate_title_rate": 0.9, "albums_per_artist": 1}, 0.9),
+    # a title can be shared by only 3 tracks, one per album of the only artist
+    ({"tracks": 200, "artists": 1, "albums_per_artist": 3, "duplicate_title_rate": 0.5}, 0.5 * 0.75),
+])
+def test_duplicate_titles_keep_every_track_distinct(options, share):
+    generator = CatalogGenerator(**options)
+    tracks = [generator.track(index) for index in range(generator.tracks)]
+    assert len({generator.track_id(index) for index in range(generator.tracks)}) == generator.tracks
+    shared = generator.tracks - len({track["Title"] for track in tracks})
+    assert shared == pytest.approx(generator.tracks * share, rel=0.2)
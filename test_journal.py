@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from Journal import Journal
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_torn_last_line_is_skipped_and_trimmed(tmp_path, seed):
+    rng = random.Random(seed)
+    filename = str(tmp_path / "log.jsonl")
+    journal = Journal(filename)
+    records = [{"seq": i, "text": "x" * rng.randrange(50)} for i in range(rng.randrange(1, 60))]
+    journal.extend(records[:len(records) // 2])
+    for record in records[len(records) // 2:]:
+        journal.append(record)
+    journal.close()
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    ends = [end + 1 for end in range(len(data)) if data[end:end + 1] == b"\n"]
+    # a crash can cut the file anywhere, even in the middle of a record
+    cut = rng.randrange(len(data) + 1)
+    with open(filename, "r+b") as f:
+        f.truncate(cut)
+    complete = sum(1 for end in ends if end <= cut)
+
+    journal = Journal(filename)
+    assert list(journal.replay()) == records[:complete]
+    assert journal.getSize() == complete
+    # a small chunk size makes the search for the last newline span several chunks
+    Journal.trimTornLine(filename, chunk_size=rng.randrange(1, 64))
+    with open(filename, "rb") as f:
+        assert f.read() == data[:max([0] + [end for end in ends if end <= cut])]
+
+    journal.append({"seq": "after"})
+    assert list(journal.replay()) == records[:complete] + [{"seq": "after"}]
+    journal.close()
+
+
+def test_replay_from_an_offset(tmp_path):
+    filename = str(tmp_path / "log.jsonl")
+    journal = Journal(filename)
+    journal.extend([{"seq": 1}, {"seq": 2}])
+    size = len(open(filename, "rb").read())
+    journal.append({"seq": 3})
+    assert list(journal.replay(size)) == [{"seq": 3}]
+    journal.close()
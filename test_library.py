@@ -0,0 +1,89 @@
+import json
+import threading
+
+import pytest
+
+from MappedLibrary import MappedLibrary
+from MusicLibrary import MusicLibrary
+from Storage import JsonStorage, SQLiteStorage
+from Tracks import Tracks
+
+AS_IT_WAS = {"Title": "As It Was", "Artist": "Harry Styles", "Additional Artists": [], "Album": "Harry's House", "Duration": "02:47"}
+EDITED_BY_HAND = {"Title": "Edited By Hand", "Artist": "Someone", "Additional Artists": [], "Album": "Album", "Duration": "3:30:00"}
+
+
+@pytest.fixture
+def malformed_library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("MusicLibrary.json", "w") as f:
+        json.dump([AS_IT_WAS, EDITED_BY_HAND], f)
+
+
+def edited_track(library):
+    library.waitUntilLoaded()
+    assert library.getSize() == 2
+    track, = library.getTrackWithTitle("Edited By Hand")
+    return track.getDuration(), track.getDurationSeconds()
+
+
+@pytest.mark.parametrize("reloads", [1, 2])
+def test_malformed_duration_does_not_stop_loading(malformed_library, reloads):
+    # the second load is taken from the library cache written by the first one
+    for _ in range(reloads):
+        library = MusicLibrary(JsonStorage())
+        assert edited_track(library) == ("3:30:00", 0)
+        library.close()
+
+
+def test_malformed_duration_survives_the_sqlite_import(malformed_library):
+    storage = SQLiteStorage()
+    legacy = JsonStorage()
+    storage.import_from(legacy)
+    legacy.close()
+    library = MusicLibrary(storage)
+    assert edited_track(library) == ("3:30:00", 0)
+    library.close()
+
+
+def test_malformed_duration_in_the_mapped_library(malformed_library):
+    library = MappedLibrary(storage=JsonStorage())
+    assert edited_track(library) == ("3:30:00", 0)
+    library.close()
+
+
+def test_malformed_duration_is_still_rejected_on_import(malformed_library):
+    library = MusicLibrary(JsonStorage())
+    report = library.bulk_insert([dict(EDITED_BY_HAND, Title="Imported")])
+    assert report == {"inserted": 0, "duplicates": 0, "rejected": 1}
+    library.close()
+
+
+class SlowCacheStorage(JsonStorage):
+    """packs the library cache only once released"""
+    def __init__(self):
+        super().__init__()
+        self.packing = threading.Event()
+        self.release = threading.Event()
+
+    def save_library_cache(self, payload):
+        def slowPayload():
+            self.packing.set()
+            self.release.wait(5)
+            return payload()
+        super().save_library_cache(slowPayload)
+
+
+def test_insert_does_not_wait_for_the_cache_and_is_not_lost(malformed_library):
+    storage = SlowCacheStorage()
+    library = MusicLibrary(storage, lazy=True)
+    assert storage.packing.wait(5)
+    assert library.isLoaded()
+    # the library is usable while its cache is packed, an insert is neither blocked nor left out
+    assert library.insertTrackToLibrary(Tracks("During The Cache", "Someone", "Album", "01:00")) is None
+    storage.release.set()
+    library.close()
+
+    library = MusicLibrary(JsonStorage())
+    assert [track.getTitle() for track in library.getTrackWithTitle("During The Cache")] == ["During The Cache"]
+    assert library.getSize() == 3
+    library.close()
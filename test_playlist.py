@@ -0,0 +1,108 @@
+import json
+import random
+
+import pytest
+
+from MusicLibrary import MusicLibrary
+from Playlist import Playlist
+from Storage import JsonStorage, SQLiteStorage
+from Tracks import Tracks
+
+AS_IT_WAS = {"Title": "As It Was", "Artist": "Harry Styles", "Additional Artists": [], "Album": "Harry's House", "Duration": "02:47"}
+WATERMELON_SUGAR = {"Title": "Watermelon Sugar", "Artist": "Harry Styles", "Additional Artists": [], "Album": "Fine Line", "Duration": "02:54"}
+NOT_IN_LIBRARY = {"Title": "Not In Library", "Artist": "Nobody", "Additional Artists": [], "Album": "Nowhere", "Duration": "03:00"}
+
+
+@pytest.fixture
+def legacy_files(tmp_path, monkeypatch):
+    """A library and a Playlist.json written before tracks had ids, with a track the library does not have."""
+    monkeypatch.chdir(tmp_path)
+    with open("MusicLibrary.json", "w") as f:
+        json.dump([AS_IT_WAS, WATERMELON_SUGAR], f)
+    with open("Playlist.json", "w") as f:
+        json.dump({"Mix": {"Playlist Name": "Mix", "Total Duration": "5 min 54 sec",
+                           "Tracks": [NOT_IN_LIBRARY, WATERMELON_SUGAR]}}, f)
+
+
+def titles(playlist):
+    return [track.getTitle() for track in playlist.tracks]
+
+
+def add_and_reload(storage_factory):
+    storage = storage_factory()
+    library = MusicLibrary(storage)
+    playlist = Playlist.load_playlist("Mix", library, storage)
+    assert titles(playlist) == ["Not In Library", "Watermelon Sugar"]
+    playlist.add_track(library.getTrackWithId(Tracks.makeId("As It Was", "Harry Styles", "Harry's House")))
+    library.close()
+
+    storage = storage_factory()
+    library = MusicLibrary(storage)
+    playlist = Playlist.load_playlist("Mix", library, storage)
+    library.close()
+    return titles(playlist)
+
+
+def test_legacy_track_not_in_library_survives_a_save(legacy_files):
+    assert add_and_reload(JsonStorage) == ["Not In Library", "Watermelon Sugar", "As It Was"]
+
+
+def test_legacy_track_not_in_library_survives_the_sqlite_import(legacy_files):
+    def storage_factory():
+        storage = SQLiteStorage()
+        legacy = JsonStorage()
+        storage.import_from(legacy)
+        legacy.close()
+        return storage
+
+    assert add_and_reload(storage_factory) == ["Not In Library", "Watermelon Sugar", "As It Was"]
+
+
+class NoStorage:
+    """keeps the last saved playlist instead of writing it"""
+    saved = None
+
+    def save_playlist(self, name, playlist_data):
+        self.saved = playlist_data
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_positional_edits_match_a_plain_list(seed):
+    rng = random.Random(seed)
+    pool = [Tracks(f"Song {i}", f"Artist {i % 7}", f"Album {i % 3}", f"0{i % 10}:{i % 60:02}") for i in range(60)]
+    storage = NoStorage()
+    playlist = Playlist("Random", storage)
+    expected = []
+    for _ in range(500):
+        operation = rng.randrange(5)
+        if operation == 0:
+            track = rng.choice(pool)
+            assert playlist.add_track(track) == (track not in expected)
+            if track not in expected:
+                expected.append(track)
+        elif operation == 1:
+            track = rng.choice(pool)
+            assert playlist.remove_track(track) == (track in expected)
+            if track in expected:
+                expected.remove(track)
+        elif operation == 2:
+            position = rng.randrange(len(expected) + 1)
+            removed = playlist.remove_at(position)
+            assert removed is (expected.pop(position) if position < len(expected) else None)
+        elif operation == 3 and expected:
+            source, target = rng.randrange(len(expected)), rng.randrange(len(expected))
+            assert playlist.move(source, target)
+            expected.insert(target, expected.pop(source))
+        elif operation == 4:
+            # a failed edit session leaves the playlist as it was
+            with pytest.raises(RuntimeError):
+                with playlist.edit():
+                    playlist.remove_at(0)
+                    playlist.move(0, len(playlist) - 1)
+                    raise RuntimeError()
+        assert playlist.tracks == expected
+        assert len(playlist) == len(expected)
+        assert playlist.total_seconds == sum(track.getDurationSeconds() for track in expected)
+        assert all(track in playlist for track in expected)
+    playlist.save_playlist()
+    assert storage.saved["Track IDs"] == [track.getId() for track in expected]
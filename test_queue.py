@@ -0,0 +1,103 @@
+import json
+import random
+import threading
+
+import pytest
+
+from MusicLibrary import MusicLibrary
+from Storage import JsonStorage
+from queuesC import Queue
+
+AS_IT_WAS = {"Title": "As It Was", "Artist": "Harry Styles", "Additional Artists": [], "Album": "Harry's House", "Duration": "02:47"}
+
+
+@pytest.fixture
+def library_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("MusicLibrary.json", "w") as f:
+        json.dump([AS_IT_WAS], f)
+
+
+class RecordingStorage(JsonStorage):
+    """remembers the threads the queue state was read on"""
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def load_queue(self):
+        self.threads.append(threading.current_thread())
+        return super().load_queue()
+
+
+def test_background_restore_reads_the_queue_on_its_thread(library_file):
+    storage = RecordingStorage()
+    library = MusicLibrary(storage)
+    queue = Queue(storage)
+    queue.enqueue(library.getMusicLibrary()[0])
+    queue.toggle_repeat()
+    queue.save_queue()
+
+    restored = Queue(storage)
+    restored.load_queue_in_background(library)
+    assert restored.wait_until_restored(5)
+    assert storage.threads and threading.current_thread() not in storage.threads
+    assert restored.is_repeat
+    assert [track.getTitle() for track in restored.tracks] == ["As It Was"]
+    library.close()
+
+
+def play_order(queue):
+    return [queue._track_at(place).getTitle() for place in range(len(queue.tracks))]
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("background", [False, True])
+def test_replaying_the_change_log_gives_the_same_queue(tmp_path, monkeypatch, seed, background):
+    monkeypatch.chdir(tmp_path)
+    with open("MusicLibrary.json", "w") as f:
+        json.dump([dict(AS_IT_WAS, Title=f"Song {i}", Duration=f"0{i % 10}:{i % 60:02}") for i in range(30)], f)
+    rng = random.Random(seed)
+    storage = JsonStorage()
+    library = MusicLibrary(storage)
+    pool = library.getMusicLibrary()
+    queue = Queue(storage)
+    for _ in range(300):
+        operation = rng.randrange(12)
+        size = len(queue.tracks)
+        if operation == 0:
+            queue.enqueue(rng.choice(pool))
+        elif operation == 1:
+            queue.enqueue_next(rng.choice(pool))
+        elif operation == 2:
+            queue.insert_at(rng.randrange(size + 2), rng.choice(pool))
+        elif operation == 3:
+            queue.dequeue()
+        elif operation == 4 and size:
+            queue.remove_at(rng.randrange(size))
+        elif operation == 5 and size:
+            queue.move(rng.randrange(size), rng.randrange(size))
+        elif operation == 6 and size:
+            queue.jump_to(rng.randrange(size))
+        elif operation == 7:
+            queue.next_track()
+        elif operation == 8:
+            queue.previous_track()
+        elif operation == 9:
+            queue.toggle_repeat()
+        elif operation == 10:
+            queue.shuffle_queue(rng.getrandbits(32))
+        elif rng.randrange(4) == 0:
+            # later changes are replayed on top of the saved state
+            queue.save_queue()
+
+    restored = Queue(storage)
+    if background:
+        restored.load_queue_in_background(library)
+        assert restored.wait_until_restored(5)
+    else:
+        restored.load_queue(library)
+    assert [track.getTitle() for track in restored.tracks] == [track.getTitle() for track in queue.tracks]
+    assert (restored.current_index, restored.is_repeat, restored.is_shuffled, restored.total_seconds, restored.change_seq) == \
+           (queue.current_index, queue.is_repeat, queue.is_shuffled, queue.total_seconds, queue.change_seq)
+    assert play_order(restored) == play_order(queue)
+    library.close()
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from ShuffleOrder import ShuffleOrder
+
+
+def play_order(order):
+    """the whole play order, drawn on a copy restored from the saved state so that order itself is not drawn further"""
+    copy = ShuffleOrder.fromState(len(order), order.getState())
+    return [copy[place] for place in range(len(copy))]
+
+
+def test_same_seed_gives_the_same_order():
+    assert play_order(ShuffleOrder(500, seed=7)) == play_order(ShuffleOrder(500, seed=7))
+    assert sorted(play_order(ShuffleOrder(500, seed=7))) == list(range(500))
+    assert play_order(ShuffleOrder(500, seed=7)) != play_order(ShuffleOrder(500, seed=8))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits_keep_a_consistent_order(seed):
+    rng = random.Random(seed)
+    order = ShuffleOrder(rng.randrange(1, 40), seed=seed)
+    # queue[position] is the item at that queue position, the order is checked on items so that
+    # it can be compared across removals, which move later positions back
+    queue = list(range(len(order)))
+    next_item = len(queue)
+
+    for _ in range(300):
+        before = [queue[position] for position in play_order(order)]
+        drawn = order.getDrawnCount()
+        operation = rng.randrange(6)
+        if operation == 0 and len(order):
+            place = rng.randrange(len(order))
+            assert queue[order[place]] == before[place]
+            after = [queue[position] for position in play_order(order)]
+            assert after == before
+            continue
+        elif operation == 1 and len(order):
+            source, target = rng.randrange(len(order)), rng.randrange(len(order))
+            order.move(source, target)
+            before.insert(target, before.pop(source))
+            expected, stable = before, len(before)
+        elif operation == 2 and len(order):
+            place = rng.randrange(len(order))
+            item = before[place]
+            assert queue.pop(order.pop(place)) == item
+            drawn = max(drawn, place + 1)
+            expected, stable = before[:place] + before[place + 1:drawn], drawn - 1
+        elif operation == 3:
+            place = rng.randrange(len(order) + 1)
+            order.insert(place)
+            queue.append(next_item)
+            drawn = max(drawn, place)
+            expected, stable = before[:place] + [next_item] + before[place:drawn], drawn + 1
+            next_item += 1
+        elif operation == 4:
+            order.append()
+            queue.append(next_item)
+            expected, stable = before[:drawn], drawn
+            next_item += 1
+        else:
+            # saving and loading at any point gives the same order
+            order = ShuffleOrder.fromState(len(order), order.getState())
+            expected, stable = before, len(before)
+
+        after = [queue[position] for position in play_order(order)]
+        assert len(order) == len(queue)
+        assert sorted(after) == sorted(queue)
+        assert after[:stable] == expected[:stable]
+        assert order.getDrawn() == play_order(order)[:order.getDrawnCount()]
@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+from Storage import JsonStorage, SQLiteStorage, WriteBehindStorage
+from Tracks import Tracks
+from WriteBehind import WriteBehind, WriteError
+
+AS_IT_WAS = {"Title": "As It Was", "Artist": "Harry Styles", "Additional Artists": [], "Album": "Harry's House", "Duration": "02:47"}
+
+
+@pytest.fixture
+def library_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("MusicLibrary.json", "w") as f:
+        json.dump([AS_IT_WAS], f)
+
+
+def blocked_write(storage):
+    """schedules a write that does not finish before the returned event is set, or a few seconds have passed"""
+    release = threading.Event()
+    storage.writer.submit(lambda: release.wait(5))
+    return release
+
+
+def test_lookups_the_json_storage_cannot_answer_do_not_wait_for_writes(library_file):
+    storage = WriteBehindStorage(JsonStorage())
+    release = blocked_write(storage)
+    try:
+        assert storage.has_track(Tracks.makeId("As It Was", "Harry Styles", "Harry's House")) is None
+        assert storage.find_tracks(title="As It Was") is None
+        assert storage.writer.has_pending()
+    finally:
+        release.set()
+        storage.close()
+
+
+def test_lookups_the_sqlite_storage_answers_see_pending_writes(library_file):
+    storage = WriteBehindStorage(SQLiteStorage())
+    storage.append_track(AS_IT_WAS)
+    assert storage.has_track(Tracks.makeId("As It Was", "Harry Styles", "Harry's House"))
+    assert [track["Title"] for track in storage.find_tracks(title="As It Was")] == ["As It Was"]
+    storage.close()
+
+
+def test_compaction_snapshot_is_built_on_the_background_thread(library_file):
+    storage = JsonStorage()
+    threads = []
+
+    def snapshot():
+        def tracks():
+            threads.append(threading.current_thread())
+            yield AS_IT_WAS
+        return tracks()
+
+    storage.compact_tracks(snapshot, background=True)
+    assert storage.get_library_stamp() is not None  # waits for the compaction
+    assert threads and threads[0] is not threading.current_thread()
+    assert list(storage.load_tracks()) == [AS_IT_WAS]
+    storage.close()
+
+
+def test_failed_write_is_raised_as_a_write_error_with_its_cause():
+    writer = WriteBehind(delay=0)
+
+    def fail():
+        raise OSError("disk full")
+
+    writer.submit(fail)
+    with pytest.raises(WriteError) as raised:
+        writer.flush()
+    assert isinstance(raised.value.__cause__, OSError)
+    # reported once, the writer goes on
+    writer.submit(lambda: None)
+    writer.flush()
+    writer.close()